@@ -24,6 +24,9 @@ Examples:
   # Process both PDF and video
   python main.py --pdf notes.pdf --video lecture.mp4
   
+  # Reprocess through the batch API
+  python main.py --pdf notes.pdf --batch
+  
   # Specify custom output directory
   python main.py --pdf notes.pdf --output my_study_materials
         """
@@ -53,6 +56,18 @@ Examples:
         help='Path to .env configuration file'
     )
     
+    parser.add_argument(
+        '--no-resume',
+        action='store_true',
+        help='Ignore checkpoints from an earlier run in the output directory'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Submit LLM requests as batch jobs (cheaper, but results take hours)'
+    )
+    
     parser.add_argument(
         '--no-video-audio',
         action='store_true',
@@ -97,7 +112,9 @@ Examples:
         results = automator.process_materials(
             pdf_path=args.pdf,
             video_source=args.video,
-            output_dir=config.output_dir
+            output_dir=config.output_dir,
+            resume=not args.no_resume,
+            batch=args.batch
         )
         
         print("\n" + "="*60)
@@ -116,7 +133,7 @@ Examples:
         print("  2. Study the flashcards for memorization")
         print("  3. Take the quizzes to test your understanding")
         print("  4. Refer to the diagrams for visual learning")
-        
+    
     except Exception as e:
         print(f"\nError: {e}", file=sys.stderr)
         import traceback
@@ -6,7 +6,7 @@ from typing import Dict, List, Optional
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib.patches import FancyBboxPatch, FancyArrowPatch
-from openai import OpenAI
+from ..utils.llm_client import LLMClient
 
 # Display formatting constants
 MAX_DISPLAY_TEXT_LENGTH = 30
@@ -15,8 +15,8 @@ MAX_DISPLAY_TEXT_LENGTH = 30
 class DiagramGenerator:
     """Generates diagrams and visual illustrations for concepts"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", llm: Optional[LLMClient] = None):
+        self.llm = llm or LLMClient(api_key)
         self.model = model
     
     def generate_concept_diagram(self, concept: str, related_concepts: List[str],
@@ -227,6 +227,37 @@ class DiagramGenerator:
         Returns:
             Dictionary with diagram specifications
         """
+        try:
+            return self.llm.complete_json(
+                self.model, self._diagram_spec_messages(concept, diagram_type), temperature=0.7,
+                call_type='diagram_spec'
+            )
+        except Exception as e:
+            print(f"Error generating diagram description: {e}")
+            return {}
+    
+    async def agenerate_diagram_description(self, concept: str, diagram_type: str = "concept_map") -> Dict:
+        """
+        Use AI to determine what should be in a diagram (async)
+        
+        Args:
+            concept: Concept to diagram
+            diagram_type: Type of diagram to create
+            
+        Returns:
+            Dictionary with diagram specifications
+        """
+        try:
+            return await self.llm.acomplete_json(
+                self.model, self._diagram_spec_messages(concept, diagram_type), temperature=0.7,
+                call_type='diagram_spec'
+            )
+        except Exception as e:
+            print(f"Error generating diagram description: {e}")
+            return {}
+    
+    def _diagram_spec_messages(self, concept: str, diagram_type: str) -> List[Dict]:
+        """Build the chat messages for a diagram specification"""
         prompt = f"""Create a specification for a {diagram_type} diagram about: {concept}
 
 Provide:
@@ -236,19 +267,7 @@ Provide:
 4. Suggested layout
 
 Respond in JSON format."""
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating educational diagrams."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
-        except Exception as e:
-            print(f"Error generating diagram description: {e}")
-            return {}
+        return [
+            {"role": "system", "content": "You are an expert at creating educational diagrams."},
+            {"role": "user", "content": prompt}
+        ]
@@ -1,24 +1,68 @@
 """Flashcard Generation Module"""
 import json
 import csv
-from typing import Dict, List
-from openai import OpenAI
-
-# Maximum content length for flashcard generation
-MAX_FLASHCARD_CONTENT_LENGTH = 3000
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from ..utils.batch import in_current_context
+from ..utils.llm_client import LLMClient
+from ..utils.prompts import source_messages
+from ..utils.sharding import allocate, deduplicate
+from ..utils.token_budget import TokenBudget
 
 
 class FlashcardGenerator:
     """Generates flashcards for studying key concepts"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", llm: Optional[LLMClient] = None,
+                 budget: Optional[TokenBudget] = None, shard_size: int = 0):
+        self.llm = llm or LLMClient(api_key)
         self.model = model
+        self.budget = budget or TokenBudget(model)
+        self.shard_size = shard_size
     
     def generate_flashcards(self, content: str, num_cards: int = 20) -> List[Dict]:
         """
         Generate flashcards from content
         
+        With a ``shard_size``, large decks are requested as parallel calls of
+        at most that many cards, each over its own slice of the content, and
+        merged with near-duplicate cards removed.
+        
+        Args:
+            content: Source content
+            num_cards: Number of flashcards to generate
+            
+        Returns:
+            List of flashcard dictionaries
+        """
+        return self.generate_flashcard_set(content, num_cards)['flashcards']
+    
+    def generate_flashcard_set(self, content: str, num_cards: int = 20) -> Dict:
+        """
+        Generate flashcards and report whether every request behind them succeeded
+        
+        Args:
+            content: Source content
+            num_cards: Number of flashcards to generate
+            
+        Returns:
+            Dictionary with the flashcards and ``complete``, which is False
+            when a request (or a shard of a sharded deck) failed and its
+            cards are missing
+        """
+        shards = allocate(num_cards, self.shard_size, self.source_excerpt(content))
+        if len(shards) <= 1:
+            return self._flashcard_set([self._generate_shard(content, num_cards)], num_cards)
+        
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            decks = list(executor.map(in_current_context(lambda shard: self._generate_shard(*shard)), shards))
+        return self._flashcard_set(decks, num_cards)
+    
+    async def agenerate_flashcards(self, content: str, num_cards: int = 20) -> List[Dict]:
+        """
+        Generate flashcards from content (async)
+        
         Args:
             content: Source content
             num_cards: Number of flashcards to generate
@@ -26,7 +70,79 @@ class FlashcardGenerator:
         Returns:
             List of flashcard dictionaries
         """
-        prompt = f"""Create {num_cards} flashcards from the following educational content.
+        return (await self.agenerate_flashcard_set(content, num_cards))['flashcards']
+    
+    async def agenerate_flashcard_set(self, content: str, num_cards: int = 20) -> Dict:
+        """
+        Generate flashcards and report whether every request succeeded (async)
+        
+        Args:
+            content: Source content
+            num_cards: Number of flashcards to generate
+            
+        Returns:
+            Dictionary with the flashcards and ``complete``
+        """
+        shards = allocate(num_cards, self.shard_size, self.source_excerpt(content))
+        if len(shards) <= 1:
+            return self._flashcard_set([await self._agenerate_shard(content, num_cards)], num_cards)
+        
+        decks = await asyncio.gather(*[self._agenerate_shard(*shard) for shard in shards])
+        return self._flashcard_set(decks, num_cards)
+    
+    @classmethod
+    def _flashcard_set(cls, decks: List[Optional[List[Dict]]], num_cards: int) -> Dict:
+        """Combine the decks of each request, None marking a failed one"""
+        complete = all(deck is not None for deck in decks)
+        decks = [deck or [] for deck in decks]
+        flashcards = decks[0] if len(decks) == 1 else cls._merge_flashcards(decks, num_cards)
+        return {'flashcards': flashcards, 'complete': complete}
+    
+    def _generate_shard(self, content: str, num_cards: int) -> Optional[List[Dict]]:
+        """Generate flashcards from content in one call, or get None if it failed"""
+        try:
+            result = self.llm.complete_json(
+                self.model, self._flashcard_messages(content, num_cards), temperature=0.7,
+                call_type='flashcards'
+            )
+            return self._normalize_flashcards(result)
+        except Exception as e:
+            print(f"Error generating flashcards: {e}")
+            return None
+    
+    async def _agenerate_shard(self, content: str, num_cards: int) -> Optional[List[Dict]]:
+        """Generate flashcards from content in one call, or get None if it failed (async)"""
+        try:
+            result = await self.llm.acomplete_json(
+                self.model, self._flashcard_messages(content, num_cards), temperature=0.7,
+                call_type='flashcards'
+            )
+            return self._normalize_flashcards(result)
+        except Exception as e:
+            print(f"Error generating flashcards: {e}")
+            return None
+    
+    @staticmethod
+    def _merge_flashcards(decks: List[List[Dict]], num_cards: int) -> List[Dict]:
+        """Combine sharded decks in order, dropping cards that repeat an earlier question"""
+        cards = [card for deck in decks for card in deck]
+        return deduplicate(cards, lambda card: str(card.get('front', '')))[:num_cards]
+    
+    def source_excerpt(self, content: str) -> str:
+        """
+        Get the part of the content that flashcard prompts draw on
+        
+        Args:
+            content: Source content
+            
+        Returns:
+            Content excerpt sent to the model
+        """
+        return self.budget.fit(content)
+    
+    def _flashcard_messages(self, content: str, num_cards: int) -> List[Dict]:
+        """Build the chat messages for flashcard generation"""
+        task = f"""Create {num_cards} effective study flashcards from the source material.
 
 Each flashcard should have:
 - A clear, concise question on the front
@@ -34,42 +150,49 @@ Each flashcard should have:
 - Optional hints or mnemonics
 - Difficulty level (easy, medium, hard)
 
-Content:
-{content[:MAX_FLASHCARD_CONTENT_LENGTH]}
-
 Respond in JSON format with an array of flashcard objects."""
+        return source_messages(self.source_excerpt(content), task)
+    
+    @staticmethod
+    def _normalize_flashcards(result: Dict) -> List[Dict]:
+        """Extract flashcards from a response and fill in required fields"""
+        flashcards = result.get('flashcards', [])
+        
+        # Ensure each flashcard has required fields
+        for card in flashcards:
+            if 'front' not in card:
+                card['front'] = card.get('question', '')
+            if 'back' not in card:
+                card['back'] = card.get('answer', '')
+            if 'difficulty' not in card:
+                card['difficulty'] = 'medium'
         
+        return flashcards
+    
+    def generate_concept_flashcards(self, concept: str, details: str) -> List[Dict]:
+        """
+        Generate flashcards for a specific concept
+        
+        Args:
+            concept: The concept name
+            details: Details about the concept
+            
+        Returns:
+            List of flashcard dictionaries
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating effective study flashcards."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
+            result = self.llm.complete_json(
+                self.model, self._concept_flashcard_messages(concept, details), temperature=0.7,
+                call_type='concept_flashcards'
             )
-            
-            result = json.loads(response.choices[0].message.content)
-            flashcards = result.get('flashcards', [])
-            
-            # Ensure each flashcard has required fields
-            for card in flashcards:
-                if 'front' not in card:
-                    card['front'] = card.get('question', '')
-                if 'back' not in card:
-                    card['back'] = card.get('answer', '')
-                if 'difficulty' not in card:
-                    card['difficulty'] = 'medium'
-            
-            return flashcards
+            return result.get('flashcards', [])
         except Exception as e:
-            print(f"Error generating flashcards: {e}")
+            print(f"Error generating concept flashcards: {e}")
             return []
     
-    def generate_concept_flashcards(self, concept: str, details: str) -> List[Dict]:
+    async def agenerate_concept_flashcards(self, concept: str, details: str) -> List[Dict]:
         """
-        Generate flashcards for a specific concept
+        Generate flashcards for a specific concept (async)
         
         Args:
             concept: The concept name
@@ -78,12 +201,21 @@ Respond in JSON format with an array of flashcard objects."""
         Returns:
             List of flashcard dictionaries
         """
-        prompt = f"""Create 5 flashcards specifically about: {concept}
-
-Use the following details:
-{details[:MAX_FLASHCARD_CONTENT_LENGTH // 3]}
+        try:
+            result = await self.llm.acomplete_json(
+                self.model, self._concept_flashcard_messages(concept, details), temperature=0.7,
+                call_type='concept_flashcards'
+            )
+            return result.get('flashcards', [])
+        except Exception as e:
+            print(f"Error generating concept flashcards: {e}")
+            return []
+    
+    def _concept_flashcard_messages(self, concept: str, details: str) -> List[Dict]:
+        """Build the chat messages for concept flashcards"""
+        task = f"""Create 5 targeted flashcards specifically about: {concept}
 
-Create cards that cover:
+Use the source material as the details of the concept, and create cards that cover:
 1. Definition
 2. Key characteristics
 3. Applications or examples
@@ -91,23 +223,7 @@ Create cards that cover:
 5. Related concepts
 
 Respond in JSON format with an array of flashcard objects."""
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating targeted study flashcards."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return result.get('flashcards', [])
-        except Exception as e:
-            print(f"Error generating concept flashcards: {e}")
-            return []
+        return source_messages(self.budget.fit(details), task)
     
     def export_flashcards(self, flashcards: List[Dict], output_path: str, format: str = 'json'):
         """
@@ -1,18 +1,20 @@
 """Module Generation for organizing content into digestible units"""
+import asyncio
 import json
-from typing import Dict, List
-from openai import OpenAI
-
-# Maximum content length for module generation
-MAX_MODULE_CONTENT_LENGTH = 2000
+from typing import Dict, List, Optional
+from ..utils.llm_client import LLMClient
+from ..utils.prompts import source_messages
+from ..utils.token_budget import TokenBudget
 
 
 class ModuleGenerator:
     """Generates structured learning modules from content"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", llm: Optional[LLMClient] = None,
+                 budget: Optional[TokenBudget] = None):
+        self.llm = llm or LLMClient(api_key)
         self.model = model
+        self.budget = budget or TokenBudget(model)
     
     def generate_modules(self, content: str, analysis: Dict) -> List[Dict]:
         """
@@ -26,13 +28,8 @@ class ModuleGenerator:
             List of module dictionaries
         """
         modules = []
-        module_structure = analysis.get('module_structure', [])
-        
-        if not module_structure:
-            # Create default structure based on topics
-            module_structure = analysis.get('main_topics', ['Module 1'])
         
-        for idx, module_name in enumerate(module_structure, 1):
+        for idx, module_name in enumerate(self.plan_modules(analysis), 1):
             module = self._create_module(
                 module_name=module_name,
                 module_number=idx,
@@ -43,6 +40,45 @@ class ModuleGenerator:
         
         return modules
     
+    async def agenerate_modules(self, content: str, analysis: Dict) -> List[Dict]:
+        """
+        Generate learning modules from content, creating modules concurrently
+        
+        Args:
+            content: Source content
+            analysis: Content analysis results
+            
+        Returns:
+            List of module dictionaries
+        """
+        return list(await asyncio.gather(*[
+            self._acreate_module(
+                module_name=module_name,
+                module_number=idx,
+                content=content,
+                concepts=analysis.get('concepts', {})
+            )
+            for idx, module_name in enumerate(self.plan_modules(analysis), 1)
+        ]))
+    
+    def plan_modules(self, analysis: Dict) -> List[str]:
+        """
+        Determine which modules to generate from an analysis
+        
+        Args:
+            analysis: Content analysis results
+            
+        Returns:
+            List of module names, in order
+        """
+        module_structure = analysis.get('module_structure', [])
+        
+        if not module_structure:
+            # Create default structure based on topics
+            module_structure = analysis.get('main_topics', ['Module 1'])
+        
+        return module_structure
+    
     def _create_module(self, module_name: str, module_number: int, 
                       content: str, concepts: Dict) -> Dict:
         """
@@ -57,9 +93,57 @@ class ModuleGenerator:
         Returns:
             Module dictionary
         """
-        prompt = f"""Create a structured learning module for: {module_name}
+        try:
+            module = self.llm.complete_json(
+                self.model, self._module_messages(module_name, content), temperature=0.7,
+                call_type='module'
+            )
+            return self._finalize_module(module, module_name, module_number)
+        except Exception as e:
+            print(f"Error creating module: {e}")
+            return self._empty_module(module_name, module_number)
+    
+    async def _acreate_module(self, module_name: str, module_number: int,
+                              content: str, concepts: Dict) -> Dict:
+        """
+        Create a single module with structured content (async)
+        
+        Args:
+            module_name: Name of the module
+            module_number: Module number
+            content: Source content
+            concepts: Concepts to cover
+            
+        Returns:
+            Module dictionary
+        """
+        try:
+            module = await self.llm.acomplete_json(
+                self.model, self._module_messages(module_name, content), temperature=0.7,
+                call_type='module'
+            )
+            return self._finalize_module(module, module_name, module_number)
+        except Exception as e:
+            print(f"Error creating module: {e}")
+            return self._empty_module(module_name, module_number)
+    
+    def source_excerpt(self, content: str) -> str:
+        """
+        Get the part of the content that module prompts draw on
+        
+        Args:
+            content: Source content
+            
+        Returns:
+            Content excerpt sent to the model
+        """
+        return self.budget.fit(content)
+    
+    def _module_messages(self, module_name: str, content: str) -> List[Dict]:
+        """Build the chat messages for module creation"""
+        task = f"""Create an engaging, structured learning module for: {module_name}
 
-Based on the source content, create a module that includes:
+Based on the source material, create a module that includes:
 1. Module title and learning objectives (3-5 objectives)
 2. Introduction (2-3 paragraphs)
 3. Main content sections (3-5 sections with subsections)
@@ -67,37 +151,28 @@ Based on the source content, create a module that includes:
 5. Prerequisites (if any)
 6. Estimated study time
 
-Source content:
-{content[:MAX_MODULE_CONTENT_LENGTH]}
-
 Respond in JSON format with the module structure."""
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert curriculum designer creating engaging learning modules."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            
-            module = json.loads(response.choices[0].message.content)
-            module['module_number'] = module_number
-            module['module_name'] = module_name
-            return module
-        except Exception as e:
-            print(f"Error creating module: {e}")
-            return {
-                'module_number': module_number,
-                'module_name': module_name,
-                'title': module_name,
-                'learning_objectives': [],
-                'introduction': '',
-                'sections': [],
-                'key_takeaways': []
-            }
+        return source_messages(self.source_excerpt(content), task)
+    
+    @staticmethod
+    def _finalize_module(module: Dict, module_name: str, module_number: int) -> Dict:
+        """Attach numbering to a generated module"""
+        module['module_number'] = module_number
+        module['module_name'] = module_name
+        return module
+    
+    @staticmethod
+    def _empty_module(module_name: str, module_number: int) -> Dict:
+        """Fallback module used when the API call fails"""
+        return {
+            'module_number': module_number,
+            'module_name': module_name,
+            'title': module_name,
+            'learning_objectives': [],
+            'introduction': '',
+            'sections': [],
+            'key_takeaways': []
+        }
     
     def create_module_summary(self, module: Dict) -> str:
         """
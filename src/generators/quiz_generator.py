@@ -1,45 +1,138 @@
 """Quiz Generation Module"""
 import json
-from typing import Dict, List
-from openai import OpenAI
-
-# Maximum content length for quiz generation
-MAX_QUIZ_CONTENT_LENGTH = 3000
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from ..utils.batch import in_current_context
+from ..utils.llm_client import LLMClient
+from ..utils.prompts import source_messages
+from ..utils.sharding import allocate, deduplicate
+from ..utils.token_budget import TokenBudget
 
 
 class QuizGenerator:
     """Generates quizzes and assessments for modules"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", llm: Optional[LLMClient] = None,
+                 budget: Optional[TokenBudget] = None, shard_size: int = 0):
+        self.llm = llm or LLMClient(api_key)
         self.model = model
+        self.budget = budget or TokenBudget(model)
+        self.shard_size = shard_size
     
     def generate_quiz(self, content: str, num_questions: int = 10,
                      question_types: List[str] = None) -> Dict:
         """
         Generate a quiz from content
         
+        With a ``shard_size``, long quizzes are requested as parallel calls of
+        at most that many questions, each over its own slice of the content,
+        and merged with near-duplicate questions removed.
+        
+        Args:
+            content: Source content
+            num_questions: Number of questions
+            question_types: Types of questions (multiple_choice, true_false, short_answer)
+            
+        Returns:
+            Dictionary containing quiz questions; ``complete`` is False when a
+            request (or a shard of a sharded quiz) failed and its questions
+            are missing
+        """
+        if question_types is None:
+            question_types = ['multiple_choice', 'true_false', 'short_answer']
+        
+        shards = allocate(num_questions, self.shard_size, self.source_excerpt(content))
+        if len(shards) <= 1:
+            return self._merge_quizzes([self._generate_shard(content, num_questions)], num_questions)
+        
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            quizzes = list(executor.map(in_current_context(lambda shard: self._generate_shard(*shard)), shards))
+        return self._merge_quizzes(quizzes, num_questions)
+    
+    def _generate_shard(self, content: str, num_questions: int) -> Optional[Dict]:
+        """Generate a quiz from content in one call, or get None if it failed"""
+        try:
+            result = self.llm.complete_json(
+                self.model, self._quiz_messages(content, num_questions), temperature=0.7,
+                call_type='quiz'
+            )
+            return self._normalize_quiz(result)
+        except Exception as e:
+            print(f"Error generating quiz: {e}")
+            return None
+    
+    async def agenerate_quiz(self, content: str, num_questions: int = 10,
+                             question_types: List[str] = None) -> Dict:
+        """
+        Generate a quiz from content (async)
+        
         Args:
             content: Source content
             num_questions: Number of questions
             question_types: Types of questions (multiple_choice, true_false, short_answer)
             
         Returns:
-            Dictionary containing quiz questions
+            Dictionary containing quiz questions and ``complete``
         """
         if question_types is None:
             question_types = ['multiple_choice', 'true_false', 'short_answer']
         
-        prompt = f"""Create a {num_questions}-question quiz from the following content.
+        shards = allocate(num_questions, self.shard_size, self.source_excerpt(content))
+        if len(shards) <= 1:
+            return self._merge_quizzes([await self._agenerate_shard(content, num_questions)], num_questions)
+        
+        quizzes = await asyncio.gather(*[self._agenerate_shard(*shard) for shard in shards])
+        return self._merge_quizzes(quizzes, num_questions)
+    
+    async def _agenerate_shard(self, content: str, num_questions: int) -> Optional[Dict]:
+        """Generate a quiz from content in one call, or get None if it failed (async)"""
+        try:
+            result = await self.llm.acomplete_json(
+                self.model, self._quiz_messages(content, num_questions), temperature=0.7,
+                call_type='quiz'
+            )
+            return self._normalize_quiz(result)
+        except Exception as e:
+            print(f"Error generating quiz: {e}")
+            return None
+    
+    @classmethod
+    def _merge_quizzes(cls, quizzes: List[Optional[Dict]], num_questions: int) -> Dict:
+        """
+        Combine sharded quizzes in order, dropping questions that repeat an earlier one
+        
+        A single quiz is kept as returned; None marks a failed request.
+        """
+        complete = all(quiz is not None for quiz in quizzes)
+        quizzes = [quiz or {'questions': [], 'total_points': 0, 'num_questions': 0} for quiz in quizzes]
+        if len(quizzes) == 1:
+            return dict(quizzes[0], complete=complete)
+        questions = [question for quiz in quizzes for question in quiz.get('questions', [])]
+        questions = deduplicate(questions, lambda question: str(question.get('question', '')))
+        return dict(cls._normalize_quiz({'questions': questions[:num_questions]}), complete=complete)
+    
+    def source_excerpt(self, content: str) -> str:
+        """
+        Get the part of the content that quiz prompts draw on
+        
+        Args:
+            content: Source content
+            
+        Returns:
+            Content excerpt sent to the model
+        """
+        return self.budget.fit(content)
+    
+    def _quiz_messages(self, content: str, num_questions: int) -> List[Dict]:
+        """Build the chat messages for quiz generation"""
+        task = f"""Create an effective {num_questions}-question assessment quiz from the source material.
 
 Include a mix of:
 - Multiple choice questions (4 options each)
 - True/False questions
 - Short answer questions
 
-Content:
-{content[:MAX_QUIZ_CONTENT_LENGTH]}
-
 For each question provide:
 - Question text
 - Question type
@@ -49,36 +142,46 @@ For each question provide:
 - Points value (based on difficulty)
 
 Respond in JSON format with a quiz object containing an array of questions."""
+        return source_messages(self.source_excerpt(content), task)
+    
+    @staticmethod
+    def _normalize_quiz(result: Dict) -> Dict:
+        """Coerce a quiz response into the standard quiz structure"""
+        quiz = result.get('quiz', result)
         
+        # Ensure quiz has required structure
+        if 'questions' not in quiz:
+            quiz = {'questions': result.get('questions', [])}
+        
+        quiz['total_points'] = sum(q.get('points', 1) for q in quiz['questions'])
+        quiz['num_questions'] = len(quiz['questions'])
+        
+        return quiz
+    
+    def generate_module_quiz(self, module: Dict, difficulty: str = 'mixed') -> Dict:
+        """
+        Generate a quiz specifically for a module
+        
+        Args:
+            module: Module dictionary
+            difficulty: Quiz difficulty (easy, medium, hard, mixed)
+            
+        Returns:
+            Quiz dictionary
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert educator creating effective assessment quizzes."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
+            result = self.llm.complete_json(
+                self.model, self._module_quiz_messages(module, difficulty), temperature=0.7,
+                call_type='module_quiz'
             )
-            
-            result = json.loads(response.choices[0].message.content)
-            quiz = result.get('quiz', result)
-            
-            # Ensure quiz has required structure
-            if 'questions' not in quiz:
-                quiz = {'questions': result.get('questions', [])}
-            
-            quiz['total_points'] = sum(q.get('points', 1) for q in quiz['questions'])
-            quiz['num_questions'] = len(quiz['questions'])
-            
-            return quiz
+            return self._normalize_module_quiz(result, module)
         except Exception as e:
-            print(f"Error generating quiz: {e}")
-            return {'questions': [], 'total_points': 0, 'num_questions': 0}
+            print(f"Error generating module quiz: {e}")
+            return {'questions': [], 'module_name': '', 'total_points': 0}
     
-    def generate_module_quiz(self, module: Dict, difficulty: str = 'mixed') -> Dict:
+    async def agenerate_module_quiz(self, module: Dict, difficulty: str = 'mixed') -> Dict:
         """
-        Generate a quiz specifically for a module
+        Generate a quiz specifically for a module (async)
         
         Args:
             module: Module dictionary
@@ -87,6 +190,18 @@ Respond in JSON format with a quiz object containing an array of questions."""
         Returns:
             Quiz dictionary
         """
+        try:
+            result = await self.llm.acomplete_json(
+                self.model, self._module_quiz_messages(module, difficulty), temperature=0.7,
+                call_type='module_quiz'
+            )
+            return self._normalize_module_quiz(result, module)
+        except Exception as e:
+            print(f"Error generating module quiz: {e}")
+            return {'questions': [], 'module_name': '', 'total_points': 0}
+    
+    def _module_quiz_messages(self, module: Dict, difficulty: str) -> List[Dict]:
+        """Build the chat messages for a module quiz"""
         # Extract content from module
         content = module.get('introduction', '')
         for section in module.get('sections', []):
@@ -96,7 +211,8 @@ Respond in JSON format with a quiz object containing an array of questions."""
                 # Handle string sections
                 content += ' ' + str(section)
         
-        prompt = f"""Create a comprehensive quiz for the module: {module.get('title', 'Module')}
+        task = f"""Create a comprehensive quiz for the module: {module.get('title', 'Module')}
+The source material is an excerpt of the module.
 
 Learning objectives:
 {json.dumps(module.get('learning_objectives', []))}
@@ -109,36 +225,22 @@ Create 8-12 questions that:
 3. Include various question types
 4. Are appropriate for the difficulty level
 
-Content excerpt:
-{content[:MAX_MODULE_CONTENT_LENGTH]}
-
 Respond in JSON format."""
+        return source_messages(self.budget.fit(content), task)
+    
+    @staticmethod
+    def _normalize_module_quiz(result: Dict, module: Dict) -> Dict:
+        """Coerce a module quiz response into the standard quiz structure"""
+        quiz = result.get('quiz', result)
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating module assessments."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            quiz = result.get('quiz', result)
-            
-            if 'questions' not in quiz:
-                quiz = {'questions': result.get('questions', [])}
-            
-            quiz['module_name'] = module.get('title', module.get('module_name', ''))
-            quiz['module_number'] = module.get('module_number', 1)
-            quiz['total_points'] = sum(q.get('points', 1) for q in quiz['questions'])
-            
-            return quiz
-        except Exception as e:
-            print(f"Error generating module quiz: {e}")
-            return {'questions': [], 'module_name': '', 'total_points': 0}
+        if 'questions' not in quiz:
+            quiz = {'questions': result.get('questions', [])}
+        
+        quiz['module_name'] = module.get('title', module.get('module_name', ''))
+        quiz['module_number'] = module.get('module_number', 1)
+        quiz['total_points'] = sum(q.get('points', 1) for q in quiz['questions'])
+        
+        return quiz
     
     def export_quiz(self, quiz: Dict, output_path: str, format: str = 'json'):
         """
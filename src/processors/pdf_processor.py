@@ -1,67 +1,918 @@
 """PDF Processing Module"""
+import hashlib
+import json
+import math
+import multiprocessing
 import os
-from typing import Any, Dict, List
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import PyPDF2
 import pdfplumber
+from pdfminer.pdfpage import PDFPage
+from pdfplumber.page import Page
+
+EXTRACTORS = ('auto', 'fast', 'layout')
+
+# Version of the page records; bump it whenever extraction output changes so
+# that pages cached by older code are extracted again
+EXTRACTOR_VERSION = 1
+
+# Separator following each page's text in the extracted document text
+PAGE_SEPARATOR = '\n\n'
+
+# Fast-pass heuristics: a page is laid out with pdfplumber when it has
+# enough ruling lines or rectangles to hold a table, when fewer characters
+# came out than this although it draws text, or when the text looks garbled
+MIN_RULINGS = 4
+MIN_FAST_CHARS = 20
+MAX_UNREADABLE_RATIO = 0.05
+MIN_LETTER_RATIO = 0.4
+MAX_MEAN_WORD_LENGTH = 25
+
+# Content stream operators drawing rectangles or straight line segments, and
+# showing text
+RULING_PATTERN = re.compile(rb'(?<![A-Za-z])(?:re|l)(?![A-Za-z])')
+TEXT_OPERATOR_PATTERN = re.compile(rb"(?<![A-Za-z])(?:Tj|TJ|'|\")(?![A-Za-z])")
+
+# Content stream operators that each add an object for layout analysis to
+# process: path segments, shown strings and placed images or forms
+OBJECT_OPERATOR_PATTERN = re.compile(rb"(?<![A-Za-z])(?:m|l|c|v|y|re|Tj|TJ|'|\"|Do)(?![A-Za-z])")
+
+# Outline from font statistics: lines set this much larger than the body
+# text, or in bold at body size, are headings; heading sizes map to at most
+# this many levels
+HEADING_SIZE_RATIO = 1.15
+MAX_HEADING_CHARS = 100
+MAX_HEADING_LEVELS = 3
+
+# Chunk boundaries: sentence ends (closing punctuation and quotes followed by
+# whitespace) and runs of whitespace
+SENTENCE_END_PATTERN = re.compile(r'[.!?]["\')\]]*(?=\s)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Boilerplate: lines among the first or last few of a page that recur at the
+# same position, digits aside, on at least this share of the pages (and this
+# many pages) are running headers and footers
+BOILERPLATE_EDGE_LINES = 3
+BOILERPLATE_MIN_RATIO = 0.5
+BOILERPLATE_MIN_PAGES = 3
+DIGITS_PATTERN = re.compile(r'\d+')
+
+# Page ranges per worker in parallel extraction; more, smaller ranges even
+# out pages that take longer to lay out
+RANGES_PER_WORKER = 4
+
+
+def _needs_layout(text: str, content: bytes, tables: bool) -> bool:
+    """
+    Whether a page's fast-pass text should be redone with full layout analysis
+    
+    Args:
+        text: Text from the fast pass
+        content: The page's raw content stream
+        tables: Whether tables are extracted
+        
+    Returns:
+        True for pages with ruling lines (tables) when tables are wanted,
+        pages that draw text the fast pass could not decode, and garbled text
+    """
+    if tables and len(RULING_PATTERN.findall(content)) >= MIN_RULINGS:
+        return True
+    visible = ''.join(text.split())
+    if len(visible) < MIN_FAST_CHARS:
+        return TEXT_OPERATOR_PATTERN.search(content) is not None
+    
+    unreadable = sum(1 for ch in visible if ch == '\ufffd' or not ch.isprintable())
+    letters = sum(1 for ch in visible if ch.isalpha())
+    words = text.split()
+    return (unreadable / len(visible) > MAX_UNREADABLE_RATIO
+            or letters / len(visible) < MIN_LETTER_RATIO
+            or len(visible) / len(words) > MAX_MEAN_WORD_LENGTH)
+
+
+class _InlineLayout:
+    """
+    Lays out the pages of a PDF in this process, in increasing page order
+    
+    ``task`` takes a pdfplumber page, returns what is wanted from its layout
+    and closes it; ``_lay_out`` gives text and tables, ``_text_lines`` fonts.
+    """
+    
+    def __init__(self, pdf_path: str, task: Callable[[Page], Any]):
+        self.pdf_path = pdf_path
+        self.task = task
+        self._pdf = None
+        self._pages = None
+    
+    def layout(self, page_number: int) -> Any:
+        """Lay out a page and run the task on it, opening the PDF on first use"""
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(self.pdf_path)
+            self._pages = _iter_layout_pages(self._pdf)
+        return self.task(next(page for page in self._pages if page.page_number == page_number))
+    
+    def close(self):
+        """Close the PDF"""
+        if self._pdf is not None:
+            self._pdf.close()
+
+
+class _LayoutWorker:
+    """
+    Lays out the pages of a PDF in a child process that is killed when a page overruns
+    
+    The child is replaced on the next request, so one pathological page
+    costs at most ``timeout`` seconds and the rest of the document goes on.
+    """
+    
+    def __init__(self, pdf_path: str, task: Callable[[Page], Any], timeout: float):
+        self.pdf_path = pdf_path
+        self.task = task
+        self.timeout = timeout
+        self._process = None
+        self._conn = None
+    
+    def layout(self, page_number: int) -> Any:
+        """Lay out a page and run the task on it, or get None if it ran out of time"""
+        if self._process is None:
+            self._conn, child_conn = multiprocessing.Pipe()
+            self._process = multiprocessing.Process(
+                target=_layout_worker, args=(child_conn, self.pdf_path, self.task), daemon=True
+            )
+            self._process.start()
+            child_conn.close()
+        
+        self._conn.send(page_number)
+        if not self._conn.poll(self.timeout):
+            self.close()
+            return None
+        try:
+            result = self._conn.recv()
+        except EOFError:
+            self.close()
+            raise RuntimeError(f"Layout worker exited on page {page_number}")
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def close(self):
+        """Stop the child process"""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+            self._process = None
+
+
+def _iter_layout_pages(pdf: pdfplumber.PDF) -> Iterator[Page]:
+    """
+    Build the pages of an open PDF one at a time
+    
+    Pages are built here rather than through ``pdf.pages``, which parses
+    every page up front and keeps them all until the file is closed.
+    """
+    doctop = 0
+    for page_number, pdf_page in enumerate(PDFPage.create_pages(pdf.doc), 1):
+        page = Page(pdf, pdf_page, page_number=page_number, initial_doctop=doctop)
+        doctop += page.height
+        yield page
+
+
+def _lay_out(page: Page, tables: bool) -> Tuple[str, List]:
+    """Get a page's text and tables from layout analysis, then release its layout objects"""
+    try:
+        return page.extract_text() or '', page.extract_tables() if tables else []
+    finally:
+        page.close()
+
+
+def _text_lines(page: Page) -> List[Tuple[str, float, bool]]:
+    """Get a page's text lines with their font size and weight, then release its layout objects"""
+    try:
+        lines = []
+        for line in page.extract_text_lines():
+            chars = [char for char in line['chars'] if not char['text'].isspace()]
+            if chars:
+                size = round(min(char['size'] for char in chars), 1)
+                bold = all('bold' in char.get('fontname', '').lower() for char in chars)
+                lines.append((line['text'].strip(), size, bold))
+        return lines
+    finally:
+        page.close()
+
+
+def _layout_worker(conn, pdf_path: str, task: Callable[[Page], Any]):
+    """Child process loop answering page numbers with the task's result for the page"""
+    with pdfplumber.open(pdf_path) as pdf:
+        pages = _iter_layout_pages(pdf)
+        while True:
+            try:
+                page_number = conn.recv()
+            except EOFError:
+                return
+            try:
+                result = task(next(page for page in pages if page.page_number == page_number))
+            except Exception as e:
+                result = RuntimeError(f"Could not lay out page {page_number}: {e}")
+            conn.send(result)
+
+
+def _page_records(pdf_path: str, tables: bool = True, first: int = 1,
+                  last: Optional[int] = None, extractor: str = 'auto',
+                  page_timeout: float = 0, max_page_objects: int = 0,
+                  skip: frozenset = frozenset()) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the records of a range of pages, laying out and releasing one page at a time
+    
+    Args:
+        pdf_path: Path to the PDF file
+        tables: Whether to extract tables
+        first: First page number (1-based)
+        last: Last page number, inclusive (None for the last page)
+        extractor: 'auto', 'fast' or 'layout' (see ``PDFProcessor``)
+        page_timeout: Seconds a page's layout may take (0 for no limit)
+        max_page_objects: Drawing and text operators above which a page is
+                          not laid out (0 for no limit)
+        skip: Page numbers to leave out, such as pages already cached
+        
+    Yields:
+        Page records in page order
+    """
+    reader = PyPDF2.PdfReader(pdf_path)
+    last = len(reader.pages) if last is None else min(last, len(reader.pages))
+    task = partial(_lay_out, tables=tables)
+    layout = _LayoutWorker(pdf_path, task, page_timeout) if page_timeout else _InlineLayout(pdf_path, task)
+    
+    try:
+        for page_number in range(first, last + 1):
+            if page_number in skip:
+                continue
+            fast_text = None
+            content = b''
+            if extractor != 'layout' or max_page_objects:
+                try:
+                    fast_page = reader.pages[page_number - 1]
+                    contents = fast_page.get_contents()
+                    content = contents.get_data() if contents is not None else b''
+                    if extractor != 'layout':
+                        fast_text = fast_page.extract_text() or ''
+                except Exception:
+                    fast_text = None
+            
+            wants_layout = fast_text is None or (
+                extractor == 'auto' and _needs_layout(fast_text, content, tables)
+            )
+            over_budget = None
+            result = None
+            if wants_layout:
+                if max_page_objects and len(OBJECT_OPERATOR_PATTERN.findall(content)) > max_page_objects:
+                    over_budget = 'objects'
+                else:
+                    result = layout.layout(page_number)
+                    if result is None:
+                        over_budget = 'time'
+            
+            if over_budget is not None and fast_text is None:
+                try:
+                    fast_text = reader.pages[page_number - 1].extract_text() or ''
+                except Exception:
+                    fast_text = None
+            
+            record = {'page_number': page_number, 'text': '', 'tables': [], 'extractor': 'skipped'}
+            if result is not None:
+                record.update(text=result[0], tables=result[1], extractor='pdfplumber')
+            elif fast_text:
+                record.update(text=fast_text, extractor='pypdf2')
+            if over_budget is not None:
+                record['over_budget'] = over_budget
+            yield record
+    finally:
+        layout.close()
+
+
+def _extract_page_range(pdf_path: str, first: int, last: int, tables: bool, extractor: str,
+                        page_timeout: float, max_page_objects: int,
+                        skip: frozenset) -> List[Dict[str, Any]]:
+    """Extract a range of pages in a worker process"""
+    return list(_page_records(pdf_path, tables, first, last, extractor, page_timeout,
+                              max_page_objects, skip))
+
+
+def _file_digest(path: str) -> str:
+    """SHA-256 of a file's bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _bookmark_headings(pdf_path: str) -> List[Tuple[int, str, int]]:
+    """
+    Read the headings of a PDF's bookmarks (document outline)
+    
+    Args:
+        pdf_path: Path to the PDF file
+        
+    Returns:
+        (level, title, page number) per bookmark in outline order, empty
+        when the PDF has no bookmarks
+    """
+    reader = PyPDF2.PdfReader(pdf_path)
+    headings = []
+    
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                page_number = reader.get_destination_page_number(item) + 1
+            except Exception:
+                continue
+            title = ' '.join(str(item.title or '').split())
+            if title and page_number > 0:
+                headings.append((level, title, page_number))
+    
+    walk(reader.outline, 1)
+    return headings
+
+
+def _font_headings(pdf_path: str, page_timeout: float = 0,
+                   max_page_objects: int = 0) -> Tuple[List[Tuple[int, str, int]], bool]:
+    """
+    Find headings from the font size and weight of each text line
+    
+    The body size is the size most characters are set in. Lines set at
+    least ``HEADING_SIZE_RATIO`` times larger are headings, the largest size
+    being level 1; bold lines at body size are the deepest level, unless
+    most of the text is bold. Consecutive heading lines of the same size
+    are one wrapped heading.
+    
+    Font data needs layout analysis, so pages are budgeted as in text
+    extraction: pages with more than ``max_page_objects`` operators are not
+    laid out, and with a ``page_timeout`` the layout runs in a child process
+    killed once a page overruns. Either way the page contributes no headings.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        page_timeout: Seconds a page's layout may take (0 for no limit)
+        max_page_objects: Operators above which a page is not laid out (0 for no limit)
+        
+    Returns:
+        (level, title, page number) per heading in page order, and whether
+        any page went over budget
+    """
+    lines = []
+    sizes = Counter()
+    bold_chars = 0
+    over_budget = False
+    reader = PyPDF2.PdfReader(pdf_path)
+    if page_timeout:
+        layout = _LayoutWorker(pdf_path, _text_lines, page_timeout)
+    else:
+        layout = _InlineLayout(pdf_path, _text_lines)
+    try:
+        for page_number in range(1, len(reader.pages) + 1):
+            if max_page_objects:
+                try:
+                    contents = reader.pages[page_number - 1].get_contents()
+                    content = contents.get_data() if contents is not None else b''
+                except Exception:
+                    content = b''
+                if len(OBJECT_OPERATOR_PATTERN.findall(content)) > max_page_objects:
+                    over_budget = True
+                    continue
+            page_lines = layout.layout(page_number)
+            if page_lines is None:
+                over_budget = True
+                continue
+            for title, size, bold in page_lines:
+                chars = len(''.join(title.split()))
+                sizes[size] += chars
+                bold_chars += chars if bold else 0
+                lines.append((page_number, title, size, bold))
+    finally:
+        layout.close()
+    if not sizes:
+        return [], over_budget
+    
+    body = sizes.most_common(1)[0][0]
+    use_bold = bold_chars * 2 < sum(sizes.values())
+    
+    def is_heading(title, size, bold):
+        if len(title) > MAX_HEADING_CHARS or title.endswith(('.', ',', ';')):
+            return False
+        if not any(c.isalpha() for c in title):
+            return False
+        return size >= body * HEADING_SIZE_RATIO or (use_bold and bold and size >= body)
+    
+    flags = [is_heading(title, size, bold) for _, title, size, bold in lines]
+    heading_sizes = sorted({size for (_, _, size, _), flag in zip(lines, flags)
+                            if flag and size >= body * HEADING_SIZE_RATIO}, reverse=True)
+    levels = {size: min(i + 1, MAX_HEADING_LEVELS) for i, size in enumerate(heading_sizes)}
+    bold_level = min(len(heading_sizes) + 1, MAX_HEADING_LEVELS)
+    
+    headings = []
+    previous = None
+    for i, ((page_number, title, size, _), flag) in enumerate(zip(lines, flags)):
+        if not flag:
+            continue
+        level = levels.get(size, bold_level)
+        if previous == i - 1 and headings[-1][0] == level and headings[-1][2] == page_number:
+            headings[-1] = (level, f"{headings[-1][1]} {title}", page_number)
+        else:
+            headings.append((level, title, page_number))
+        previous = i
+    return headings, over_budget
+
+
+def _find_title(text: str, title: str, start: int, end: int) -> int:
+    """Offset of a heading's text in ``text[start:end]``, ignoring line breaks, or -1"""
+    pattern = r'\s+'.join(re.escape(word) for word in title.split())
+    match = re.compile(pattern).search(text, start, end)
+    return match.start() if match else -1
+
+
+def _section_tree(headings: List[Tuple[int, str, int]], text: str,
+                  page_starts: List[int]) -> List[Dict[str, Any]]:
+    """
+    Nest headings into sections with character offsets into the document text
+    
+    A section starts where its heading's text is found on its page (or at
+    the page start) and ends where the next heading of the same or a higher
+    level starts.
+    
+    Args:
+        headings: (level, title, page number) in document order
+        text: Document text
+        page_starts: Offset of each page's text in ``text``
+        
+    Returns:
+        Top-level sections
+    """
+    roots = []
+    stack = []
+    position = 0
+    for level, title, page_number in headings:
+        if not 1 <= page_number <= len(page_starts):
+            continue
+        page_start = page_starts[page_number - 1]
+        page_end = page_starts[page_number] if page_number < len(page_starts) else len(text)
+        start = position if page_start <= position < page_end else page_start
+        found = _find_title(text, title, start, page_end)
+        start = found if found >= 0 else start
+        position = start
+        
+        node = {'title': title, 'level': level, 'page_number': page_number,
+                'start': start, 'end': len(text), 'children': []}
+        while stack and stack[-1]['level'] >= level:
+            stack.pop()['end'] = start
+        (stack[-1]['children'] if stack else roots).append(node)
+        stack.append(node)
+    return roots
+
+
+def _chunk_end(text: str, start: int, limit: int, end: int) -> int:
+    """
+    Where a chunk starting at ``start`` and ending by ``limit`` should end
+    
+    The last paragraph break in the second half of the window is preferred,
+    then the last sentence end, then the last whitespace; a window without
+    any is cut at ``limit``. Text past ``end`` is not part of the chunk.
+    """
+    if limit >= end:
+        return end
+    floor = start + (limit - start) // 2
+    cut = text.rfind('\n\n', floor, limit)
+    if cut > start:
+        return cut
+    cut = -1
+    for match in SENTENCE_END_PATTERN.finditer(text, floor, min(limit + 1, end)):
+        if match.end() <= limit:
+            cut = match.end()
+    if cut > start:
+        return cut
+    cut = max(text.rfind(' ', floor, limit), text.rfind('\n', floor, limit))
+    return cut if cut > start else limit
+
+
+def _chunk_start(text: str, start: int, end: int) -> int:
+    """Move a chunk start forward to the next sentence start, else word start, before ``end``"""
+    match = SENTENCE_END_PATTERN.search(text, start, end)
+    if match is None:
+        match = WHITESPACE_PATTERN.search(text, start, end)
+    return match.end() if match else end
+
+
+def _chunk_spans(text: str, chunk_size: int, overlap: int = 0,
+                 count: Optional[Callable[[str], int]] = None,
+                 start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the (start, end) offsets of consecutive chunks of ``text[start:end]``
+    
+    Only offsets are produced; the text is never split or copied beyond the
+    single chunk being measured in token mode.
+    
+    Args:
+        text: Text to chunk
+        chunk_size: Maximum chunk size, in characters or, with ``count``, tokens
+        overlap: Size of the text repeated from the end of the previous
+                 chunk, in the same unit, starting at a sentence or word
+        count: Token counter; sizes are then measured in tokens
+        start: Offset to start at
+        end: Offset to stop at (defaults to the end of the text)
+        
+    Yields:
+        Chunk offsets in text order
+    """
+    end = len(text) if end is None else end
+    ratio = 1.0
+    if count is not None:
+        sample = text[start:min(end, start + chunk_size * 8)]
+        ratio = len(sample) / max(1, count(sample))
+    
+    while start < end and text[start].isspace():
+        start += 1
+    while start < end:
+        chunk_end = _chunk_end(text, start, start + max(1, int(chunk_size * ratio)), end)
+        size = chunk_end - start
+        if count is not None:
+            size = count(text[start:chunk_end])
+            while size > chunk_size and chunk_end - start > 1:
+                window = max(1, min(chunk_end - start - 1, (chunk_end - start) * chunk_size // size))
+                chunk_end = _chunk_end(text, start, start + window, end)
+                size = count(text[start:chunk_end])
+            ratio = (chunk_end - start) / max(1, size)
+        yield start, chunk_end
+        if chunk_end >= end:
+            break
+        
+        next_start = chunk_end
+        if overlap and size:
+            next_start = max(start + 1, chunk_end - (chunk_end - start) * overlap // size)
+            next_start = _chunk_start(text, next_start, chunk_end)
+        while next_start < end and text[next_start].isspace():
+            next_start += 1
+        start = next_start
+
+
+
+def _boilerplate_lines(page_lines: List[List[str]]) -> List[set]:
+    """
+    Find the running header and footer lines of a document's pages
+    
+    Each of a page's first and last ``BOILERPLATE_EDGE_LINES`` non-blank
+    lines is keyed by its position and its text with digits masked, so page
+    numbers and dates match. The keys of all pages are counted together with
+    one ``np.unique`` call.
+    
+    Args:
+        page_lines: Lines of each page's text
+        
+    Returns:
+        Indices of the boilerplate lines of each page
+    """
+    vocabulary = {}
+    page_ids = []
+    line_indices = []
+    positions = []
+    line_ids = []
+    for page_id, lines in enumerate(page_lines):
+        visible = [i for i, line in enumerate(lines) if line.strip()]
+        edges = {}
+        for position, i in enumerate(reversed(visible[-BOILERPLATE_EDGE_LINES:])):
+            edges[i] = BOILERPLATE_EDGE_LINES + position
+        for position, i in enumerate(visible[:BOILERPLATE_EDGE_LINES]):
+            edges[i] = position
+        for i, position in edges.items():
+            key = DIGITS_PATTERN.sub('#', ' '.join(lines[i].lower().split()))
+            page_ids.append(page_id)
+            line_indices.append(i)
+            positions.append(position)
+            line_ids.append(vocabulary.setdefault(key, len(vocabulary)))
+    
+    drop = [set() for _ in page_lines]
+    if not vocabulary:
+        return drop
+    keys = np.asarray(positions, dtype=np.int64) * len(vocabulary) + np.asarray(line_ids, dtype=np.int64)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    threshold = max(BOILERPLATE_MIN_PAGES, math.ceil(len(page_lines) * BOILERPLATE_MIN_RATIO))
+    repeated = np.flatnonzero(counts[inverse] >= threshold)
+    for j in repeated:
+        drop[page_ids[j]].add(line_indices[j])
+    return drop
+
+
+def _page_ranges(num_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """Split pages 1..num_pages into up to ``parts`` contiguous, near-equal (first, last) ranges"""
+    parts = max(1, min(parts, num_pages))
+    base, extra = divmod(num_pages, parts)
+    ranges = []
+    first = 1
+    for i in range(parts):
+        last = first + base + (1 if i < extra else 0) - 1
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
 
 
 class PDFProcessor:
-    """Extracts and processes content from PDF files"""
+    """
+    Extracts and processes content from PDF files
+    
+    Text is extracted in tiers. The 'auto' extractor takes every page's
+    text from a cheap PyPDF2 pass and runs pdfplumber's layout and table
+    analysis only on pages that need it: pages with ruling lines (when
+    tables are wanted), pages whose text the fast pass could not decode, and
+    garbled output. 'fast' uses PyPDF2 alone and 'layout' pdfplumber alone.
+    Each page record names the extractor that produced it.
+    
+    Layout analysis is budgeted per page so that one pathological page, such
+    as a scanned diagram drawn with hundreds of thousands of paths, cannot
+    pin a worker. Pages with more drawing and text operators than
+    ``max_page_objects`` are not laid out, and with a ``page_timeout`` pages
+    are laid out in a child process that is killed once a page overruns.
+    Such pages fall back to the fast pass, or are skipped when it has no
+    text; either way the record notes why and the metadata lists them.
     
-    def __init__(self):
+    With a ``cache``, page records are kept across runs, keyed by the file's
+    content hash, the page number and the extraction settings, so a document
+    seen before, under any name, is not extracted again.
+    """
+    
+    def __init__(self, max_workers: int = 1, parallel_min_pages: int = 50,
+                 extractor: str = 'auto', extract_tables: bool = True,
+                 page_timeout: float = 0, max_page_objects: int = 0, cache=None):
+        """
+        Initialize the processor
+        
+        Args:
+            max_workers: Processes extracting pages in parallel (1 extracts serially)
+            parallel_min_pages: Documents with fewer pages are extracted serially,
+                                since starting workers would cost more than it saves
+            extractor: 'auto', 'fast' or 'layout'
+            extract_tables: Whether to extract tables
+            page_timeout: Seconds a page's layout analysis may take (0 for no limit)
+            max_page_objects: Drawing and text operators above which a page is
+                              not laid out (0 for no limit)
+            cache: Optional ``PersistentCache`` for page records
+        """
+        if extractor not in EXTRACTORS:
+            raise ValueError(f"Unknown PDF extractor: {extractor}")
         self.content = {}
+        self.max_workers = max(1, max_workers)
+        self.parallel_min_pages = parallel_min_pages
+        self.extractor = extractor
+        self.extract_tables = extract_tables
+        self.page_timeout = page_timeout
+        self.max_page_objects = max_page_objects
+        self.cache = cache
     
-    def extract_text(self, pdf_path: str) -> Dict[str, Any]:
+    def iter_pages(self, pdf_path: str, tables: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
         """
-        Extract text content from PDF file
+        Yield the pages of a PDF file one at a time
+        
+        Pages are parsed only as they are reached, and each page's cached
+        layout objects are released as soon as its record is built, so memory
+        stays flat however long the document is.
+        
+        With several workers, layout analysis, which is CPU-bound, runs in a
+        process pool: the document is split into contiguous page ranges, a
+        few per worker, and the ranges are yielded in page order as they
+        finish, so the records are the same as from a serial run.
+        
+        With a cache, pages found in it are yielded from it and only the
+        others are extracted; pages over budget are never cached, since a
+        later run may have the time to lay them out.
         
         Args:
             pdf_path: Path to the PDF file
+            tables: Whether to extract tables (defaults to ``extract_tables``)
             
-        Returns:
-            Dictionary containing extracted text and metadata
+        Yields:
+            Page record with the page number, the page text ('' if the page
+            has none), the page's tables, the extractor used ('skipped' if
+            none) and, for pages over budget, ``over_budget`` ('time' or
+            'objects')
         """
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        if tables is None:
+            tables = self.extract_tables
         
-        result = {
-            'text': '',
-            'pages': [],
-            'metadata': {},
-            'tables': []
-        }
+        if self.cache is None:
+            num_pages = self.count_pages(pdf_path) if self.max_workers > 1 else 0
+            yield from self._extract_pages(pdf_path, tables, num_pages)
+            return
+        
+        digest = _file_digest(pdf_path)
+        num_pages = self.count_pages(pdf_path)
+        keys = [self._cache_key(digest, page_number, tables) for page_number in range(1, num_pages + 1)]
+        cached = {}
+        for page_number, key in enumerate(keys, 1):
+            value = self.cache.get(key)
+            if value is not None:
+                cached[page_number] = json.loads(value)
+        
+        extracted = self._extract_pages(pdf_path, tables, num_pages - len(cached), frozenset(cached))
+        for page_number, key in enumerate(keys, 1):
+            record = cached.get(page_number)
+            if record is None:
+                record = next(extracted)
+                if 'over_budget' not in record:
+                    self.cache.set(key, json.dumps(record))
+            yield record
+    
+    def _extract_pages(self, pdf_path: str, tables: bool, num_pages: int,
+                       skip: frozenset = frozenset()) -> Iterator[Dict[str, Any]]:
+        """
+        Extract the pages of a PDF file, in a process pool when there are enough of them
         
-        # Extract text using pdfplumber for better accuracy
-        with pdfplumber.open(pdf_path) as pdf:
-            result['metadata'] = {
-                'num_pages': len(pdf.pages),
-                'file_name': os.path.basename(pdf_path)
-            }
+        Args:
+            pdf_path: Path to the PDF file
+            tables: Whether to extract tables
+            num_pages: Pages to extract (0 when not counted, which extracts serially)
+            skip: Page numbers to leave out
             
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_text = page.extract_text()
+        Yields:
+            Page records in page order
+        """
+        if num_pages < max(2, self.parallel_min_pages) or self.max_workers < 2:
+            yield from _page_records(pdf_path, tables, extractor=self.extractor,
+                                     page_timeout=self.page_timeout,
+                                     max_page_objects=self.max_page_objects, skip=skip)
+            return
+        
+        ranges = _page_ranges(num_pages + len(skip), self.max_workers * RANGES_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(ranges))) as executor:
+            for records in executor.map(_extract_page_range, repeat(pdf_path),
+                                        [first for first, _ in ranges],
+                                        [last for _, last in ranges], repeat(tables),
+                                        repeat(self.extractor), repeat(self.page_timeout),
+                                        repeat(self.max_page_objects), repeat(skip)):
+                yield from records
+    
+    def _cache_key(self, digest: str, page_number: int, tables: bool) -> str:
+        """Cache key of a page record: content hash, page and the settings that shape it"""
+        return f"pdf-page:v{EXTRACTOR_VERSION}:{self.extractor}:{int(tables)}:{digest}:{page_number}"
+    
+    @staticmethod
+    def count_pages(pdf_path: str) -> int:
+        """
+        Count the pages of a PDF file without laying them out
+        
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Returns:
+            Number of pages
+        """
+        return len(PyPDF2.PdfReader(pdf_path).pages)
+    
+    def extract_text(self, pdf_path: str, page_text: bool = True) -> Dict[str, Any]:
+        """
+        Extract text content from PDF file
+        
+        Each page record gives the page's ``start`` and ``end`` offsets in
+        ``text``, where pages are separated by a blank line, and the
+        extractor used. The metadata counts pages per extractor and lists
+        the pages that went over budget and those skipped.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            page_text: Whether page records carry their own text; without it
+                       the text is held once and pages are sliced from ``text``
+                       
+        Returns:
+            Dictionary containing extracted text and metadata
+        """
+        pages = []
+        texts = []
+        tables = []
+        extractors = Counter()
+        over_budget = []
+        offset = 0
+        num_pages = 0
+        
+        for page in self.iter_pages(pdf_path):
+            num_pages = page['page_number']
+            extractors[page['extractor']] += 1
+            if page.get('over_budget'):
+                over_budget.append({
+                    'page_number': num_pages,
+                    'reason': page['over_budget'],
+                    'extractor': page['extractor']
+                })
+            for table in page['tables']:
+                tables.append({
+                    'page': num_pages,
+                    'data': table
+                })
+            
+            if page['text']:
+                record = {
+                    'page_number': num_pages,
+                    'start': offset,
+                    'end': offset + len(page['text']),
+                    'extractor': page['extractor']
+                }
                 if page_text:
-                    result['pages'].append({
-                        'page_number': page_num,
-                        'text': page_text
-                    })
-                    result['text'] += page_text + '\n\n'
-                
-                # Extract tables if present
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        result['tables'].append({
-                            'page': page_num,
-                            'data': table
-                        })
+                    record['text'] = page['text']
+                pages.append(record)
+                texts.append(page['text'])
+                offset = record['end'] + len(PAGE_SEPARATOR)
         
-        return result
+        return {
+            'text': ''.join(text + PAGE_SEPARATOR for text in texts),
+            'pages': pages,
+            'metadata': {
+                'num_pages': num_pages,
+                'file_name': os.path.basename(pdf_path),
+                'extractors': dict(extractors),
+                'over_budget_pages': over_budget,
+                'skipped_pages': [page['page_number'] for page in over_budget if page['extractor'] == 'skipped']
+            },
+            'tables': tables
+        }
+    
+    def strip_boilerplate(self, content: Dict[str, Any],
+                          count: Optional[Callable[[str], int]] = None) -> Dict[str, Any]:
+        """
+        Remove running headers and footers from extracted content
+        
+        Lines recurring at the same position near the top or bottom of most
+        pages, such as a course code, instructor name, page number or
+        copyright line, are removed from every page, and the text and page
+        offsets are rebuilt. Documents with fewer than
+        ``BOILERPLATE_MIN_PAGES`` pages are returned unchanged.
+        
+        Args:
+            content: Extracted content, as from ``extract_text``
+            count: Token counter used to report the tokens stripped (optional)
+            
+        Returns:
+            Content with the boilerplate removed; ``metadata['boilerplate']``
+            gives the lines, characters and tokens (None without ``count``)
+            stripped
+        """
+        pages = content['pages']
+        texts = [page['text'] if 'text' in page else content['text'][page['start']:page['end']]
+                 for page in pages]
+        page_lines = [text.split('\n') for text in texts]
+        if len(pages) >= BOILERPLATE_MIN_PAGES:
+            drops = _boilerplate_lines(page_lines)
+        else:
+            drops = [set() for _ in pages]
+        
+        records = []
+        kept_texts = []
+        removed = []
+        offset = 0
+        for page, text, lines, drop in zip(pages, texts, page_lines, drops):
+            if drop:
+                removed.extend(lines[i] for i in sorted(drop))
+                text = '\n'.join(line for i, line in enumerate(lines) if i not in drop).strip()
+            if not text:
+                continue
+            record = dict(page, start=offset, end=offset + len(text))
+            if 'text' in page:
+                record['text'] = text
+            records.append(record)
+            kept_texts.append(text)
+            offset = record['end'] + len(PAGE_SEPARATOR)
+        
+        if not removed:
+            text = content['text']
+        else:
+            text = ''.join(kept + PAGE_SEPARATOR for kept in kept_texts)
+        tokens = None
+        if count is not None:
+            tokens = count('\n'.join(removed)) if removed else 0
+        return dict(
+            content,
+            text=text,
+            pages=records if removed else pages,
+            metadata=dict(content['metadata'], boilerplate={
+                'lines': len(removed),
+                'chars': len(content['text']) - len(text),
+                'tokens': tokens
+            })
+        )
     
     def extract_headings(self, text: str) -> List[str]:
         """
-        Extract potential headings from text
-        Simple heuristic: lines that are short and end without punctuation
+        Extract potential headings from plain text
+        
+        A fallback for text without layout, such as transcripts; PDFs get a
+        structured outline from ``extract_outline``. Headings are short lines
+        without closing punctuation that start with a capital or a section
+        number.
         
         Args:
             text: Text content to analyze
@@ -69,46 +920,140 @@ class PDFProcessor:
         Returns:
             List of potential headings
         """
-        lines = text.split('\n')
         headings = []
-        
-        for line in lines:
+        for line in text.split('\n'):
             line = line.strip()
-            # Heuristic: lines less than 100 chars, no period at end, not empty
-            if line and len(line) < 100 and not line.endswith('.'):
-                # Check if it looks like a heading (has some capitals)
-                if any(c.isupper() for c in line):
-                    headings.append(line)
-        
+            if not line or len(line) > MAX_HEADING_CHARS or len(line.split()) > 12:
+                continue
+            if line.endswith(('.', ',', ';', ':', '?', '!')):
+                continue
+            if line[0].isupper() or line[0].isdigit():
+                headings.append(line)
         return headings
     
-    def chunk_content(self, text: str, chunk_size: int = 2000) -> List[str]:
+    def extract_outline(self, pdf_path: str,
+                        pages: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
-        Split content into manageable chunks for processing
+        Extract a PDF's section tree
+        
+        The PDF's own bookmarks are used when it has any; otherwise headings
+        are found from the font size and weight of each text line, which
+        takes a pdfplumber layout pass over every page, under the same
+        per-page budgets as text extraction. With a cache, the headings are
+        cached by the file's content hash unless a page went over budget.
         
         Args:
-            text: Text to chunk
-            chunk_size: Maximum size of each chunk
+            pdf_path: Path to the PDF file
+            pages: The file's page records with text, as from ``iter_pages``
+                   (extracted if omitted); offsets refer to their text joined
+                   as in ``extract_text``
+                   
+        Returns:
+            Top-level sections, each with its title, level, page number,
+            start and end offsets in the document text, and child sections
+        """
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        if pages is None:
+            pages = list(self.iter_pages(pdf_path))
+        
+        page_starts = []
+        position = 0
+        for page in pages:
+            page_starts.append(position)
+            position += len(page['text']) + len(PAGE_SEPARATOR)
+        text = ''.join(page['text'] + PAGE_SEPARATOR for page in pages)
+        
+        key = None
+        headings = None
+        if self.cache is not None:
+            key = f"pdf-outline:v{EXTRACTOR_VERSION}:{self.max_page_objects}:{_file_digest(pdf_path)}"
+            value = self.cache.get(key)
+            if value is not None:
+                headings = [tuple(heading) for heading in json.loads(value)]
+        if headings is None:
+            headings = _bookmark_headings(pdf_path)
+            over_budget = False
+            if not headings:
+                headings, over_budget = _font_headings(pdf_path, self.page_timeout, self.max_page_objects)
+            if key is not None and not over_budget:
+                self.cache.set(key, json.dumps(headings))
+        
+        return _section_tree(headings, text, page_starts)
+    
+    def chunk_sections(self, text: str, sections: List[Dict[str, Any]],
+                       chunk_size: int = 2000) -> List[Dict[str, Any]]:
+        """
+        Split text into chunks that never cross a section boundary
+        
+        Every section start, at any level, begins a new chunk, so each chunk
+        belongs to exactly one (innermost) section and chunks do not overlap.
+        Sections longer than ``chunk_size`` are split at paragraph or word
+        breaks. Text ahead of the first section is a chunk with no title.
+        
+        Args:
+            text: Document text
+            sections: Section tree from ``extract_outline``
+            chunk_size: Maximum characters per chunk
             
         Returns:
-            List of text chunks
+            Chunks with their section title, start and end offsets, and text
         """
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for word in words:
-            word_size = len(word) + 1  # +1 for space
-            if current_size + word_size > chunk_size and current_chunk:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_size = word_size
-            else:
-                current_chunk.append(word)
-                current_size += word_size
-        
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        titles = {0: ('', 0)}
+        pending = list(sections)
+        while pending:
+            section = pending.pop()
+            pending.extend(section['children'])
+            if section['start'] not in titles or section['level'] > titles[section['start']][1]:
+                titles[section['start']] = (section['title'], section['level'])
+        starts = sorted(titles)
         
+        chunks = []
+        for i, span_start in enumerate(starts):
+            span_end = starts[i + 1] if i + 1 < len(starts) else len(text)
+            title = titles[span_start][0]
+            for start, end in _chunk_spans(text, chunk_size, start=span_start, end=span_end):
+                if text[start:end].strip():
+                    chunks.append({'title': title, 'start': start, 'end': end, 'text': text[start:end]})
         return chunks
+    
+    def iter_chunks(self, text: str, chunk_size: int = 2000, overlap: int = 0,
+                    count: Optional[Callable[[str], int]] = None) -> Iterator[Tuple[int, int]]:
+        """
+        Stream the offsets of chunks of a text
+        
+        Chunks end at a paragraph break when one falls in the second half of
+        the window, else at a sentence end, else between words, so memory
+        stays flat however long the text is and every chunk maps back to its
+        source position as ``text[start:end]``.
+        
+        Args:
+            text: Text to chunk
+            chunk_size: Maximum size of each chunk, in characters or, with
+                        ``count``, in tokens
+            overlap: Size repeated from the end of the previous chunk, in the
+                     same unit, starting at a sentence or word
+            count: Token counter, such as ``TokenBudget.count``
+            
+        Yields:
+            (start, end) offsets of each chunk
+        """
+        if chunk_size < 1 or not 0 <= overlap < chunk_size:
+            raise ValueError("chunk_size must be positive and overlap smaller than chunk_size")
+        return _chunk_spans(text, chunk_size, overlap, count)
+    
+    def chunk_content(self, text: str, chunk_size: int = 2000, overlap: int = 0,
+                      count: Optional[Callable[[str], int]] = None) -> List[str]:
+        """
+        Split content into manageable chunks for processing
+        
+        Args:
+            text: Text to chunk
+            chunk_size: Maximum size of each chunk (see ``iter_chunks``)
+            overlap: Size repeated from the end of the previous chunk
+            count: Token counter; sizes are then measured in tokens
+            
+        Returns:
+            List of text chunks, each a slice of ``text``
+        """
+        return [text[start:end] for start, end in self.iter_chunks(text, chunk_size, overlap, count)]
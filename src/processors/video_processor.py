@@ -4,6 +4,7 @@ import tempfile
 from typing import Dict, Optional
 import yt_dlp
 from openai import OpenAI
+from ..utils.providers import get_openai_client
 
 try:
     from moviepy.editor import VideoFileClip
@@ -129,23 +130,26 @@ class VideoProcessor:
         
         return info
     
-    def transcribe_audio(self, audio_path: str, api_key: str) -> str:
+    def transcribe_audio(self, audio_path: str, api_key: str,
+                         client: Optional[OpenAI] = None, model: str = "whisper-1") -> str:
         """
         Transcribe audio using OpenAI Whisper API
         
         Args:
             audio_path: Path to audio file
             api_key: OpenAI API key
+            client: Shared OpenAI client (optional)
+            model: Transcription model
             
         Returns:
             Transcribed text
         """
         try:
-            client = OpenAI(api_key=api_key)
+            client = client or get_openai_client(api_key)
             
             with open(audio_path, 'rb') as audio_file:
                 transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
+                    model=model,
                     file=audio_file,
                     response_format="text"
                 )
@@ -1,11 +1,22 @@
 """Main Study Material Automator Application"""
 import os
 import json
-from typing import Dict, List, Optional
+import difflib
+from typing import Dict, List, Optional, Tuple
 
 from .processors import PDFProcessor, VideoProcessor
+from .processors.pdf_processor import EXTRACTOR_VERSION
 from .generators import ModuleGenerator, DiagramGenerator, FlashcardGenerator, QuizGenerator
-from .utils import ContentAnalyzer, Config
+from .utils import ChunkIndex, ContentAnalyzer, Config, LLMClient, PersistentCache, StageScheduler
+from .utils.checkpoint import CheckpointStore, content_digest, file_digest
+from .utils.providers import FakeProvider, OpenAIProvider, get_openai_client
+from .utils.rate_limiter import RequestGovernor
+from .utils.resilience import CircuitBreaker
+from .utils.retrieval import tokenize
+from .utils.token_budget import TokenBudget
+
+# Directory under the output directory holding batch job and output files
+BATCH_DIRNAME = '.batch'
 
 
 class StudyMaterialAutomator:
@@ -27,29 +38,104 @@ class StudyMaterialAutomator:
             raise ValueError("Invalid configuration. Please set OPENAI_API_KEY.")
         
         # Initialize processors
-        self.pdf_processor = PDFProcessor()
+        pdf_cache = None
+        if self.config.pdf_cache_enabled:
+            pdf_cache = PersistentCache(
+                self.config.get_cache_path('pdf_pages.sqlite'),
+                max_bytes=self.config.pdf_cache_max_mb * 1024 * 1024
+            )
+        self.pdf_processor = PDFProcessor(
+            max_workers=self.config.pdf_max_workers,
+            parallel_min_pages=self.config.pdf_parallel_min_pages,
+            extractor=self.config.pdf_extractor,
+            extract_tables=self.config.pdf_extract_tables,
+            page_timeout=self.config.pdf_page_timeout,
+            max_page_objects=self.config.pdf_max_page_objects,
+            cache=pdf_cache
+        )
         self.video_processor = VideoProcessor(temp_dir=self.config.temp_dir)
         
+        # Shared completion client, pooled across the process, backed by the
+        # persistent response cache and paced to the API's rate limits; call
+        # types may be routed to a local OpenAI-compatible server instead
+        llm_cache = None
+        if self.config.llm_cache_enabled:
+            llm_cache = PersistentCache(
+                self.config.get_cache_path('llm_responses.sqlite'),
+                max_memory_entries=self.config.llm_cache_memory_entries,
+                max_bytes=self.config.llm_cache_max_mb * 1024 * 1024,
+                ttl_seconds=self.config.llm_cache_ttl_hours * 3600 or None
+            )
+        self.llm = LLMClient(
+            self.config.openai_api_key,
+            cache=llm_cache,
+            http_settings=self.config.get_http_settings(),
+            governor=RequestGovernor(
+                requests_per_minute=self.config.llm_requests_per_minute,
+                tokens_per_minute=self.config.llm_tokens_per_minute,
+                max_concurrency=self.config.llm_max_concurrency,
+                max_retries=self.config.llm_max_retries
+            ),
+            deadline_seconds=self.config.llm_call_deadline or None,
+            hedge_percentile=self.config.llm_hedge_percentile or None,
+            breaker=CircuitBreaker(
+                failure_threshold=self.config.llm_breaker_failures,
+                reset_timeout=self.config.llm_breaker_reset_seconds
+            ),
+            routes=self.config.model_routes,
+            providers={
+                'local': OpenAIProvider(
+                    self.config.local_llm_api_key,
+                    base_url=self.config.local_llm_base_url,
+                    http_settings=self.config.get_http_settings(),
+                    governor=RequestGovernor(max_concurrency=self.config.local_llm_max_concurrency),
+                    name='local'
+                ),
+                'fake': FakeProvider()
+            },
+            default_provider=self.config.llm_provider
+        )
+        
+        # Token budget shared by every prompt that embeds source content
+        self.budget = TokenBudget(
+            self.config.openai_model,
+            max_input_tokens=self.config.max_input_tokens,
+            output_reserve_tokens=self.config.output_reserve_tokens
+        )
+        
         # Initialize generators
         self.content_analyzer = ContentAnalyzer(
             api_key=self.config.openai_api_key,
-            model=self.config.openai_model
+            model=self.config.openai_model,
+            llm=self.llm,
+            mode=self.config.analysis_mode,
+            max_workers=self.config.analysis_max_workers,
+            budget=self.budget
         )
         self.module_generator = ModuleGenerator(
             api_key=self.config.openai_api_key,
-            model=self.config.openai_model
+            model=self.config.openai_model,
+            llm=self.llm,
+            budget=self.budget
         )
         self.diagram_generator = DiagramGenerator(
             api_key=self.config.openai_api_key,
-            model=self.config.openai_model
+            model=self.config.openai_model,
+            llm=self.llm
         )
         self.flashcard_generator = FlashcardGenerator(
             api_key=self.config.openai_api_key,
-            model=self.config.openai_model
+            model=self.config.openai_model,
+            llm=self.llm,
+            budget=self.budget,
+            shard_size=self.config.generation_shard_size
         )
         self.quiz_generator = QuizGenerator(
             api_key=self.config.openai_api_key,
-            model=self.config.openai_model
+            model=self.config.openai_model,
+            llm=self.llm,
+            budget=self.budget,
+            shard_size=self.config.generation_shard_size
         )
     
     def process_pdf(self, pdf_path: str) -> Dict:
@@ -65,6 +151,19 @@ class StudyMaterialAutomator:
         print(f"Processing PDF: {pdf_path}")
         content = self.pdf_processor.extract_text(pdf_path)
         print(f"Extracted {len(content['text'])} characters from {content['metadata']['num_pages']} pages")
+        extractors = content['metadata'].get('extractors')
+        if extractors:
+            print("  Pages per extractor: " + ", ".join(f"{name} {count}" for name, count in sorted(extractors.items())))
+        for page in content['metadata'].get('over_budget_pages', []):
+            outcome = 'skipped' if page['extractor'] == 'skipped' else f"used {page['extractor']}"
+            print(f"  Warning: page {page['page_number']} over its {page['reason']} budget, {outcome}")
+        if self.config.pdf_strip_boilerplate:
+            content = self.pdf_processor.strip_boilerplate(content, count=self.budget.count)
+            stripped = content['metadata']['boilerplate']
+            if stripped['lines']:
+                print(f"  Stripped {stripped['lines']} repeated header/footer lines from "
+                      f"{content['metadata']['file_name']}: {stripped['chars']} characters, "
+                      f"{stripped['tokens']} tokens")
         return content
     
     def process_video(self, video_source: str, extract_audio: bool = True) -> Dict:
@@ -104,7 +203,9 @@ class StudyMaterialAutomator:
                 print("Transcribing audio...")
                 transcript = self.video_processor.transcribe_audio(
                     audio_path,
-                    self.config.openai_api_key
+                    self.config.openai_api_key,
+                    client=self._transcription_client(),
+                    model=self.config.model_routes['transcription'].model or "whisper-1"
                 )
                 content['transcript'] = transcript
                 print(f"Transcribed {len(transcript)} characters")
@@ -113,6 +214,13 @@ class StudyMaterialAutomator:
         
         return content
     
+    def _transcription_client(self):
+        """OpenAI client for transcription, pointed at a local server when the route says so"""
+        provider = self.llm.provider_for('transcription')
+        if isinstance(provider, OpenAIProvider) and provider.base_url:
+            return provider.client
+        return get_openai_client(self.config.openai_api_key, **self.config.get_http_settings())
+    
     def analyze_content(self, content: str) -> Dict:
         """
         Analyze content to extract structure and concepts
@@ -138,6 +246,36 @@ class StudyMaterialAutomator:
             analysis: Content analysis results
             output_dir: Directory to save outputs (optional)
             
+        Returns:
+            Dictionary with paths to generated materials
+        """
+        return self._run_generation(content, output_dir, analysis=analysis)
+    
+    def _run_generation(self, content: str, output_dir: Optional[str] = None,
+                        analysis: Optional[Dict] = None,
+                        checkpoints: Optional[CheckpointStore] = None,
+                        sections: Optional[List[Dict]] = None) -> Dict:
+        """
+        Run the generation stages as a dependency graph
+        
+        Module quizzes wait only for their own module, diagrams and modules
+        wait for the analysis, and flashcards and the comprehensive quiz only
+        need the raw content. Independent stages run concurrently, up to
+        ``config.max_parallel_stages`` at a time.
+        
+        When retrieval is enabled, a chunk index over the content is built
+        once per run: each module prompt gets the chunks most relevant to its
+        topic and concepts, and flashcards and the comprehensive quiz get
+        chunks spread across the whole document. Given the content's section
+        tree, chunks follow section boundaries.
+        
+        Args:
+            content: Source content
+            output_dir: Directory to save outputs (optional)
+            analysis: Content analysis results; analyzed as a stage if omitted
+            checkpoints: Store used to reuse and record completed units (optional)
+            sections: Section tree of the content (optional)
+            
         Returns:
             Dictionary with paths to generated materials
         """
@@ -146,64 +284,163 @@ class StudyMaterialAutomator:
         
         os.makedirs(output_dir, exist_ok=True)
         
-        results = {
-            'modules': [],
-            'diagrams': [],
-            'flashcards': [],
-            'quizzes': []
-        }
-        
-        # Generate modules
-        print("\nGenerating learning modules...")
-        modules = self.module_generator.generate_modules(content, analysis)
-        
-        for i, module in enumerate(modules, 1):
-            module_path = os.path.join(output_dir, f"module_{i}.txt")
+        model = self.config.openai_model
+        scheduler = StageScheduler(max_workers=self.config.max_parallel_stages)
+        module_paths = {}
+        module_quiz_paths = {}
+        diagram_paths = []
+        flashcard_paths = []
+        overall_quiz_paths = []
+        
+        def build_index():
+            if not self.config.retrieval_enabled:
+                return None
+            return ChunkIndex.from_text(
+                content, chunk_size=self.config.retrieval_chunk_size, budget=self.budget,
+                sections=sections
+            )
+        
+        def relevant_content(index, query):
+            if index is None or index.total_size <= self.budget.content_tokens:
+                return content
+            return index.context_for(query, self.budget.content_tokens)
+        
+        def covering_content(index):
+            if index is None or index.total_size <= self.budget.content_tokens:
+                return content
+            return index.coverage(self.budget.content_tokens)
+        
+        def build_module(module_number, module_name, concepts, index):
+            module_content = relevant_content(index, self._module_query(module_name, concepts))
+            module = self._checkpointed(
+                checkpoints, f"module_{module_number}",
+                lambda: self.module_generator._create_module(
+                    module_name=module_name,
+                    module_number=module_number,
+                    content=module_content,
+                    concepts=concepts
+                ),
+                keep=lambda m: bool(m.get('sections') or m.get('introduction')),
+                digest=content_digest(
+                    model, module_name, module_number, concepts,
+                    self.module_generator.source_excerpt(module_content)
+                )
+            )
+            module_path = os.path.join(output_dir, f"module_{module_number}.txt")
             self.module_generator.export_module(module, module_path)
-            results['modules'].append(module_path)
-            print(f"  Created module {i}: {module.get('title', 'Untitled')}")
-            
-            # Generate quiz for each module
-            quiz = self.quiz_generator.generate_module_quiz(module)
-            quiz_path = os.path.join(output_dir, f"module_{i}_quiz.txt")
+            module_paths[module_number] = module_path
+            print(f"  Created module {module_number}: {module.get('title', 'Untitled')}")
+            return module
+        
+        def build_module_quiz(module_number, module):
+            quiz = self._checkpointed(
+                checkpoints, f"module_{module_number}_quiz",
+                lambda: self.quiz_generator.generate_module_quiz(module),
+                keep=lambda q: bool(q.get('questions')),
+                digest=content_digest(model, module)
+            )
+            quiz_path = os.path.join(output_dir, f"module_{module_number}_quiz.txt")
             self.quiz_generator.export_quiz(quiz, quiz_path, format='txt')
-            results['quizzes'].append(quiz_path)
-            print(f"  Created quiz for module {i}")
-        
-        # Generate diagrams for main concepts
-        print("\nGenerating concept diagrams...")
-        concepts = analysis.get('concepts', {})
-        diagram_count = 0
-        for topic, topic_concepts in list(concepts.items())[:3]:  # Limit to 3 topics
-            if topic_concepts:
-                diagram_path = os.path.join(output_dir, f"diagram_{topic.replace(' ', '_')}.png")
-                try:
-                    self.diagram_generator.generate_concept_diagram(
-                        topic, topic_concepts[:6], diagram_path
-                    )
-                    results['diagrams'].append(diagram_path)
-                    diagram_count += 1
-                    print(f"  Created diagram: {topic}")
-                except Exception as e:
-                    print(f"  Could not create diagram for {topic}: {e}")
-        
-        # Generate flashcards
-        print("\nGenerating flashcards...")
-        flashcards = self.flashcard_generator.generate_flashcards(content, num_cards=20)
-        
-        if flashcards:
-            flashcard_path = os.path.join(output_dir, "flashcards.txt")
-            self.flashcard_generator.export_flashcards(flashcards, flashcard_path, format='txt')
-            results['flashcards'].append(flashcard_path)
-            print(f"  Created {len(flashcards)} flashcards")
-        
-        # Generate overall quiz
-        print("\nGenerating comprehensive quiz...")
-        overall_quiz = self.quiz_generator.generate_quiz(content, num_questions=15)
-        overall_quiz_path = os.path.join(output_dir, "comprehensive_quiz.txt")
-        self.quiz_generator.export_quiz(overall_quiz, overall_quiz_path, format='txt')
-        results['quizzes'].append(overall_quiz_path)
-        print(f"  Created comprehensive quiz with {len(overall_quiz.get('questions', []))} questions")
+            module_quiz_paths[module_number] = quiz_path
+            print(f"  Created quiz for module {module_number}")
+        
+        def build_diagrams(analysis):
+            # pyplot keeps global figure state, so diagrams are drawn one
+            # after another inside a single stage
+            concepts = analysis.get('concepts', {})
+            for i, (topic, topic_concepts) in enumerate(list(concepts.items())[:3], 1):  # Limit to 3 topics
+                if topic_concepts:
+                    diagram_path = os.path.join(output_dir, f"diagram_{topic.replace(' ', '_')}.png")
+                    unit = f"diagram_{i}"
+                    digest = content_digest(topic, topic_concepts[:6])
+                    if (checkpoints is not None and os.path.exists(diagram_path)
+                            and checkpoints.load(unit, digest) is not None):
+                        diagram_paths.append(diagram_path)
+                        print(f"  Reused diagram: {topic}")
+                        continue
+                    try:
+                        self.diagram_generator.generate_concept_diagram(
+                            topic, topic_concepts[:6], diagram_path
+                        )
+                        diagram_paths.append(diagram_path)
+                        if checkpoints is not None:
+                            checkpoints.save(unit, {'path': os.path.basename(diagram_path)}, digest)
+                        print(f"  Created diagram: {topic}")
+                    except Exception as e:
+                        print(f"  Could not create diagram for {topic}: {e}")
+        
+        def build_flashcards(index):
+            flashcard_content = covering_content(index)
+            # a deck missing a failed shard's cards is used for this run but
+            # not checkpointed, so a resumed run requests it again
+            flashcard_set = self._checkpointed(
+                checkpoints, "flashcards",
+                lambda: self.flashcard_generator.generate_flashcard_set(flashcard_content, num_cards=20),
+                keep=lambda deck: deck.get('complete', False) and bool(deck.get('flashcards')),
+                digest=content_digest('set', model, 20, self.flashcard_generator.shard_size,
+                                      self.flashcard_generator.source_excerpt(flashcard_content))
+            )
+            flashcards = flashcard_set['flashcards']
+            
+            if flashcards:
+                flashcard_path = os.path.join(output_dir, "flashcards.txt")
+                self.flashcard_generator.export_flashcards(flashcards, flashcard_path, format='txt')
+                flashcard_paths.append(flashcard_path)
+                print(f"  Created {len(flashcards)} flashcards")
+        
+        def build_overall_quiz(index):
+            quiz_content = covering_content(index)
+            overall_quiz = self._checkpointed(
+                checkpoints, "comprehensive_quiz",
+                lambda: self.quiz_generator.generate_quiz(quiz_content, num_questions=15),
+                keep=lambda q: q.get('complete', False) and bool(q.get('questions')),
+                digest=content_digest(model, 15, self.quiz_generator.shard_size,
+                                      self.quiz_generator.source_excerpt(quiz_content))
+            )
+            overall_quiz_path = os.path.join(output_dir, "comprehensive_quiz.txt")
+            self.quiz_generator.export_quiz(overall_quiz, overall_quiz_path, format='txt')
+            overall_quiz_paths.append(overall_quiz_path)
+            print(f"  Created comprehensive quiz with {len(overall_quiz.get('questions', []))} questions")
+        
+        def plan_stages(analysis):
+            concepts = analysis.get('concepts', {})
+            module_names = self.module_generator.plan_modules(analysis)
+            for i, module_name in enumerate(module_names, 1):
+                scheduler.add_stage(
+                    f"module_{i}",
+                    lambda index, i=i, name=module_name: build_module(i, name, concepts, index),
+                    depends_on=["index"]
+                )
+                scheduler.add_stage(
+                    f"module_{i}_quiz",
+                    lambda module, i=i: build_module_quiz(i, module),
+                    depends_on=[f"module_{i}"]
+                )
+            scheduler.add_stage("diagrams", lambda: build_diagrams(analysis))
+            return analysis
+        
+        print("\nGenerating study materials...")
+        scheduler.add_stage("index", build_index)
+        if analysis is None:
+            scheduler.add_stage("analysis", lambda: plan_stages(self._checkpointed(
+                checkpoints, "analysis",
+                lambda: self.analyze_content(content),
+                keep=lambda a: bool(a.get('main_topics') or a.get('module_structure')),
+                digest=content_digest(model, self.content_analyzer.source_excerpt(content))
+            )))
+        else:
+            scheduler.add_stage("analysis", lambda: plan_stages(analysis))
+        scheduler.add_stage("flashcards", build_flashcards, depends_on=["index"])
+        scheduler.add_stage("comprehensive_quiz", build_overall_quiz, depends_on=["index"])
+        
+        analysis = scheduler.run()["analysis"]
+        
+        results = {
+            'modules': [module_paths[i] for i in sorted(module_paths)],
+            'diagrams': diagram_paths,
+            'flashcards': flashcard_paths,
+            'quizzes': [module_quiz_paths[i] for i in sorted(module_quiz_paths)] + overall_quiz_paths
+        }
         
         # Save summary
         summary = {
@@ -215,6 +452,8 @@ class StudyMaterialAutomator:
         }
         
         summary_path = os.path.join(output_dir, "summary.json")
+        if checkpoints is not None:
+            self._remove_stale_outputs(summary_path, summary)
         with open(summary_path, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2, ensure_ascii=False)
         
@@ -223,19 +462,296 @@ class StudyMaterialAutomator:
         print(f"  - {len(results['diagrams'])} diagrams")
         print(f"  - {len(results['flashcards'])} flashcard sets")
         print(f"  - {len(results['quizzes'])} quizzes")
+        if self.llm.cache is not None:
+            cache_stats = self.llm.cache.stats()
+            print(f"  - LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        shared_calls = self.llm.single_flight.stats()['shared']
+        if shared_calls:
+            print(f"  - LLM calls saved by sharing in-flight requests: {shared_calls}")
+        llm_stats = self.llm.stats()
+        if llm_stats['hedged']:
+            print(f"  - Hedged slow LLM calls: {llm_stats['hedged']} ({llm_stats['hedge_wins']} won by the hedge)")
+        if llm_stats['fallbacks']:
+            print(f"  - LLM calls sent to a fallback model over the latency SLO: {llm_stats['fallbacks']}")
+        governor_stats = self.llm.governor.stats()
+        if governor_stats['retries']:
+            print(f"  - API retries: {governor_stats['retries']} ({governor_stats['throttled']} rate limited)")
+        for call_type, usage in sorted(self.llm.usage().items()):
+            if usage['prompt_tokens']:
+                print(f"  - {call_type} prompts: {usage['cached_tokens']} of {usage['prompt_tokens']} "
+                      f"tokens served from the provider's prompt cache ({usage['calls']} calls)")
+        
+        return results
+    
+    @staticmethod
+    def _module_query(module_name: str, concepts: Dict) -> str:
+        """
+        Build the retrieval query for a module
+        
+        The module name is combined with the concepts of the analysis topic
+        whose name shares the most words with it.
+        
+        Args:
+            module_name: Name of the module
+            concepts: Concepts per topic from the analysis
+            
+        Returns:
+            Query text
+        """
+        module_terms = set(tokenize(module_name))
+        best_topic, best_overlap = None, 0
+        for topic in concepts:
+            overlap = len(module_terms & set(tokenize(topic)))
+            if overlap > best_overlap:
+                best_topic, best_overlap = topic, overlap
+        
+        topic_concepts = concepts.get(best_topic) or []
+        return ' '.join([module_name] + [str(concept) for concept in topic_concepts])
+    
+    @staticmethod
+    def _checkpointed(checkpoints: Optional[CheckpointStore], unit: str,
+                      compute, keep=bool, digest: Optional[str] = None):
+        """
+        Load a unit from its checkpoint, or compute and checkpoint it
+        
+        Args:
+            checkpoints: Checkpoint store (optional)
+            unit: Unit name
+            compute: Callable producing the unit output
+            keep: Predicate deciding whether an output is worth checkpointing;
+                  fallbacks produced after an API error are not, so that a
+                  re-run retries them
+            digest: Digest of the unit's inputs; checkpoints built from other
+                    inputs are rebuilt
+                    
+        Returns:
+            Unit output
+        """
+        if checkpoints is not None:
+            value = checkpoints.load(unit, digest)
+            if value is not None:
+                print(f"  Reused {unit} from checkpoint")
+                return value
+        
+        value = compute()
+        if checkpoints is not None and keep(value):
+            checkpoints.save(unit, value, digest)
+        return value
+    
+    @staticmethod
+    def _remove_stale_outputs(summary_path: str, summary: Dict):
+        """Delete files listed by an earlier summary that the new run no longer produces"""
+        try:
+            with open(summary_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return
+        
+        output_dir = os.path.dirname(summary_path)
+        for category in ('modules', 'diagrams', 'flashcards', 'quizzes'):
+            for filename in set(previous.get(category, [])) - set(summary[category]):
+                path = os.path.join(output_dir, os.path.basename(filename))
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    @staticmethod
+    def _diff_pages(old_hashes: List[str], new_hashes: List[str]) -> Dict:
+        """
+        Compare the page hashes of two versions of a document
+        
+        Args:
+            old_hashes: Page hashes from the earlier run
+            new_hashes: Page hashes from this run
+            
+        Returns:
+            Counts of changed, added and removed pages, and the changed or
+            added page positions in the new version (1-based)
+        """
+        diff = {'changed': 0, 'added': 0, 'removed': 0, 'pages': []}
+        matcher = difflib.SequenceMatcher(a=old_hashes, b=new_hashes, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            old_count, new_count = i2 - i1, j2 - j1
+            diff['changed'] += min(old_count, new_count)
+            diff['added'] += max(new_count - old_count, 0)
+            diff['removed'] += max(old_count - new_count, 0)
+            diff['pages'].extend(range(j1 + 1, j2 + 1))
+        return diff
+    
+    def _collect_content(self, sources: List[Dict],
+                         checkpoints: CheckpointStore) -> Tuple[str, List[Dict]]:
+        """
+        Extract the text of every source, reusing checkpointed extractions
+        
+        Per-page hashes are recorded on each PDF source and compared with the
+        previous run's, and the resulting page diff is stored on the source.
+        When outlines are enabled, each PDF's section tree is extracted too and
+        its offsets are moved to where the PDF's text sits in the combined text.
+        
+        Args:
+            sources: Source descriptions
+            checkpoints: Checkpoint store
+            
+        Returns:
+            Combined text content, and the top-level sections of every PDF
+        """
+        previous = {source['name']: source for source in checkpoints.get_sources()}
+        all_content = ""
+        sections = []
+        
+        for source in sources:
+            if source['type'] == 'pdf':
+                pages = self._checkpointed(
+                    checkpoints, f"pdf_{source['digest'][:16]}",
+                    lambda: self.process_pdf(source['path'])['pages'],
+                    digest=self._extraction_digest(source)
+                )
+                source['page_hashes'] = [content_digest(page['text']) for page in pages]
+                
+                old = previous.get(source['name'])
+                if old is None and previous:
+                    source['page_diff'] = self._diff_pages([], source['page_hashes'])
+                elif old is not None and old.get('digest') != source['digest']:
+                    source['page_diff'] = self._diff_pages(old.get('page_hashes', []), source['page_hashes'])
+                else:
+                    source.pop('page_diff', None)
+                if source.get('page_diff'):
+                    diff = source['page_diff']
+                    print(f"  {source['name']}: {diff['changed']} pages changed, "
+                          f"{diff['added']} added, {diff['removed']} removed")
+                
+                if self.config.pdf_outline_enabled:
+                    sections.extend(self._shift_sections(
+                        self._pdf_outline(source, pages, checkpoints), len(all_content)
+                    ))
+                all_content += ''.join(page['text'] + '\n\n' for page in pages) + "\n\n"
+            
+            elif source['type'] == 'video':
+                transcript = self._checkpointed(
+                    checkpoints, "transcript",
+                    lambda: self.process_video(source['source']).get('transcript', ''),
+                    digest=source['digest']
+                )
+                all_content += transcript + "\n\n"
+        
+        checkpoints.set_sources(sources)
+        return all_content, sections
+    
+    def _extraction_digest(self, source: Dict) -> str:
+        """Digest of a PDF source and every setting that shapes its extracted pages"""
+        processor = self.pdf_processor
+        return content_digest(
+            source['digest'], EXTRACTOR_VERSION, processor.extractor, processor.extract_tables,
+            processor.page_timeout, processor.max_page_objects, self.config.pdf_strip_boilerplate
+        )
+    
+    def _pdf_outline(self, source: Dict, pages: List[Dict], checkpoints: CheckpointStore) -> List[Dict]:
+        """Extract a PDF source's section tree, reusing its checkpoint"""
+        try:
+            outline = self._checkpointed(
+                checkpoints, f"outline_{source['digest'][:16]}",
+                lambda: self.pdf_processor.extract_outline(source['path'], pages),
+                keep=lambda sections: sections is not None,
+                digest=self._extraction_digest(source)
+            )
+        except Exception as e:
+            print(f"  Could not extract the outline of {source['name']}: {e}")
+            return []
+        if outline:
+            print(f"  {source['name']}: {len(outline)} top-level sections")
+        return outline
+    
+    @classmethod
+    def _shift_sections(cls, sections: List[Dict], offset: int) -> List[Dict]:
+        """Copy a section tree with its offsets moved by ``offset`` characters"""
+        return [
+            dict(section, start=section['start'] + offset, end=section['end'] + offset,
+                 children=cls._shift_sections(section['children'], offset))
+            for section in sections
+        ]
+    
+    @staticmethod
+    def _pdf_source(pdf_path: str) -> Dict:
+        """Describe a PDF input"""
+        return {
+            'type': 'pdf',
+            'name': os.path.basename(pdf_path),
+            'path': pdf_path,
+            'digest': file_digest(pdf_path)
+        }
+    
+    @staticmethod
+    def _video_source(video_source: str) -> Dict:
+        """Describe a video input"""
+        if os.path.exists(video_source):
+            digest = file_digest(video_source)
+        else:
+            digest = content_digest(video_source)
+        return {
+            'type': 'video',
+            'name': video_source,
+            'source': video_source,
+            'digest': digest
+        }
+    
+    def _process_sources(self, sources: List[Dict], output_dir: str,
+                         checkpoints: CheckpointStore, batch: bool = False) -> Dict:
+        """Extract content from sources and run generation against the checkpoints"""
+        all_content, sections = self._collect_content(sources, checkpoints)
+        
+        if not all_content.strip():
+            raise ValueError("No content could be extracted from input sources")
+        
+        # Analyze content and generate study materials; the analysis runs as
+        # a stage so that content-only stages don't wait for it
+        def generate():
+            return self._run_generation(all_content, output_dir, checkpoints=checkpoints,
+                                        sections=sections)
+        
+        if batch:
+            results = self.llm.run_batched(
+                generate,
+                job_dir=os.path.join(output_dir, BATCH_DIRNAME),
+                poll_interval=self.config.batch_poll_seconds,
+                max_rounds=self.config.batch_max_rounds,
+                timeout=self.config.batch_timeout_hours * 3600 or None
+            )
+        else:
+            results = generate()
+        
+        checkpoints.mark_complete({
+            'page_diffs': {
+                source['name']: source['page_diff']
+                for source in sources if source.get('page_diff')
+            },
+            'rebuilt': sorted(set(checkpoints.rebuilt)),
+            'reused': sorted(set(checkpoints.reused))
+        })
         
         return results
     
     def process_materials(self, pdf_path: Optional[str] = None,
                         video_source: Optional[str] = None,
-                        output_dir: Optional[str] = None) -> Dict:
+                        output_dir: Optional[str] = None,
+                        resume: bool = True, batch: bool = False) -> Dict:
         """
         Process input materials and generate study materials
         
+        Each completed unit is checkpointed in the output directory, so a
+        re-run with the same inputs picks up where an interrupted run stopped.
+        
+        In batch mode, for bulk reprocessing where latency does not matter,
+        completion requests are submitted as JSONL jobs through each
+        provider's batch interface, in rounds (analysis, then modules, then
+        their quizzes), and the answers are exported as in a normal run.
+        
         Args:
             pdf_path: Path to PDF file (optional)
             video_source: Video file path or URL (optional)
             output_dir: Output directory (optional)
+            resume: Whether to reuse checkpoints from an earlier run
+            batch: Whether to answer completion requests through batch jobs
             
         Returns:
             Results dictionary
@@ -243,24 +759,56 @@ class StudyMaterialAutomator:
         if not pdf_path and not video_source:
             raise ValueError("Must provide at least one input source (PDF or video)")
         
-        # Collect content from all sources
-        all_content = ""
+        if not output_dir:
+            output_dir = self.config.output_dir
+        os.makedirs(output_dir, exist_ok=True)
         
+        sources = []
         if pdf_path:
-            pdf_content = self.process_pdf(pdf_path)
-            all_content += pdf_content['text'] + "\n\n"
-        
+            sources.append(self._pdf_source(pdf_path))
         if video_source:
-            video_content = self.process_video(video_source)
-            all_content += video_content.get('transcript', '') + "\n\n"
+            sources.append(self._video_source(video_source))
         
-        if not all_content.strip():
-            raise ValueError("No content could be extracted from input sources")
+        checkpoints = CheckpointStore(output_dir, resume=resume)
+        return self._process_sources(sources, output_dir, checkpoints, batch=batch)
+    
+    def update_materials(self, output_dir: str, pdf_path: Optional[str] = None,
+                         video_source: Optional[str] = None) -> Dict:
+        """
+        Incrementally regenerate an earlier run after its sources change
         
-        # Analyze content
-        analysis = self.analyze_content(all_content)
+        A PDF with the same file name as an existing source replaces it (a
+        revised version); any other PDF is added to the run. Pages are hashed
+        and diffed against the previous run, and only the units whose inputs
+        draw on changed text are regenerated; everything else, including
+        diagrams, is reused and the output directory is updated in place.
         
-        # Generate study materials
-        results = self.generate_study_materials(all_content, analysis, output_dir)
+        Args:
+            output_dir: Output directory of the earlier run
+            pdf_path: Revised or additional PDF file (optional)
+            video_source: Replacement or additional video (optional)
+            
+        Returns:
+            Results dictionary
+        """
+        checkpoints = CheckpointStore(output_dir)
+        sources = checkpoints.get_sources()
+        if not sources:
+            raise ValueError(f"No earlier run found in {output_dir}")
         
-        return results
+        updates = []
+        if pdf_path:
+            updates.append(self._pdf_source(pdf_path))
+        if video_source:
+            updates.append(self._video_source(video_source))
+        
+        for update in updates:
+            for i, source in enumerate(sources):
+                same_pdf = update['type'] == 'pdf' and source['type'] == 'pdf' and source['name'] == update['name']
+                if same_pdf or update['type'] == source['type'] == 'video':
+                    sources[i] = update
+                    break
+            else:
+                sources.append(update)
+        
+        return self._process_sources(sources, output_dir, checkpoints)
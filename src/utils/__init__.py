@@ -1,5 +1,10 @@
 """Utility functions and helpers"""
 from .content_analyzer import ContentAnalyzer
 from .config import Config
+from .llm_client import LLMClient
+from .cache import PersistentCache
+from .scheduler import StageScheduler
+from .retrieval import ChunkIndex
+from .token_budget import TokenBudget
 
-__all__ = ['ContentAnalyzer', 'Config']
+__all__ = ['ContentAnalyzer', 'Config', 'LLMClient', 'PersistentCache', 'StageScheduler', 'ChunkIndex', 'TokenBudget']
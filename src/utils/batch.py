@@ -0,0 +1,203 @@
+"""Batch submission of completion requests for bulk, non-interactive runs"""
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from .providers import BATCH_ENDPOINT, Provider
+
+# Batch states after which a batch makes no further progress
+FINAL_STATES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchDeferred(BaseException):
+    """
+    Raised by a completion call that was queued for the next batch instead of sent
+    
+    It derives from ``BaseException`` so that the generators' fallback
+    handlers (``except Exception``) let it through: a stage waiting on a
+    queued answer stops, rather than exporting a fallback.
+    """
+
+
+class BatchError(Exception):
+    """A batch, or one request of it, produced no answer"""
+
+
+class BatchCollector:
+    """
+    Queues the completion requests of a pipeline run and serves batch answers
+    
+    While attached to an ``LLMClient``, every call that misses the response
+    cache is answered from an earlier batch when possible, and otherwise
+    queued for the next one and deferred. Identical requests are queued once.
+    """
+    
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def answer(self, key: str, provider: Provider, call_type: str, request: Dict) -> str:
+        """
+        Get the batch answer to a request, queuing the request if there is none yet
+        
+        Args:
+            key: Cache key of the request
+            provider: Provider the request is routed to
+            call_type: Kind of call (analysis, module, quiz, ...)
+            request: Chat completion arguments
+            
+        Returns:
+            Response text
+            
+        Raises:
+            BatchDeferred: The request was queued for the next batch
+            BatchError: The request failed in its batch
+        """
+        with self._lock:
+            if key in self.results:
+                return self.results[key]
+            if key in self.errors:
+                raise BatchError(self.errors[key])
+            self._pending.setdefault(key, (provider, call_type, request))
+        raise BatchDeferred(key)
+    
+    def take(self) -> Dict[str, Tuple[Provider, Dict[str, Dict]]]:
+        """
+        Remove the queued requests
+        
+        Returns:
+            Mapping of provider name to the provider and its requests by custom id
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        jobs = {}
+        for key, (provider, call_type, request) in pending.items():
+            jobs.setdefault(provider.name, (provider, {}))[1][custom_id(call_type, key)] = request
+        return jobs
+    
+    def add_results(self, custom_ids, output: str):
+        """
+        Record the answers of a finished batch
+        
+        Requests of the batch that have no answer in ``output`` are recorded
+        as failed, so that their callers fall back instead of queuing them again.
+        
+        Args:
+            custom_ids: Custom ids of the requests submitted in the batch
+            output: Batch output in JSONL form
+        """
+        contents, errors = read_results(output)
+        with self._lock:
+            for cid in custom_ids:
+                key = cid.split(':', 1)[1]
+                if cid in contents:
+                    self.results[key] = contents[cid]
+                else:
+                    self.errors[key] = errors.get(cid, "No answer in batch output")
+
+
+def in_current_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a function to run, in any thread, in a copy of the caller's context
+    
+    A batch run is tied to the call stack that started it through a context
+    variable; worker threads started by the pipeline run their tasks through
+    this wrapper so that they belong to the same run, while unrelated
+    threads sharing the client do not.
+    
+    Args:
+        func: Function to wrap
+        
+    Returns:
+        Wrapper running each call in its own copy of the current context
+    """
+    context = contextvars.copy_context()
+    
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+def custom_id(call_type: str, key: str) -> str:
+    """Batch line id of a request; the call type prefix lets a local stand-in answer per call type"""
+    return f"{call_type}:{key}"
+
+
+def write_job(path: str, requests: Dict[str, Dict]) -> str:
+    """
+    Write a JSONL job file in the OpenAI batch input format
+    
+    Args:
+        path: Job file path
+        requests: Chat completion arguments by custom id
+        
+    Returns:
+        The job file path
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for cid, request in requests.items():
+            line = {'custom_id': cid, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': request}
+            f.write(json.dumps(line, ensure_ascii=False) + '\n')
+    return path
+
+
+def read_results(output: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Parse batch output in the OpenAI batch output format
+    
+    Args:
+        output: Batch output in JSONL form
+        
+    Returns:
+        Response text by custom id, and error messages by custom id
+    """
+    contents = {}
+    errors = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        cid = result.get('custom_id')
+        response = result.get('response') or {}
+        try:
+            if response.get('status_code') != 200:
+                raise ValueError(f"status {response.get('status_code')}")
+            contents[cid] = response['body']['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            error = result.get('error') or {}
+            errors[cid] = error.get('message') or f"Unusable batch response: {e}"
+    return contents, errors
+
+
+def wait_for_batch(provider: Provider, batch_id: str, poll_interval: float = 60.0,
+                   timeout: Optional[float] = None) -> str:
+    """
+    Poll a batch until it finishes and get its output
+    
+    Args:
+        provider: Provider the batch was submitted to
+        batch_id: Batch id returned by ``submit_batch``
+        poll_interval: Seconds between status checks
+        timeout: Seconds to wait before giving up (None waits for the provider)
+        
+    Returns:
+        Batch output in JSONL form; expired batches give the part that finished
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        status = provider.batch_status(batch_id)
+        if status in FINAL_STATES:
+            break
+        if deadline is not None and time.monotonic() + poll_interval > deadline:
+            raise BatchError(f"Batch {batch_id} still {status} after {timeout:.0f}s")
+        time.sleep(poll_interval)
+    if status == 'failed':
+        raise BatchError(f"Batch {batch_id} failed")
+    return provider.batch_results(batch_id)
@@ -0,0 +1,154 @@
+"""Persistent key-value cache with an in-memory LRU front tier"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class PersistentCache:
+    """
+    Caches string values in SQLite behind an in-memory LRU
+    
+    Entries older than ``ttl_seconds`` are treated as misses and removed, and
+    the least recently used entries are evicted once the on-disk store grows
+    past ``max_bytes``. The cache is safe to share between threads, and
+    several processes may point at the same file.
+    """
+    
+    def __init__(self, path: str, max_memory_entries: int = 256,
+                 max_bytes: int = 512 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'evictions': 0}
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON entries (accessed_at)")
+        self._conn.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a value
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            Cached value, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return entry[0]
+            
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._memory.pop(key, None)
+                self._stats['misses'] += 1
+                return None
+            
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, row[0], row[1])
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            return row[0]
+    
+    def set(self, key: str, value: str):
+        """
+        Store a value
+        
+        Args:
+            key: Cache key
+            value: Value to store
+        """
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+            self._remember(key, value, now)
+    
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+    
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss/eviction counters"""
+        with self._lock:
+            return dict(self._stats)
+    
+    def _expired(self, created_at: float, now: float) -> bool:
+        """Check whether an entry has outlived the TTL"""
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+    
+    def _remember(self, key: str, value: str, created_at: float):
+        """Add an entry to the memory tier, evicting the least recently used"""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._stats['evictions'] += max(cursor.rowcount, 0)
+        
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        self._stats['evictions'] += len(evicted)
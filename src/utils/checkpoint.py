@@ -0,0 +1,181 @@
+"""Checkpointing of pipeline stage outputs for resumable runs"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+MANIFEST_FILENAME = 'run_manifest.json'
+CHECKPOINT_DIRNAME = '.checkpoints'
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 digest of a file
+    
+    Args:
+        path: Path to the file
+        chunk_size: Bytes read per iteration
+        
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_digest(*parts: Any) -> str:
+    """
+    Compute a stable SHA-256 digest of JSON-serializable values
+    
+    Args:
+        *parts: Values to fingerprint
+        
+    Returns:
+        Hex digest of the values
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """
+    Persists completed pipeline units alongside a run manifest
+    
+    Each unit (the transcript, the analysis, a module, a quiz, ...) is saved
+    as JSON under ``<output_dir>/.checkpoints`` as soon as it finishes, and
+    ``run_manifest.json`` records which units are done together with a digest
+    of the inputs each one was built from. A unit is only reused while its
+    digest still matches, so re-running with the same inputs resumes an
+    interrupted run, and re-running with changed inputs rebuilds only the
+    units whose inputs changed. ``resume=False`` discards all checkpoints.
+    """
+    
+    def __init__(self, output_dir: str, resume: bool = True):
+        self.output_dir = output_dir
+        self.checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIRNAME)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.reused = []
+        self.rebuilt = []
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.manifest = self._load_manifest() if resume else {}
+        if not self.manifest.get('units'):
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            self.manifest = {
+                'created_at': datetime.utcnow().isoformat(),
+                'sources': [],
+                'units': {}
+            }
+        self.manifest['status'] = 'running'
+        self._write_manifest()
+    
+    def completed_units(self) -> List[str]:
+        """Get the names of completed units"""
+        with self._lock:
+            return list(self.manifest['units'])
+    
+    def load(self, unit: str, digest: Optional[str] = None) -> Optional[Any]:
+        """
+        Load a completed unit
+        
+        Args:
+            unit: Unit name
+            digest: Digest of the unit's current inputs; a checkpoint built
+                    from different inputs is treated as missing
+                    
+        Returns:
+            The saved value, or None if the unit has no usable checkpoint
+        """
+        with self._lock:
+            entry = self.manifest['units'].get(unit)
+        if entry is None or entry.get('digest') != digest:
+            return None
+        try:
+            with open(os.path.join(self.checkpoint_dir, entry['file']), 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self.reused.append(unit)
+        return value
+    
+    def save(self, unit: str, value: Any, digest: Optional[str] = None):
+        """
+        Save a completed unit and record it in the manifest
+        
+        Args:
+            unit: Unit name
+            value: JSON-serializable unit output
+            digest: Digest of the inputs the unit was built from
+        """
+        filename = f"{unit}.json"
+        self._atomic_write(
+            os.path.join(self.checkpoint_dir, filename),
+            json.dumps(value, indent=2, ensure_ascii=False)
+        )
+        with self._lock:
+            self.manifest['units'][unit] = {
+                'file': filename,
+                'digest': digest,
+                'completed_at': datetime.utcnow().isoformat()
+            }
+            self.rebuilt.append(unit)
+            self._write_manifest()
+    
+    def get_sources(self) -> List[Dict]:
+        """Get the source materials recorded for the run"""
+        with self._lock:
+            return [dict(source) for source in self.manifest.get('sources', [])]
+    
+    def set_sources(self, sources: List[Dict]):
+        """
+        Record the source materials of the run
+        
+        Args:
+            sources: Source descriptions (type, name, digest, page hashes, ...)
+        """
+        with self._lock:
+            self.manifest['sources'] = sources
+            self._write_manifest()
+    
+    def mark_complete(self, report: Optional[Dict] = None):
+        """
+        Record that every unit of the run has finished
+        
+        Args:
+            report: Details of what changed in this run (optional)
+        """
+        with self._lock:
+            self.manifest['status'] = 'complete'
+            if report is not None:
+                self.manifest['last_update'] = report
+            self._write_manifest()
+    
+    def _load_manifest(self) -> Dict:
+        """Read the manifest, or an empty one if it is missing or unreadable"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _write_manifest(self):
+        """Write the manifest; callers hold the lock"""
+        self.manifest['updated_at'] = datetime.utcnow().isoformat()
+        self._atomic_write(self.manifest_path, json.dumps(self.manifest, indent=2, ensure_ascii=False))
+    
+    @staticmethod
+    def _atomic_write(path: str, data: str):
+        """Write a file so readers never see a partial write"""
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
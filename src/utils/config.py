@@ -1,7 +1,8 @@
 """Configuration Management"""
 import os
-from typing import Optional
+from typing import Dict, Optional
 from dotenv import load_dotenv
+from .routing import CALL_TYPES, Route
 
 
 class Config:
@@ -18,11 +19,92 @@ class Config:
         
         # Model Configuration
         self.openai_model = os.getenv('OPENAI_MODEL', 'gpt-4')
+        
+        # OpenAI connection pool shared by every request in the process
+        self.openai_timeout = float(os.getenv('OPENAI_TIMEOUT', '120'))
+        self.openai_connect_timeout = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '10'))
+        self.openai_max_connections = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+        self.openai_max_keepalive = int(os.getenv('OPENAI_MAX_KEEPALIVE', '10'))
+        self.openai_keepalive_expiry = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '30'))
+        
+        # Request pacing (quotas of 0 are learned from rate-limit headers)
+        self.llm_requests_per_minute = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '0'))
+        self.llm_tokens_per_minute = float(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))
+        self.llm_max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+        self.llm_max_retries = int(os.getenv('LLM_MAX_RETRIES', '5'))
+        
+        # Tail latency: per-call deadline, hedging threshold and circuit breaker
+        self.llm_call_deadline = float(os.getenv('LLM_CALL_DEADLINE', '180'))
+        self.llm_hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+        self.llm_breaker_failures = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+        self.llm_breaker_reset_seconds = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
         self.openai_temperature = float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
         
+        # Model routing: per call type model, completion limit and temperature,
+        # with a faster fallback model while the primary misses a latency SLO
+        self.llm_fallback_model = os.getenv('LLM_FALLBACK_MODEL', '')
+        self.llm_latency_slo = float(os.getenv('LLM_LATENCY_SLO', '0'))
+        
+        # LLM backends: "openai", "local" (an OpenAI-compatible server such as
+        # vLLM or llama.cpp) or "fake" (deterministic, offline); call types can
+        # be routed to another backend with ROUTE_<CALL_TYPE>_PROVIDER
+        self.llm_provider = os.getenv('LLM_PROVIDER', 'openai')
+        self.local_llm_base_url = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:8000/v1')
+        self.local_llm_api_key = os.getenv('LOCAL_LLM_API_KEY', 'local')
+        self.local_llm_max_concurrency = int(os.getenv('LOCAL_LLM_MAX_CONCURRENCY', '4'))
+        self.model_routes = self._read_routes()
+        
+        # Batch mode: jobs submitted through the provider's batch API, polled
+        # until done; a run takes one round per dependency level of the pipeline
+        self.batch_poll_seconds = float(os.getenv('BATCH_POLL_SECONDS', '60'))
+        self.batch_max_rounds = int(os.getenv('BATCH_MAX_ROUNDS', '6'))
+        self.batch_timeout_hours = float(os.getenv('BATCH_TIMEOUT_HOURS', '24'))
+        
+        # Pipeline Configuration
+        self.max_parallel_stages = int(os.getenv('MAX_PARALLEL_STAGES', '4'))
+        self.analysis_mode = os.getenv('ANALYSIS_MODE', 'single')
+        self.analysis_max_workers = int(os.getenv('ANALYSIS_MAX_WORKERS', '8'))
+        self.generation_shard_size = int(os.getenv('GENERATION_SHARD_SIZE', '5'))
+        
+        # PDF extraction: worker processes for page layout (0 uses every core),
+        # and the page count below which a document is extracted serially
+        self.pdf_max_workers = int(os.getenv('PDF_MAX_WORKERS', '0')) or os.cpu_count() or 1
+        self.pdf_parallel_min_pages = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '50'))
+        # Extractor: "auto" (fast PyPDF2 pass, pdfplumber layout only where
+        # needed), "fast" or "layout"; tables are off since nothing uses them
+        self.pdf_extractor = os.getenv('PDF_EXTRACTOR', 'auto')
+        self.pdf_extract_tables = os.getenv('PDF_EXTRACT_TABLES', 'false').lower() == 'true'
+        # Per-page layout budgets (0 disables): seconds before the page's worker
+        # is killed, and drawing/text operators above which it is not laid out
+        self.pdf_page_timeout = float(os.getenv('PDF_PAGE_TIMEOUT', '30'))
+        self.pdf_max_page_objects = int(os.getenv('PDF_MAX_PAGE_OBJECTS', '50000'))
+        # Section outline (bookmarks, else font sizes) that retrieval chunks
+        # follow; off by default since the font pass lays out every page
+        self.pdf_outline_enabled = os.getenv('PDF_OUTLINE_ENABLED', 'false').lower() == 'true'
+        # Remove headers and footers repeated across pages before prompting
+        self.pdf_strip_boilerplate = os.getenv('PDF_STRIP_BOILERPLATE', 'true').lower() == 'true'
+        # Extracted pages kept across runs, keyed by file content, up to a size
+        self.pdf_cache_enabled = os.getenv('PDF_CACHE_ENABLED', 'true').lower() == 'true'
+        self.pdf_cache_max_mb = int(os.getenv('PDF_CACHE_MAX_MB', '256'))
+        
+        # Retrieval: per-prompt source chunks from an in-process index
+        self.retrieval_enabled = os.getenv('RETRIEVAL_ENABLED', 'true').lower() == 'true'
+        self.retrieval_chunk_size = int(os.getenv('RETRIEVAL_CHUNK_SIZE', '800'))
+        
+        # Prompt sizing in tokens
+        self.max_input_tokens = int(os.getenv('MAX_INPUT_TOKENS', '6000'))
+        self.output_reserve_tokens = int(os.getenv('OUTPUT_RESERVE_TOKENS', '2048'))
+        
         # Directories
         self.output_dir = os.getenv('OUTPUT_DIR', 'output')
         self.temp_dir = os.getenv('TEMP_DIR', 'temp')
+        self.cache_dir = os.getenv('CACHE_DIR', 'cache')
+        
+        # LLM Response Cache
+        self.llm_cache_enabled = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+        self.llm_cache_max_mb = int(os.getenv('LLM_CACHE_MAX_MB', '512'))
+        self.llm_cache_ttl_hours = float(os.getenv('LLM_CACHE_TTL_HOURS', '0'))
+        self.llm_cache_memory_entries = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '256'))
         
         # Create directories if they don't exist
         os.makedirs(self.output_dir, exist_ok=True)
@@ -35,11 +117,15 @@ class Config:
         Returns:
             True if configuration is valid
         """
-        if not self.openai_api_key:
+        if not self.openai_api_key and 'openai' in self.get_providers_in_use():
             print("Warning: OPENAI_API_KEY not set")
             return False
         return True
     
+    def get_providers_in_use(self) -> set:
+        """Get the names of the LLM backends that some call type is routed to"""
+        return {route.provider or self.llm_provider for route in self.model_routes.values()}
+    
     def get_output_path(self, filename: str) -> str:
         """Get full path for output file"""
         return os.path.join(self.output_dir, filename)
@@ -47,3 +133,35 @@ class Config:
     def get_temp_path(self, filename: str) -> str:
         """Get full path for temporary file"""
         return os.path.join(self.temp_dir, filename)
+    
+    def get_cache_path(self, filename: str) -> str:
+        """Get full path for cache file"""
+        return os.path.join(self.cache_dir, filename)
+    
+    def _read_routes(self) -> Dict[str, Route]:
+        """Read ROUTE_<CALL_TYPE>_* settings for every routable call type"""
+        routes = {}
+        for call_type in CALL_TYPES:
+            prefix = f"ROUTE_{call_type.upper()}_"
+            max_tokens = os.getenv(prefix + 'MAX_TOKENS')
+            temperature = os.getenv(prefix + 'TEMPERATURE')
+            latency_slo = float(os.getenv(prefix + 'LATENCY_SLO', self.llm_latency_slo))
+            routes[call_type] = Route(
+                model=os.getenv(prefix + 'MODEL') or None,
+                max_tokens=int(max_tokens) if max_tokens else None,
+                temperature=float(temperature) if temperature else None,
+                fallback_model=os.getenv(prefix + 'FALLBACK_MODEL', self.llm_fallback_model) or None,
+                latency_slo=latency_slo or None,
+                provider=os.getenv(prefix + 'PROVIDER') or None
+            )
+        return routes
+    
+    def get_http_settings(self) -> Dict:
+        """Get timeouts and connection pool limits for the OpenAI client"""
+        return {
+            'timeout': self.openai_timeout,
+            'connect_timeout': self.openai_connect_timeout,
+            'max_connections': self.openai_max_connections,
+            'max_keepalive_connections': self.openai_max_keepalive,
+            'keepalive_expiry': self.openai_keepalive_expiry
+        }
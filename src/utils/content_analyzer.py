@@ -1,18 +1,45 @@
 """Content Analysis Module using AI"""
+import asyncio
 import json
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
-from openai import OpenAI
+from ..processors.pdf_processor import PDFProcessor
+from .batch import in_current_context
+from .llm_client import LLMClient
+from .prompts import source_messages, task_messages
+from .token_budget import TokenBudget
 
-# Maximum content length for API calls (to avoid token limits)
-MAX_CONTENT_LENGTH = 3000
+
+def _normalize(name: str) -> str:
+    """Normalize a topic or concept name for deduplication"""
+    return re.sub(r'[\W_]+', ' ', name.lower()).strip()
 
 
 class ContentAnalyzer:
     """Analyzes content using AI to extract concepts, topics, and structure"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", llm: Optional[LLMClient] = None,
+                 mode: str = 'single', max_workers: int = 8,
+                 budget: Optional[TokenBudget] = None):
+        """
+        Initialize the analyzer
+        
+        Args:
+            api_key: OpenAI API key
+            model: Model name
+            llm: Shared completion client (optional)
+            mode: 'single' analyzes the opening excerpt in one call;
+                  'hierarchical' analyzes every chunk in parallel and merges
+            max_workers: Concurrent chunk analyses in hierarchical mode
+            budget: Token budget for prompt content (optional)
+        """
+        self.llm = llm or LLMClient(api_key)
         self.model = model
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.budget = budget or TokenBudget(model)
     
     def analyze_content(self, content: str) -> Dict:
         """
@@ -24,15 +51,177 @@ class ContentAnalyzer:
         Returns:
             Dictionary with analysis results
         """
-        prompt = f"""Analyze the following educational content and provide:
+        if self.mode == 'hierarchical':
+            return self.analyze_content_hierarchical(content)
+        return self._analyze_excerpt(content)
+    
+    async def aanalyze_content(self, content: str) -> Dict:
+        """
+        Analyze content to extract main topics and concepts (async)
+        
+        Args:
+            content: Text content to analyze
+            
+        Returns:
+            Dictionary with analysis results
+        """
+        if self.mode == 'hierarchical':
+            return await self.aanalyze_content_hierarchical(content)
+        return await self._aanalyze_excerpt(content)
+    
+    def analyze_content_hierarchical(self, content: str) -> Dict:
+        """
+        Analyze a full document by mapping over chunks and merging the results
+        
+        Chunks are analyzed concurrently, so wall-clock time stays close to a
+        single call as long as there are enough workers.
+        
+        Args:
+            content: Text content to analyze
+            
+        Returns:
+            Dictionary with merged analysis results
+        """
+        chunks = self._chunks(content)
+        if len(chunks) <= 1:
+            return self._analyze_excerpt(content)
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            partials = list(executor.map(in_current_context(self._analyze_excerpt), chunks))
+        return self.merge_analyses(partials)
+    
+    async def aanalyze_content_hierarchical(self, content: str) -> Dict:
+        """
+        Analyze a full document by mapping over chunks and merging the results (async)
+        
+        Args:
+            content: Text content to analyze
+            
+        Returns:
+            Dictionary with merged analysis results
+        """
+        chunks = self._chunks(content)
+        if len(chunks) <= 1:
+            return await self._aanalyze_excerpt(content)
+        
+        semaphore = asyncio.Semaphore(self.max_workers)
+        
+        async def analyze_chunk(chunk):
+            async with semaphore:
+                return await self._aanalyze_excerpt(chunk)
+        
+        partials = await asyncio.gather(*[analyze_chunk(chunk) for chunk in chunks])
+        return self.merge_analyses(partials)
+    
+    @staticmethod
+    def merge_analyses(partials: List[Dict], max_topics: int = 7,
+                       max_modules: int = 10) -> Dict:
+        """
+        Reduce per-chunk analyses into one, deduplicating topics and concepts
+        
+        Topics are ranked by how many chunks mention them, concepts are merged
+        per topic, and the module structure keeps document order, sampled
+        evenly across the document when it has to be capped.
+        
+        Args:
+            partials: Per-chunk analysis results, in document order
+            max_topics: Maximum number of main topics to keep
+            max_modules: Maximum number of modules to keep
+            
+        Returns:
+            Merged analysis results
+        """
+        topic_names = {}
+        topic_counts = Counter()
+        concepts = {}
+        difficulties = Counter()
+        modules = {}
+        
+        for partial in partials:
+            for topic in partial.get('main_topics', []):
+                key = _normalize(topic)
+                if key:
+                    topic_names.setdefault(key, topic)
+                    topic_counts[key] += 1
+            for topic, topic_concepts in (partial.get('concepts') or {}).items():
+                key = _normalize(topic)
+                if key:
+                    topic_names.setdefault(key, topic)
+                    merged = concepts.setdefault(key, {})
+                    for concept in topic_concepts or []:
+                        merged.setdefault(_normalize(str(concept)), concept)
+            if partial.get('difficulty'):
+                difficulties[partial['difficulty']] += 1
+            for module in partial.get('module_structure', []):
+                modules.setdefault(_normalize(str(module)), module)
+        
+        first_seen = {key: i for i, key in enumerate(topic_names)}
+        ranked = sorted(topic_counts, key=lambda key: (-topic_counts[key], first_seen[key]))[:max_topics]
+        
+        module_structure = list(modules.values())
+        if len(module_structure) > max_modules:
+            step = (len(module_structure) - 1) / (max_modules - 1)
+            module_structure = [module_structure[round(i * step)] for i in range(max_modules)]
+        
+        return {
+            'main_topics': [topic_names[key] for key in ranked],
+            'concepts': {
+                topic_names[key]: list(concepts.get(key, {}).values()) for key in ranked
+            },
+            'difficulty': difficulties.most_common(1)[0][0] if difficulties else 'intermediate',
+            'module_structure': module_structure
+        }
+    
+    def _chunks(self, content: str) -> List[str]:
+        """Split content into chunks that each fit one analysis prompt, measured in tokens"""
+        return PDFProcessor().chunk_content(
+            content, chunk_size=self.budget.content_tokens, count=self.budget.count
+        )
+    
+    def _analyze_excerpt(self, content: str) -> Dict:
+        """Analyze the opening excerpt of the content in one call"""
+        try:
+            return self.llm.complete_json(
+                self.model, self._analysis_messages(content), temperature=0.7,
+                call_type='analysis'
+            )
+        except Exception as e:
+            print(f"Error analyzing content: {e}")
+            return self._empty_analysis()
+    
+    async def _aanalyze_excerpt(self, content: str) -> Dict:
+        """Analyze the opening excerpt of the content in one call (async)"""
+        try:
+            return await self.llm.acomplete_json(
+                self.model, self._analysis_messages(content), temperature=0.7,
+                call_type='analysis'
+            )
+        except Exception as e:
+            print(f"Error analyzing content: {e}")
+            return self._empty_analysis()
+    
+    def source_excerpt(self, content: str) -> str:
+        """
+        Get the part of the content that the analysis draws on
+        
+        Args:
+            content: Text content to analyze
+            
+        Returns:
+            Content excerpt sent to the model
+        """
+        if self.mode == 'hierarchical':
+            return content
+        return self.budget.fit(content)
+    
+    def _analysis_messages(self, content: str) -> List[Dict]:
+        """Build the chat messages for content analysis"""
+        task = f"""Analyze the source material and provide:
 1. Main topics covered (list of 3-7 topics)
 2. Key concepts for each topic
 3. Difficulty level (beginner, intermediate, advanced)
 4. Suggested module structure
 
-Content:
-{content[:MAX_CONTENT_LENGTH]}  # Limit to avoid token limits
-
 Respond in JSON format:
 {{
     "main_topics": ["topic1", "topic2", ...],
@@ -40,32 +229,42 @@ Respond in JSON format:
     "difficulty": "beginner/intermediate/advanced",
     "module_structure": ["module1 name", "module2 name", ...]
 }}"""
+        return source_messages(self.budget.fit(content), task)
+    
+    @staticmethod
+    def _empty_analysis() -> Dict:
+        """Fallback analysis used when the API call fails"""
+        return {
+            "main_topics": [],
+            "concepts": {},
+            "difficulty": "intermediate",
+            "module_structure": []
+        }
+    
+    def extract_key_concepts(self, content: str, num_concepts: int = 10) -> List[str]:
+        """
+        Extract key concepts from content
         
+        Args:
+            content: Text content
+            num_concepts: Number of concepts to extract
+            
+        Returns:
+            List of key concepts
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert educator analyzing study materials."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
+            result = self.llm.complete_json(
+                self.model, self._key_concepts_messages(content, num_concepts), temperature=0.5,
+                call_type='key_concepts'
             )
-            
-            result = json.loads(response.choices[0].message.content)
-            return result
+            return result.get('concepts', [])
         except Exception as e:
-            print(f"Error analyzing content: {e}")
-            return {
-                "main_topics": [],
-                "concepts": {},
-                "difficulty": "intermediate",
-                "module_structure": []
-            }
+            print(f"Error extracting concepts: {e}")
+            return []
     
-    def extract_key_concepts(self, content: str, num_concepts: int = 10) -> List[str]:
+    async def aextract_key_concepts(self, content: str, num_concepts: int = 10) -> List[str]:
         """
-        Extract key concepts from content
+        Extract key concepts from content (async)
         
         Args:
             content: Text content
@@ -74,31 +273,24 @@ Respond in JSON format:
         Returns:
             List of key concepts
         """
-        prompt = f"""Extract the {num_concepts} most important concepts from this educational content.
-List them in order of importance.
-
-Content:
-{content[:MAX_CONTENT_LENGTH]}
-
-Respond with a JSON array of concept strings."""
-        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at identifying key concepts."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
-                response_format={"type": "json_object"}
+            result = await self.llm.acomplete_json(
+                self.model, self._key_concepts_messages(content, num_concepts), temperature=0.5,
+                call_type='key_concepts'
             )
-            
-            result = json.loads(response.choices[0].message.content)
             return result.get('concepts', [])
         except Exception as e:
             print(f"Error extracting concepts: {e}")
             return []
     
+    def _key_concepts_messages(self, content: str, num_concepts: int) -> List[Dict]:
+        """Build the chat messages for key concept extraction"""
+        task = f"""Extract the {num_concepts} most important concepts from the source material.
+List them in order of importance.
+
+Respond with a JSON array of concept strings."""
+        return source_messages(self.budget.fit(content), task)
+    
     def simplify_concept(self, concept: str, context: str = "") -> Dict[str, str]:
         """
         Break down a complex concept into simple explanation
@@ -110,7 +302,38 @@ Respond with a JSON array of concept strings."""
         Returns:
             Dictionary with simplified explanation
         """
-        prompt = f"""Explain the following concept in simple terms that a beginner can understand.
+        try:
+            return self.llm.complete_json(
+                self.model, self._simplify_messages(concept, context), temperature=0.7,
+                call_type='simplify'
+            )
+        except Exception as e:
+            print(f"Error simplifying concept: {e}")
+            return self._unsimplified(concept)
+    
+    async def asimplify_concept(self, concept: str, context: str = "") -> Dict[str, str]:
+        """
+        Break down a complex concept into simple explanation (async)
+        
+        Args:
+            concept: The concept to simplify
+            context: Additional context
+            
+        Returns:
+            Dictionary with simplified explanation
+        """
+        try:
+            return await self.llm.acomplete_json(
+                self.model, self._simplify_messages(concept, context), temperature=0.7,
+                call_type='simplify'
+            )
+        except Exception as e:
+            print(f"Error simplifying concept: {e}")
+            return self._unsimplified(concept)
+    
+    def _simplify_messages(self, concept: str, context: str) -> List[Dict]:
+        """Build the chat messages for concept simplification"""
+        task = f"""Explain the following concept in simple terms that a beginner can understand.
 Break it down into:
 1. Simple definition (1-2 sentences)
 2. Why it matters (1-2 sentences)
@@ -121,31 +344,40 @@ Concept: {concept}
 Context: {context[:500] if context else 'General education'}
 
 Respond in JSON format."""
+        return task_messages(task)
+    
+    @staticmethod
+    def _unsimplified(concept: str) -> Dict[str, str]:
+        """Fallback explanation used when the API call fails"""
+        return {
+            "definition": concept,
+            "importance": "",
+            "example": "",
+            "misconceptions": ""
+        }
+    
+    def identify_relationships(self, concepts: List[str]) -> Dict[str, List[str]]:
+        """
+        Identify relationships between concepts
         
+        Args:
+            concepts: List of concepts
+            
+        Returns:
+            Dictionary mapping concepts to related concepts
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert teacher who excels at simplifying complex topics."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
+            return self.llm.complete_json(
+                self.model, self._relationships_messages(concepts), temperature=0.5,
+                call_type='relationships'
             )
-            
-            return json.loads(response.choices[0].message.content)
         except Exception as e:
-            print(f"Error simplifying concept: {e}")
-            return {
-                "definition": concept,
-                "importance": "",
-                "example": "",
-                "misconceptions": ""
-            }
+            print(f"Error identifying relationships: {e}")
+            return {}
     
-    def identify_relationships(self, concepts: List[str]) -> Dict[str, List[str]]:
+    async def aidentify_relationships(self, concepts: List[str]) -> Dict[str, List[str]]:
         """
-        Identify relationships between concepts
+        Identify relationships between concepts (async)
         
         Args:
             concepts: List of concepts
@@ -153,24 +385,20 @@ Respond in JSON format."""
         Returns:
             Dictionary mapping concepts to related concepts
         """
-        prompt = f"""Given these concepts, identify which ones are related and how:
-{json.dumps(concepts)}
-
-For each concept, list the related concepts and the nature of the relationship.
-Respond in JSON format with concept names as keys and lists of related concepts as values."""
-        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at understanding relationships between concepts."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
-                response_format={"type": "json_object"}
+            return await self.llm.acomplete_json(
+                self.model, self._relationships_messages(concepts), temperature=0.5,
+                call_type='relationships'
             )
-            
-            return json.loads(response.choices[0].message.content)
         except Exception as e:
             print(f"Error identifying relationships: {e}")
             return {}
+    
+    def _relationships_messages(self, concepts: List[str]) -> List[Dict]:
+        """Build the chat messages for relationship identification"""
+        task = f"""Given these concepts, identify which ones are related and how:
+{json.dumps(concepts)}
+
+For each concept, list the related concepts and the nature of the relationship.
+Respond in JSON format with concept names as keys and lists of related concepts as values."""
+        return task_messages(task)
@@ -0,0 +1,505 @@
+"""Chat completion client shared by the generators"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .batch import BatchCollector, BatchDeferred, BatchError, wait_for_batch, write_job
+from .cache import PersistentCache
+from .providers import Completion, OpenAIProvider, Provider
+from .rate_limiter import RequestGovernor, is_transient
+from .resilience import CircuitBreaker, LatencyTracker
+from .routing import ModelRouter, Route
+from .single_flight import SingleFlight
+from .token_budget import TokenBudget
+
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Completion tokens assumed when admitting a request; unused ones are refunded
+EXPECTED_COMPLETION_TOKENS = 1000
+
+# Threads running hedged blocking calls (the waiting caller does not send)
+HEDGE_WORKERS = 64
+
+# Batch run of the current call stack, as (client, collector)
+_ACTIVE_BATCH = contextvars.ContextVar('active_batch', default=None)
+
+
+class LLMClient:
+    """
+    Issues JSON chat completions through blocking and awaitable entry points
+    
+    Requests are served by a ``Provider``: the OpenAI API by default, or per
+    call type another backend such as an OpenAI-compatible local server or
+    the in-process ``FakeProvider``. When a cache is given, responses are
+    looked up by a hash of everything that shapes the completion before any
+    request is sent. Concurrent identical requests,
+    from any thread, share a single in-flight call; the response is shared as
+    text, so every caller parses its own copy. Requests that reach a provider
+    are admitted, retried and backed off by its ``RequestGovernor``, or by
+    the client's shared one.
+    
+    Each call has a deadline covering admission, retries and the request
+    itself. Once a call type has enough latency history, a call still running
+    past ``hedge_percentile`` of its recent latency gets a duplicate and the
+    first answer wins. A circuit breaker fails calls fast while the API keeps
+    failing. Prompt and provider-cached prompt tokens are tallied per call
+    type, to check how much of each prompt prefix the provider reused.
+    
+    The ``ModelRouter`` may override the provider, model, temperature and
+    completion token limit of a call by its type, e.g. to send templated
+    work to a faster model.
+    
+    Inside ``run_batched``, calls are answered through the providers' batch
+    interfaces instead of one request at a time.
+    """
+    
+    def __init__(self, api_key: str, cache: Optional[PersistentCache] = None,
+                 http_settings: Optional[Dict] = None,
+                 governor: Optional[RequestGovernor] = None,
+                 deadline_seconds: Optional[float] = None,
+                 hedge_percentile: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 routes: Optional[Dict[str, Route]] = None,
+                 providers: Optional[Dict[str, Provider]] = None,
+                 default_provider: str = 'openai'):
+        self.api_key = api_key
+        self.http_settings = dict(http_settings or {})
+        self.providers = {'openai': OpenAIProvider(api_key, http_settings=self.http_settings)}
+        self.providers.update(providers or {})
+        self.default_provider = default_provider
+        self.cache = cache
+        self.governor = governor or RequestGovernor()
+        self.single_flight = SingleFlight()
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.router = ModelRouter(routes, self.latency)
+        self._hedge_pool = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'hedged': 0, 'hedge_wins': 0}
+        self._usage = {}
+    
+    @property
+    def batch(self) -> Optional[BatchCollector]:
+        """Collector of the batch run the current call stack belongs to, if any"""
+        active = _ACTIVE_BATCH.get()
+        if active is None or active[0] is not self:
+            return None
+        return active[1]
+    
+    @property
+    def provider(self) -> Provider:
+        """Provider serving call types without a routed one"""
+        return self.providers[self.default_provider]
+    
+    def provider_for(self, call_type: str) -> Provider:
+        """
+        Get the provider serving a call type
+        
+        Args:
+            call_type: Kind of call
+            
+        Returns:
+            The routed provider, or the default one
+        """
+        name = self.router.provider_for(call_type) or self.default_provider
+        if name not in self.providers:
+            raise ValueError(f"Unknown LLM provider for {call_type}: {name}")
+        return self.providers[name]
+    
+    def complete_json(self, model: str, messages: List[Dict],
+                      temperature: float = 0.7, call_type: str = 'default') -> Dict:
+        """
+        Request a JSON object completion
+        
+        Args:
+            model: Model name
+            messages: Chat messages
+            temperature: Sampling temperature
+            call_type: Kind of call (analysis, module, quiz, ...) that selects
+                       its route and whose latency history drives hedging
+                       
+        Returns:
+            Parsed JSON response
+        """
+        provider = self.provider_for(call_type)
+        model, temperature, max_tokens = self.router.resolve(call_type, model, temperature)
+        key = self.cache_key(model, messages, temperature, JSON_RESPONSE_FORMAT, max_tokens,
+                             self._cache_scope(provider))
+        content = self._cached(key)
+        if content is None and self.batch is not None:
+            content = self._batch_answer(key, provider, model, messages, temperature, call_type, max_tokens)
+        if content is None:
+            content = self.single_flight.do(
+                key,
+                lambda: self._fetch(key, provider, model, messages, temperature, call_type, max_tokens)
+            )
+        return json.loads(content)
+    
+    async def acomplete_json(self, model: str, messages: List[Dict],
+                             temperature: float = 0.7, call_type: str = 'default') -> Dict:
+        """
+        Request a JSON object completion without blocking the event loop
+        
+        Args:
+            model: Model name
+            messages: Chat messages
+            temperature: Sampling temperature
+            call_type: Kind of call (analysis, module, quiz, ...) that selects
+                       its route and whose latency history drives hedging
+                       
+        Returns:
+            Parsed JSON response
+        """
+        provider = self.provider_for(call_type)
+        model, temperature, max_tokens = self.router.resolve(call_type, model, temperature)
+        key = self.cache_key(model, messages, temperature, JSON_RESPONSE_FORMAT, max_tokens,
+                             self._cache_scope(provider))
+        content = self._cached(key)
+        if content is None and self.batch is not None:
+            content = self._batch_answer(key, provider, model, messages, temperature, call_type, max_tokens)
+        if content is None:
+            content = await self.single_flight.ado(
+                key,
+                lambda: self._afetch(key, provider, model, messages, temperature, call_type, max_tokens)
+            )
+        return json.loads(content)
+    
+    def run_batched(self, run: Callable[[], Any], job_dir: str, poll_interval: float = 60.0,
+                    max_rounds: int = 6, timeout: Optional[float] = None) -> Any:
+        """
+        Run a pipeline with its completion requests answered by provider batches
+        
+        The pipeline runs in rounds. Calls whose answers are not known yet
+        are queued and raise ``BatchDeferred``, which stops the stages waiting
+        on them. The queued requests are written to a JSONL job file per
+        provider, submitted through the provider's batch interface and polled
+        until done, and the pipeline runs again with the answers. Requests
+        built from earlier answers, such as a module's quiz from its module,
+        go out in later rounds. The first round that queues nothing finishes
+        the pipeline, which exports its outputs as usual.
+        
+        Only calls made from ``run``'s own call stack join the batch: the run
+        is held in a context variable, which the pipeline's worker threads
+        inherit (see ``in_current_context``). Interactive calls made on the
+        same client from other threads are sent as usual.
+        
+        Args:
+            run: Runs the pipeline and returns its result
+            job_dir: Directory for job and output files
+            poll_interval: Seconds between batch status checks
+            max_rounds: Batch rounds allowed before giving up
+            timeout: Seconds to wait for each batch (None waits for the provider)
+            
+        Returns:
+            Result of the final run
+        """
+        collector = BatchCollector()
+        token = _ACTIVE_BATCH.set((self, collector))
+        try:
+            for round_number in range(1, max_rounds + 1):
+                try:
+                    return run()
+                except BatchDeferred:
+                    pass
+                
+                jobs = collector.take()
+                if not jobs:
+                    raise BatchError("Pipeline was deferred without queuing a request")
+                submitted = []
+                for name, (provider, requests) in jobs.items():
+                    path = write_job(os.path.join(job_dir, f"round_{round_number}_{name}.jsonl"), requests)
+                    submitted.append((provider, provider.submit_batch(path), list(requests)))
+                    print(f"  Batch round {round_number}: submitted {len(requests)} requests to {name}")
+                for provider, batch_id, custom_ids in submitted:
+                    output = wait_for_batch(provider, batch_id, poll_interval, timeout)
+                    collector.add_results(custom_ids, output)
+            raise BatchError(f"Pipeline still queuing requests after {max_rounds} batch rounds")
+        finally:
+            _ACTIVE_BATCH.reset(token)
+    
+    def stats(self) -> Dict[str, int]:
+        """Get hedging and circuit breaker counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({f"circuit_{name}": value for name, value in self.breaker.stats().items()})
+        stats.update(self.router.stats())
+        return stats
+    
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get prompt token usage per call type
+        
+        Returns:
+            Mapping of call type to its number of API calls, prompt tokens
+            and prompt tokens served from the provider's prompt cache
+        """
+        with self._stats_lock:
+            return {call_type: dict(counts) for call_type, counts in self._usage.items()}
+    
+    @staticmethod
+    def cache_key(model: str, messages: List[Dict], temperature: float,
+                  response_format: Optional[Dict] = None,
+                  max_tokens: Optional[int] = None, provider: Optional[str] = None) -> str:
+        """
+        Fingerprint a completion request
+        
+        Args:
+            model: Model name
+            messages: Chat messages (system and user prompts)
+            temperature: Sampling temperature
+            response_format: Requested response format
+            max_tokens: Completion token limit, if any
+            provider: Backend serving the request, if not the OpenAI API
+            
+        Returns:
+            Hex digest identifying the request
+        """
+        request = {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'response_format': response_format
+        }
+        if max_tokens is not None:
+            request['max_tokens'] = max_tokens
+        if provider is not None:
+            request['provider'] = provider
+        payload = json.dumps(
+            request,
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _fetch(self, key: str, provider: Provider, model: str, messages: List[Dict],
+               temperature: float, call_type: str, max_tokens: Optional[int] = None) -> str:
+        """Request a completion under the breaker and deadline, hedging slow calls, and cache it"""
+        self.breaker.before_call()
+        deadline = self._deadline()
+        estimated_tokens = self._estimate_tokens(model, messages, max_tokens)
+        governor = provider.governor or self.governor
+        
+        def attempt():
+            started = time.monotonic()
+            completion = governor.call(
+                lambda: provider.complete(
+                    self._request_options(model, messages, temperature, self._remaining(deadline),
+                                          max_tokens),
+                    call_type
+                ),
+                estimated_tokens,
+                deadline
+            )
+            self.latency.record((call_type, model), time.monotonic() - started)
+            self._record_usage(call_type, completion)
+            return completion.content
+        
+        try:
+            content = self._hedged(attempt, (call_type, model))
+        except Exception as e:
+            self._record_outcome(e)
+            raise
+        self._record_outcome(None)
+        self._store(key, content)
+        return content
+    
+    async def _afetch(self, key: str, provider: Provider, model: str, messages: List[Dict],
+                      temperature: float, call_type: str, max_tokens: Optional[int] = None) -> str:
+        """Request a completion under the breaker and deadline, hedging slow calls, and cache it (async)"""
+        self.breaker.before_call()
+        deadline = self._deadline()
+        estimated_tokens = self._estimate_tokens(model, messages, max_tokens)
+        governor = provider.governor or self.governor
+        
+        async def attempt():
+            started = time.monotonic()
+            completion = await governor.acall(
+                lambda: provider.acomplete(
+                    self._request_options(model, messages, temperature, self._remaining(deadline),
+                                          max_tokens),
+                    call_type
+                ),
+                estimated_tokens,
+                deadline
+            )
+            self.latency.record((call_type, model), time.monotonic() - started)
+            self._record_usage(call_type, completion)
+            return completion.content
+        
+        try:
+            content = await self._ahedged(attempt, (call_type, model))
+        except Exception as e:
+            self._record_outcome(e)
+            raise
+        self._record_outcome(None)
+        self._store(key, content)
+        return content
+    
+    def _batch_answer(self, key: str, provider: Provider, model: str, messages: List[Dict],
+                      temperature: float, call_type: str, max_tokens: Optional[int] = None) -> str:
+        """Answer a call from the batch run, queuing it when there is no answer yet, and cache it"""
+        content = self.batch.answer(
+            key, provider, call_type,
+            self._request_options(model, messages, temperature, None, max_tokens)
+        )
+        self._store(key, content)
+        return content
+    
+    def _hedged(self, attempt: Callable[[], str], latency_key: Tuple[str, str]) -> str:
+        """Run an attempt, firing a duplicate if it outlives the hedge delay"""
+        delay = self._hedge_delay(latency_key)
+        if delay is None:
+            return attempt()
+        
+        pool = self._hedge_executor()
+        primary = pool.submit(attempt)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        
+        self._count('hedged')
+        backup = pool.submit(attempt)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = error or future.exception()
+        raise error
+    
+    async def _ahedged(self, attempt: Callable[[], Awaitable[str]],
+                       latency_key: Tuple[str, str]) -> str:
+        """Await an attempt, firing a duplicate if it outlives the hedge delay (async)"""
+        delay = self._hedge_delay(latency_key)
+        if delay is None:
+            return await attempt()
+        
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        error = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            
+            self._count('hedged')
+            backup = asyncio.ensure_future(attempt())
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _hedge_delay(self, latency_key: Tuple[str, str]) -> Optional[float]:
+        """Seconds after which a call of this type and model is hedged, or None to not hedge"""
+        if not self.hedge_percentile:
+            return None
+        return self.latency.percentile(latency_key, self.hedge_percentile)
+    
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        """Thread pool for hedged blocking calls, created on first use"""
+        with self._stats_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=HEDGE_WORKERS, thread_name_prefix='llm-hedge'
+                )
+            return self._hedge_pool
+    
+    def _record_outcome(self, error: Optional[Exception]):
+        """Feed a call's outcome to the circuit breaker; only transient errors count as failures"""
+        if error is not None and is_transient(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+    
+    def _deadline(self) -> Optional[float]:
+        """Monotonic time by which a call starting now must finish"""
+        if not self.deadline_seconds:
+            return None
+        return time.monotonic() + self.deadline_seconds
+    
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """Request timeout that keeps an attempt within the deadline"""
+        if deadline is None:
+            return None
+        return max(0.1, deadline - time.monotonic())
+    
+    def _record_usage(self, call_type: str, completion: Completion):
+        """Add a completed request's prompt token usage to its call type"""
+        with self._stats_lock:
+            counts = self._usage.setdefault(
+                call_type, {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+            )
+            counts['calls'] += 1
+            counts['prompt_tokens'] += completion.prompt_tokens or 0
+            counts['cached_tokens'] += completion.cached_tokens or 0
+    
+    def _count(self, name: str):
+        """Increment a hedging counter"""
+        with self._stats_lock:
+            self._stats[name] += 1
+    
+    @staticmethod
+    def _request_options(model: str, messages: List[Dict], temperature: float,
+                         timeout: Optional[float], max_tokens: Optional[int] = None) -> Dict:
+        """Build the keyword arguments of a completion request"""
+        options = {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'response_format': JSON_RESPONSE_FORMAT
+        }
+        if timeout is not None:
+            options['timeout'] = timeout
+        if max_tokens is not None:
+            options['max_tokens'] = max_tokens
+        return options
+    
+    @staticmethod
+    def _cache_scope(provider: Provider) -> Optional[str]:
+        """Provider name to fingerprint; the OpenAI API is left out so its cache keys stay stable"""
+        return None if provider.name == 'openai' else provider.name
+    
+    @staticmethod
+    def _estimate_tokens(model: str, messages: List[Dict], max_tokens: Optional[int] = None) -> int:
+        """Tokens a request is expected to consume, for admission against the token quota"""
+        completion_tokens = min(max_tokens or EXPECTED_COMPLETION_TOKENS, EXPECTED_COMPLETION_TOKENS)
+        return TokenBudget(model).count_messages(messages) + completion_tokens
+    
+    def _cached(self, key: str) -> Optional[str]:
+        """Look up a cached response body"""
+        if self.cache is None:
+            return None
+        return self.cache.get(key)
+    
+    def _store(self, key: str, content: str):
+        """Cache a response body, skipping responses that are not valid JSON"""
+        if self.cache is None:
+            return
+        try:
+            json.loads(content)
+        except (TypeError, ValueError):
+            return
+        self.cache.set(key, content)
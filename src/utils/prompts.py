@@ -0,0 +1,45 @@
+"""Shared prompt layout that keeps the long part of every prompt identical"""
+from typing import Dict, List
+
+SYSTEM_PREAMBLE = (
+    "You are an expert educator who turns source material into study materials: "
+    "content analyses, learning modules, quizzes and flashcards. Base your work on "
+    "the source material you are given and always respond with a single JSON object."
+)
+
+
+def source_messages(source: str, task: str) -> List[Dict]:
+    """
+    Build chat messages that put the source material ahead of the task
+    
+    Providers cache the longest prompt prefix they have recently seen, so
+    the fixed preamble and the source come first and only the task-specific
+    instructions differ between calls on the same material.
+    
+    Args:
+        source: Source material the task draws on
+        task: Task-specific instructions
+        
+    Returns:
+        Chat messages
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PREAMBLE},
+        {"role": "user", "content": f"Source material:\n{source}\n\nTask:\n{task}"}
+    ]
+
+
+def task_messages(task: str) -> List[Dict]:
+    """
+    Build chat messages for a task without source material
+    
+    Args:
+        task: Task instructions
+        
+    Returns:
+        Chat messages
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PREAMBLE},
+        {"role": "user", "content": task}
+    ]
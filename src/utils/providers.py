@@ -0,0 +1,400 @@
+"""Backends that serve chat completions for the LLM client"""
+import json
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from .rate_limiter import RequestGovernor
+from .retrieval import tokenize
+
+# Endpoint that batch job lines address
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+# Requests a provider answers at once when standing in for a batch API
+LOCAL_BATCH_WORKERS = 4
+
+
+class Completion(NamedTuple):
+    """Response text of one request, with its prompt token usage when reported"""
+    content: str
+    prompt_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def _pool_options(timeout: float = 120.0, connect_timeout: float = 10.0,
+                  max_connections: int = 20, max_keepalive_connections: int = 10,
+                  keepalive_expiry: float = 30.0) -> Dict:
+    """Build httpx client options from connection pool settings"""
+    return {
+        'timeout': httpx.Timeout(timeout, connect=connect_timeout),
+        'limits': httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+    }
+
+
+def get_openai_client(api_key: str, max_retries: int = 2, base_url: Optional[str] = None,
+                      **http_settings) -> OpenAI:
+    """
+    Get the process-wide OpenAI client for an API key and endpoint
+    
+    Clients are created once per key, endpoint and settings and then shared,
+    so every caller reuses the same keep-alive connection pool. The client is
+    safe to use from several threads.
+    
+    Args:
+        api_key: OpenAI API key
+        max_retries: Retries the SDK makes on its own
+        base_url: OpenAI-compatible endpoint (defaults to the OpenAI API)
+        **http_settings: Timeouts and pool limits (timeout, connect_timeout,
+                         max_connections, max_keepalive_connections,
+                         keepalive_expiry)
+                         
+    Returns:
+        Shared OpenAI client
+    """
+    key = (api_key, max_retries, base_url, tuple(sorted(http_settings.items())))
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                max_retries=max_retries,
+                base_url=base_url,
+                http_client=httpx.Client(**_pool_options(**http_settings))
+            )
+            _shared_clients[key] = client
+        return client
+
+
+class Provider:
+    """
+    A backend that serves chat completion requests
+    
+    Requests are the keyword arguments of an OpenAI chat completion. A
+    provider with its own ``governor`` is paced and retried separately from
+    the client's shared one, e.g. to give a local server its own
+    concurrency limit.
+    """
+    
+    name = 'provider'
+    
+    def __init__(self, governor: Optional[RequestGovernor] = None):
+        self.governor = governor
+    
+    def complete(self, request: Dict, call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """
+        Serve one completion request
+        
+        Args:
+            request: Chat completion arguments
+            call_type: Kind of call (analysis, module, quiz, ...)
+            
+        Returns:
+            The completion, response headers and total tokens used (None if unknown)
+        """
+        raise NotImplementedError
+    
+    async def acomplete(self, request: Dict,
+                        call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """Serve one completion request (async)"""
+        raise NotImplementedError
+    
+    def submit_batch(self, job_path: str) -> str:
+        """
+        Submit a JSONL job file of chat completion requests
+        
+        This is a local, file-based stand-in for a batch API: every request
+        of the job is answered with ``complete`` before returning, and the
+        results are written next to the job file in the OpenAI batch output
+        format. Job line ids start with the call type of the request.
+        
+        Args:
+            job_path: Job file in the OpenAI batch input format
+            
+        Returns:
+            Batch id to poll
+        """
+        with open(job_path, 'r', encoding='utf-8') as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+        
+        def run(job):
+            cid = job['custom_id']
+            try:
+                completion, _, total_tokens = self.complete(job['body'], cid.split(':', 1)[0])
+            except Exception as e:
+                return {'custom_id': cid, 'response': None, 'error': {'message': str(e)}}
+            body = {
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': completion.content}}],
+                'usage': {'prompt_tokens': completion.prompt_tokens, 'total_tokens': total_tokens}
+            }
+            return {'custom_id': cid, 'response': {'status_code': 200, 'body': body}, 'error': None}
+        
+        with ThreadPoolExecutor(max_workers=LOCAL_BATCH_WORKERS) as executor:
+            results = list(executor.map(run, jobs))
+        
+        batch_id = os.path.splitext(job_path)[0] + '.output.jsonl'
+        with open(batch_id, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        return batch_id
+    
+    def batch_status(self, batch_id: str) -> str:
+        """
+        Get the state of a submitted batch
+        
+        Args:
+            batch_id: Batch id returned by ``submit_batch``
+            
+        Returns:
+            Batch state, e.g. 'in_progress' or 'completed'
+        """
+        return 'completed'
+    
+    def batch_results(self, batch_id: str) -> str:
+        """
+        Get the output of a finished batch
+        
+        Args:
+            batch_id: Batch id returned by ``submit_batch``
+            
+        Returns:
+            Output lines, in the OpenAI batch output format
+        """
+        with open(batch_id, 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+class OpenAIProvider(Provider):
+    """
+    The OpenAI API, or any OpenAI-compatible server such as vLLM or llama.cpp
+    
+    Blocking calls go through the process-wide client from
+    ``get_openai_client``. Both clients are created on first use, so a
+    provider that is configured but never routed to needs no credentials.
+    The async client keeps its connection pool on the event loop that first
+    uses it, so awaitable calls should be driven from a single loop. The
+    SDK's own retries are disabled, since requests are retried by a
+    ``RequestGovernor``.
+    
+    Batches go to the OpenAI Batch API. OpenAI-compatible servers rarely
+    implement it, so with a ``base_url`` batches are answered in-process
+    like any other provider's.
+    """
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 http_settings: Optional[Dict] = None,
+                 governor: Optional[RequestGovernor] = None, name: str = 'openai'):
+        """
+        Initialize the provider
+        
+        Args:
+            api_key: API key (local servers usually accept any value)
+            base_url: OpenAI-compatible endpoint (defaults to the OpenAI API)
+            http_settings: Timeouts and pool limits for the HTTP clients
+            governor: Pacing for this endpoint (defaults to the client's shared one)
+            name: Provider name used in routes
+        """
+        super().__init__(governor)
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http_settings = dict(http_settings or {})
+        self._async_client = None
+        self._async_lock = threading.Lock()
+    
+    @property
+    def client(self) -> OpenAI:
+        """Shared blocking client for this endpoint"""
+        return get_openai_client(self.api_key, max_retries=0, base_url=self.base_url, **self.http_settings)
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Async client with the same endpoint, timeouts and pool limits, created on first use"""
+        with self._async_lock:
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    max_retries=0,
+                    base_url=self.base_url,
+                    http_client=httpx.AsyncClient(**_pool_options(**self.http_settings))
+                )
+            return self._async_client
+    
+    def complete(self, request: Dict, call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """Send one completion request"""
+        return self._unpack(self.client.chat.completions.with_raw_response.create(**request))
+    
+    async def acomplete(self, request: Dict,
+                        call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """Send one completion request (async)"""
+        return self._unpack(await self.async_client.chat.completions.with_raw_response.create(**request))
+    
+    def submit_batch(self, job_path: str) -> str:
+        """Upload a job file and start a batch on the OpenAI Batch API"""
+        if self.base_url is not None:
+            return super().submit_batch(job_path)
+        with open(job_path, 'rb') as f:
+            upload = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=upload.id, endpoint=BATCH_ENDPOINT, completion_window='24h'
+        )
+        return batch.id
+    
+    def batch_status(self, batch_id: str) -> str:
+        """Get the state of a batch"""
+        if self.base_url is not None:
+            return super().batch_status(batch_id)
+        return self.client.batches.retrieve(batch_id).status
+    
+    def batch_results(self, batch_id: str) -> str:
+        """Download the output and error lines of a finished batch"""
+        if self.base_url is not None:
+            return super().batch_results(batch_id)
+        batch = self.client.batches.retrieve(batch_id)
+        files = [file_id for file_id in (batch.output_file_id, batch.error_file_id) if file_id]
+        return ''.join(self.client.files.content(file_id).text for file_id in files)
+    
+    @staticmethod
+    def _unpack(raw: Any) -> Tuple[Completion, Mapping, Optional[int]]:
+        """Split a raw API response into the completion, headers and tokens used"""
+        response = raw.parse()
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        
+        def count(source, field):
+            value = getattr(source, field, None)
+            return value if isinstance(value, int) else None
+        
+        completion = Completion(
+            response.choices[0].message.content,
+            count(usage, 'prompt_tokens'),
+            count(details, 'cached_tokens')
+        )
+        return completion, raw.headers, count(usage, 'total_tokens')
+
+
+class FakeProvider(Provider):
+    """
+    Deterministic in-process stand-in for tests and offline runs
+    
+    Answers every call type with a well-formed response built from the most
+    frequent terms of the prompt's source material, so the same prompt
+    always yields the same response and the whole pipeline can run without
+    network access. A ``respond`` function replaces the built-in answers.
+    """
+    
+    name = 'fake'
+    
+    def __init__(self, respond: Optional[Callable[[Dict], str]] = None,
+                 governor: Optional[RequestGovernor] = None, num_terms: int = 5):
+        """
+        Initialize the provider
+        
+        Args:
+            respond: Function mapping a request to the response text (optional)
+            governor: Pacing for this provider (defaults to the client's shared one)
+            num_terms: Number of source terms the built-in answers are built from
+        """
+        super().__init__(governor)
+        self.respond = respond
+        self.num_terms = num_terms
+        self.requests = []
+        self._lock = threading.Lock()
+    
+    def complete(self, request: Dict, call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """Answer one completion request"""
+        with self._lock:
+            self.requests.append(request)
+        messages = request.get('messages', [])
+        if self.respond is not None:
+            content = self.respond(request)
+        else:
+            content = json.dumps(self._answer(call_type, self._terms(messages)), sort_keys=True)
+        prompt_tokens = sum(len(message.get('content') or '') for message in messages) // 4
+        completion = Completion(content, prompt_tokens, 0)
+        return completion, {}, prompt_tokens + len(content) // 4
+    
+    async def acomplete(self, request: Dict,
+                        call_type: str = 'default') -> Tuple[Completion, Mapping, Optional[int]]:
+        """Answer one completion request (async)"""
+        return self.complete(request, call_type)
+    
+    def _terms(self, messages: List[Dict]) -> List[str]:
+        """Most frequent source terms of a prompt, in order of frequency then appearance"""
+        text = (messages[-1].get('content') or '') if messages else ''
+        if text.startswith('Source material:') and '\n\nTask:\n' in text:
+            text = text[:text.rindex('\n\nTask:\n')]
+        counts = Counter(token for token in tokenize(text) if len(token) > 3 and not token.isdigit())
+        counts.pop('source', None)
+        counts.pop('material', None)
+        return [term for term, _ in counts.most_common(self.num_terms)] or ['topic']
+    
+    @staticmethod
+    def _answer(call_type: str, terms: List[str]) -> Dict:
+        """Well-formed response for a call type"""
+        topics = [term.title() for term in terms]
+        if call_type == 'analysis':
+            return {
+                'main_topics': topics,
+                'concepts': {topic: [f"{topic} basics", f"{topic} applications"] for topic in topics},
+                'difficulty': 'intermediate',
+                'module_structure': [f"Introduction to {topic}" for topic in topics]
+            }
+        if call_type == 'key_concepts':
+            return {'concepts': topics}
+        if call_type == 'simplify':
+            return {
+                'definition': f"{topics[0]} in simple terms",
+                'importance': f"{topics[0]} underpins the material",
+                'example': f"An everyday example of {topics[0]}",
+                'misconceptions': ''
+            }
+        if call_type == 'relationships':
+            return {topic: [other for other in topics if other != topic] for topic in topics}
+        if call_type == 'module':
+            return {
+                'title': f"Understanding {topics[0]}",
+                'learning_objectives': [f"Explain {topic}" for topic in topics],
+                'introduction': f"This module covers {', '.join(topics)}.",
+                'sections': [
+                    {'title': topic, 'content': f"{topic} is a key idea of this module."}
+                    for topic in topics
+                ],
+                'key_takeaways': [f"{topic} matters" for topic in topics],
+                'prerequisites': [],
+                'estimated_time': f"{len(topics) * 10} minutes"
+            }
+        if call_type in ('quiz', 'module_quiz'):
+            return {'questions': [
+                {
+                    'question': f"Which topic does the material describe as {topic.lower()}?",
+                    'type': 'short_answer',
+                    'correct_answer': topic,
+                    'explanation': f"The material discusses {topic}.",
+                    'points': 1
+                }
+                for topic in topics
+            ]}
+        if call_type in ('flashcards', 'concept_flashcards'):
+            return {'flashcards': [
+                {'front': f"What is {topic}?", 'back': f"{topic} as described in the material.",
+                 'difficulty': 'medium'}
+                for topic in topics
+            ]}
+        if call_type == 'diagram_spec':
+            return {
+                'elements': topics,
+                'relationships': [[topics[0], topic] for topic in topics[1:]],
+                'layout': 'hierarchical'
+            }
+        return {}
@@ -0,0 +1,383 @@
+"""Rate-limit-aware admission, retry and backoff for API requests"""
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+import openai
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+# Fraction of a quota that must remain for concurrency to grow
+HEADROOM_FRACTION = 0.1
+
+# Status codes worth retrying besides 429
+RETRYABLE_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request cannot complete before its deadline"""
+
+
+def is_throttled(error: BaseException) -> bool:
+    """Check whether an error is a rate-limit rejection"""
+    return isinstance(error, openai.RateLimitError) or getattr(error, 'status_code', None) == 429
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Check whether an error is worth retrying
+    
+    Args:
+        error: Exception raised by a request
+        
+    Returns:
+        True for rate limits, timeouts, connection failures and server errors
+    """
+    return (
+        is_throttled(error)
+        or getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+        or isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, DeadlineExceeded))
+    )
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a rate-limit reset duration such as ``"1s"``, ``"6m0s"`` or ``"20ms"``
+    
+    Args:
+        value: Header value
+        
+    Returns:
+        Duration in seconds, or None if it cannot be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Per-minute quota that refills continuously
+    
+    A capacity of 0 means the limit is unknown; the bucket then admits
+    everything until a capacity is learned from response headers.
+    """
+    
+    def __init__(self, per_minute: float = 0):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+    
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken (0 if it can be taken now)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60.0 / self.capacity
+    
+    def take(self, amount: float):
+        """Consume ``amount`` from the bucket"""
+        if self.capacity > 0:
+            self.level -= amount
+    
+    def give_back(self, amount: float):
+        """Return unused quota, e.g. when a request used fewer tokens than estimated"""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+    
+    def observe(self, limit: Optional[float], remaining: Optional[float], now: float):
+        """Align the bucket with the limit and remaining quota reported by the server"""
+        if limit:
+            if self.capacity <= 0:
+                self.level = limit
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity > 0:
+            self._refill(now)
+            self.level = min(self.level, float(remaining))
+    
+    def headroom(self) -> Optional[float]:
+        """Fraction of the quota currently available, or None if unknown"""
+        if self.capacity <= 0:
+            return None
+        return max(0.0, self.level) / self.capacity
+    
+    def _refill(self, now: float):
+        """Add the quota accrued since the last update"""
+        elapsed = now - self._updated
+        self._updated = now
+        if self.capacity > 0 and elapsed > 0:
+            self.level = min(self.capacity, self.level + elapsed * self.capacity / 60.0)
+
+
+class RequestGovernor:
+    """
+    Admits API requests under request and token quotas with adaptive concurrency
+    
+    Every request waits for a concurrency slot and for room in the
+    requests-per-minute and tokens-per-minute buckets. Quotas left unset are
+    learned from the ``x-ratelimit-*`` headers of the first responses, and the
+    buckets follow the remaining quota the server reports. Throttled and
+    transient failures are retried with jittered exponential backoff (or the
+    server's ``retry-after``), and a 429 pauses all callers for that long.
+    Concurrency grows additively while there is headroom and halves on a 429,
+    so throughput settles just under quota. The governor is safe to share
+    between threads and event loops.
+    """
+    
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 8, min_concurrency: int = 1,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Initialize the governor
+        
+        Args:
+            requests_per_minute: Request quota (0 learns it from response headers)
+            tokens_per_minute: Token quota (0 learns it from response headers)
+            max_concurrency: Upper bound on requests in flight
+            min_concurrency: Lower bound the concurrency limit shrinks to
+            max_retries: Retries after the first attempt of a request
+            base_delay: First backoff delay in seconds
+            max_delay: Longest backoff delay in seconds
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency = float(self.max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+    
+    def call(self, send: Callable[[], Tuple[Any, Mapping, Optional[int]]],
+             estimated_tokens: int = 0, deadline: Optional[float] = None) -> Any:
+        """
+        Run a request under the governor, retrying throttled and transient failures
+        
+        Args:
+            send: Performs the request and returns ``(result, headers, tokens_used)``
+            estimated_tokens: Tokens the request is expected to consume
+            deadline: ``time.monotonic()`` value by which the request must be
+                      done; admission and retries that would pass it give up
+                      
+        Returns:
+            The request's result
+        """
+        attempt = 0
+        while True:
+            self._acquire(estimated_tokens, deadline)
+            try:
+                result, headers, used = send()
+            except Exception as e:
+                delay = self._on_failure(e, attempt, estimated_tokens, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. the losing attempt of a hedged call): free
+                # the slot and the reserved tokens before letting it through
+                self._release(estimated_tokens)
+                raise
+            self._on_success(headers, estimated_tokens, used)
+            return result
+    
+    async def acall(self, send: Callable[[], Awaitable[Tuple[Any, Mapping, Optional[int]]]],
+                    estimated_tokens: int = 0, deadline: Optional[float] = None) -> Any:
+        """
+        Run a request under the governor without blocking the event loop
+        
+        Args:
+            send: Coroutine function performing the request and returning
+                  ``(result, headers, tokens_used)``
+            estimated_tokens: Tokens the request is expected to consume
+            deadline: ``time.monotonic()`` value by which the request must be done
+            
+        Returns:
+            The request's result
+        """
+        attempt = 0
+        while True:
+            while True:
+                wait = self._try_acquire(estimated_tokens)
+                if wait == 0:
+                    break
+                self._check_deadline(wait, deadline)
+                await asyncio.sleep(wait)
+            try:
+                result, headers, used = await send()
+            except Exception as e:
+                delay = self._on_failure(e, attempt, estimated_tokens, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. the losing attempt of a hedged call): free
+                # the slot and the reserved tokens before letting it through
+                self._release(estimated_tokens)
+                raise
+            self._on_success(headers, estimated_tokens, used)
+            return result
+    
+    def stats(self) -> Dict[str, float]:
+        """Get request, retry and throttle counters and the current concurrency limit"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['concurrency'] = round(self.concurrency, 2)
+            return stats
+    
+    def _acquire(self, estimated_tokens: int, deadline: Optional[float] = None):
+        """Block until the request may start"""
+        with self._cond:
+            while True:
+                wait = self._try_acquire_locked(estimated_tokens)
+                if wait == 0:
+                    return
+                self._check_deadline(wait, deadline)
+                self._cond.wait(wait)
+    
+    @staticmethod
+    def _check_deadline(wait: float, deadline: Optional[float]):
+        """Raise ``DeadlineExceeded`` if waiting would pass the deadline"""
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise DeadlineExceeded("Request could not be admitted before its deadline")
+    
+    def _try_acquire(self, estimated_tokens: int) -> float:
+        """Start the request if allowed; otherwise return how long to wait"""
+        with self._cond:
+            return self._try_acquire_locked(estimated_tokens)
+    
+    def _try_acquire_locked(self, estimated_tokens: int) -> float:
+        """Start the request if allowed; callers hold the lock"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.concurrency):
+            # Woken early by a finishing request; the timeout bounds async polling
+            return 0.05
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self._in_flight += 1
+        self._stats['requests'] += 1
+        return 0
+    
+    def _on_success(self, headers: Optional[Mapping], estimated_tokens: int,
+                    used_tokens: Optional[int]):
+        """Record a completed request and grow concurrency if there is headroom"""
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None and used_tokens < estimated_tokens:
+                self.tokens.give_back(estimated_tokens - used_tokens)
+            self._observe(headers)
+            headroom = [h for h in (self.requests.headroom(), self.tokens.headroom()) if h is not None]
+            if all(h > HEADROOM_FRACTION for h in headroom):
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self._cond.notify_all()
+    
+    def _release(self, estimated_tokens: int):
+        """Free the slot and reserved tokens of a request abandoned without a result"""
+        with self._cond:
+            self._in_flight -= 1
+            self.tokens.give_back(estimated_tokens)
+            self._cond.notify_all()
+    
+    def _on_failure(self, error: Exception, attempt: int, estimated_tokens: int,
+                    deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Record a failed request
+        
+        Returns:
+            Seconds to wait before retrying, or None if the error is final
+        """
+        throttled = is_throttled(error)
+        retryable = is_transient(error)
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        
+        with self._cond:
+            self._in_flight -= 1
+            self.tokens.give_back(estimated_tokens)
+            self._observe(headers)
+            delay = self._retry_after(headers)
+            if delay is None:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            past_deadline = deadline is not None and time.monotonic() + delay >= deadline
+            if not retryable or attempt >= self.max_retries or past_deadline:
+                self._stats['failures'] += 1
+                self._cond.notify_all()
+                return None
+            
+            self._stats['retries'] += 1
+            if throttled:
+                self._stats['throttled'] += 1
+                now = time.monotonic()
+                self._paused_until = max(self._paused_until, now + delay)
+                # One decrease per burst of 429s from requests already in flight
+                if now - self._last_decrease > delay:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+            return delay
+    
+    def _observe(self, headers: Optional[Mapping]):
+        """Update the buckets from rate-limit headers; callers hold the lock"""
+        if not headers:
+            return
+        now = time.monotonic()
+        self.requests.observe(
+            self._number(headers.get('x-ratelimit-limit-requests')),
+            self._number(headers.get('x-ratelimit-remaining-requests')),
+            now
+        )
+        self.tokens.observe(
+            self._number(headers.get('x-ratelimit-limit-tokens')),
+            self._number(headers.get('x-ratelimit-remaining-tokens')),
+            now
+        )
+    
+    def _retry_after(self, headers: Optional[Mapping]) -> Optional[float]:
+        """Delay requested by the server, capped at ``max_delay``"""
+        if not headers:
+            return None
+        retry_after_ms = self._number(headers.get('retry-after-ms'))
+        if retry_after_ms is not None:
+            return min(self.max_delay, retry_after_ms / 1000.0)
+        retry_after = parse_duration(headers.get('retry-after'))
+        if retry_after is None:
+            retry_after = max(
+                parse_duration(headers.get('x-ratelimit-reset-requests')) or 0,
+                parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0
+            ) or None
+        return None if retry_after is None else min(self.max_delay, retry_after)
+    
+    @staticmethod
+    def _number(value: Optional[str]) -> Optional[float]:
+        """Parse a numeric header value"""
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,107 @@
+"""Latency tracking and failure isolation for API calls"""
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class LatencyTracker:
+    """
+    Keeps recent call latencies per key, e.g. call type and model
+    
+    Used to derive hedging delays: a call that has been running longer than
+    a high percentile of its recent peers is likely stuck in the tail.
+    """
+    
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+    
+    def record(self, key: Hashable, seconds: float):
+        """Record the latency of a successful call"""
+        with self._lock:
+            self._samples[key].append(seconds)
+    
+    def percentile(self, key: Hashable, percentile: float,
+                   recent: Optional[int] = None) -> Optional[float]:
+        """
+        Get a latency percentile for a key
+        
+        Args:
+            key: Kind of call, e.g. ``(call_type, model)``
+            percentile: Percentile between 0 and 100
+            recent: Only consider this many of the latest samples (optional)
+            
+        Returns:
+            Latency in seconds, or None until enough calls have been seen
+        """
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        if recent:
+            samples = samples[-recent:]
+        return float(np.percentile(samples, percentile))
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing API until it has had time to recover
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast with ``CircuitOpenError``. Once ``reset_timeout`` seconds
+    have passed a single trial call is let through: success closes the
+    circuit, failure opens it again.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+    
+    def before_call(self):
+        """Admit a call, or raise ``CircuitOpenError`` while the circuit is open"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_running = False
+            if self.state == 'open' or (self.state == 'half_open' and self._trial_running):
+                self._stats['rejected'] += 1
+                raise CircuitOpenError("API circuit is open after repeated failures")
+            if self.state == 'half_open':
+                self._trial_running = True
+    
+    def record_success(self):
+        """Record a successful call"""
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+    
+    def record_failure(self):
+        """Record a failed call, opening the circuit if failures keep coming"""
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self._stats['opened'] += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+    
+    def stats(self) -> Dict[str, int]:
+        """Get how often the circuit opened and how many calls it rejected"""
+        with self._lock:
+            return dict(self._stats)
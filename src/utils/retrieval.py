@@ -0,0 +1,214 @@
+"""Lightweight in-process retrieval over document chunks"""
+import re
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from ..processors.pdf_processor import PDFProcessor
+from .token_budget import TokenBudget
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the
+their this to was were which will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class ChunkIndex:
+    """
+    BM25 index over document chunks
+    
+    Postings are stored as flat NumPy arrays grouped by term, so building the
+    index and scoring a query are vectorized rather than per-document loops.
+    Excerpts are assembled against a size budget measured in characters, or
+    in tokens when the index is built with per-chunk token counts.
+    """
+    
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75,
+                 sizes: Optional[List[int]] = None, separator_size: int = 2):
+        """
+        Build the index
+        
+        Args:
+            chunks: Chunk texts, in document order
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+            sizes: Size of each chunk in the budget's unit (defaults to characters)
+            separator_size: Size of the separator between assembled chunks
+        """
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.sizes = list(sizes) if sizes is not None else [len(chunk) for chunk in chunks]
+        self.separator_size = separator_size
+        self.vocabulary = {}
+        
+        doc_ids = []
+        term_ids = []
+        for doc_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+            doc_ids.extend([doc_id] * len(tokens))
+        
+        num_docs = len(chunks)
+        num_terms = len(self.vocabulary)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        
+        doc_lengths = np.bincount(doc_ids, minlength=num_docs).astype(np.float64)
+        average_length = doc_lengths.mean() if num_docs and doc_lengths.mean() > 0 else 1.0
+        self._length_norm = k1 * (1 - b + b * doc_lengths / average_length)
+        
+        # One posting per distinct (term, document) pair, grouped by term
+        pairs, counts = np.unique(term_ids * max(num_docs, 1) + doc_ids, return_counts=True)
+        self._posting_docs = pairs % max(num_docs, 1)
+        self._posting_tf = counts.astype(np.float64)
+        posting_terms = pairs // max(num_docs, 1)
+        self._term_offsets = np.searchsorted(posting_terms, np.arange(num_terms + 1))
+        
+        doc_freq = np.diff(self._term_offsets).astype(np.float64)
+        self._idf = np.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+    
+    @classmethod
+    def from_text(cls, text: str, chunk_size: int = 800,
+                  budget: Optional[TokenBudget] = None,
+                  sections: Optional[List[Dict]] = None) -> 'ChunkIndex':
+        """
+        Chunk a document and index it
+        
+        Args:
+            text: Document text
+            chunk_size: Maximum characters per chunk
+            budget: Token budget used to size chunks in tokens (optional)
+            sections: Section tree of the text; chunks then stay within one
+                      section, so an excerpt never carries half of another
+                      
+        Returns:
+            Index over the document's chunks
+        """
+        if sections:
+            chunks = [chunk['text'] for chunk in PDFProcessor().chunk_sections(text, sections, chunk_size)]
+        else:
+            chunks = PDFProcessor().chunk_content(text, chunk_size=chunk_size)
+        if budget is None:
+            return cls(chunks)
+        return cls(chunks, sizes=budget.count_many(chunks), separator_size=budget.count('\n\n'))
+    
+    @property
+    def total_size(self) -> int:
+        """Size of the whole document when assembled"""
+        return sum(self.sizes) + self.separator_size * max(0, len(self.sizes) - 1)
+    
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every chunk against a query
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            BM25 score per chunk
+        """
+        scores = np.zeros(len(self.chunks))
+        for token in set(tokenize(query)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+            docs = self._posting_docs[start:end]
+            tf = self._posting_tf[start:end]
+            scores[docs] += self._idf[term_id] * tf * (self.k1 + 1) / (tf + self._length_norm[docs])
+        return scores
+    
+    def search(self, query: str, k: int = 3) -> List[int]:
+        """
+        Find the chunks most relevant to a query
+        
+        Args:
+            query: Query text
+            k: Number of chunks to return
+            
+        Returns:
+            Chunk indices, best match first
+        """
+        scores = self.scores(query)
+        order = np.argsort(-scores, kind='stable')
+        return [int(i) for i in order[:k] if scores[i] > 0]
+    
+    def context_for(self, query: str, max_size: int) -> str:
+        """
+        Assemble the most relevant chunks for a query into a prompt excerpt
+        
+        Chunks are taken best match first until ``max_size`` is reached and
+        then joined in document order. Falls back to the opening chunks when
+        nothing matches.
+        
+        Args:
+            query: Query text
+            max_size: Size budget for the excerpt
+            
+        Returns:
+            Excerpt of relevant source text
+        """
+        ranked = self.search(query, k=len(self.chunks))
+        if not ranked:
+            return self._assemble(range(len(self.chunks)), max_size, fill=False)
+        return self._assemble(ranked, max_size)
+    
+    def coverage(self, max_size: int) -> str:
+        """
+        Assemble chunks spread across the whole document into a prompt excerpt
+        
+        The document is split into equal segments, one per chunk that fits
+        the budget, and the most information-dense chunk (highest total IDF
+        of its distinct terms) is taken from each.
+        
+        Args:
+            max_size: Size budget for the excerpt
+            
+        Returns:
+            Excerpt covering the document
+        """
+        if not self.chunks:
+            return ''
+        
+        average_chunk = max(1, -(-sum(self.sizes) // len(self.chunks)))
+        num_segments = max(1, min(len(self.chunks), max_size // (average_chunk + self.separator_size)))
+        
+        density = np.zeros(len(self.chunks))
+        np.add.at(density, self._posting_docs, self._idf[self._posting_terms()])
+        
+        picks = []
+        for segment in np.array_split(np.arange(len(self.chunks)), num_segments):
+            if len(segment):
+                picks.append(int(segment[np.argmax(density[segment])]))
+        return self._assemble(picks, max_size)
+    
+    def _posting_terms(self) -> np.ndarray:
+        """Term id of every posting"""
+        return np.repeat(np.arange(len(self._term_offsets) - 1), np.diff(self._term_offsets))
+    
+    def _assemble(self, ranked: Iterable[int], max_size: int, fill: bool = True) -> str:
+        """
+        Join chunks in document order, taking them in rank order until the budget is spent
+        
+        With ``fill``, chunks that do not fit are skipped in favour of smaller
+        lower-ranked ones; otherwise assembly stops at the first one.
+        """
+        chosen = []
+        used = 0
+        for i in ranked:
+            cost = self.sizes[i] + self.separator_size
+            if chosen and used + cost > max_size:
+                if not fill:
+                    break
+                continue
+            chosen.append(i)
+            used += cost
+            if used >= max_size:
+                break
+        return '\n\n'.join(self.chunks[i] for i in sorted(chosen))
@@ -0,0 +1,110 @@
+"""Per-call-type model routing with latency-based fallback"""
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+from .resilience import LatencyTracker
+
+# Call types that can be routed
+CALL_TYPES = (
+    'analysis', 'key_concepts', 'simplify', 'relationships', 'module', 'module_quiz',
+    'quiz', 'flashcards', 'concept_flashcards', 'diagram_spec', 'transcription'
+)
+
+# Latency percentile compared against a route's SLO, over the latest samples
+# only, so that a few fast probes are enough to show the primary recovered
+SLO_PERCENTILE = 90
+SLO_WINDOW = 5
+
+# While falling back, every n-th call still goes to the primary model so
+# that its latency history stays current and recovery is noticed
+PROBE_INTERVAL = 10
+
+
+class Route(NamedTuple):
+    """Backend and model settings for one call type; unset fields keep the caller's values"""
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    fallback_model: Optional[str] = None
+    latency_slo: Optional[float] = None
+    provider: Optional[str] = None
+
+
+class ModelRouter:
+    """
+    Chooses the model and sampling settings for each call type
+    
+    A route with a ``fallback_model`` and a ``latency_slo`` switches to the
+    fallback while the primary model's recent latency for that call type
+    exceeds the SLO. Only the latest ``SLO_WINDOW`` calls to the primary are
+    judged, so it switches back once that many probe calls have been fast.
+    """
+    
+    def __init__(self, routes: Optional[Dict[str, Route]] = None,
+                 latency: Optional[LatencyTracker] = None,
+                 probe_interval: int = PROBE_INTERVAL):
+        """
+        Initialize the router
+        
+        Args:
+            routes: Route per call type; call types without one keep the caller's settings
+            latency: Latency history keyed by ``(call_type, model)``
+            probe_interval: While falling back, send every n-th call to the primary
+        """
+        self.routes = dict(routes or {})
+        self.latency = latency or LatencyTracker()
+        self.probe_interval = max(1, probe_interval)
+        self._fallback_calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'fallbacks': 0}
+    
+    def resolve(self, call_type: str, model: str,
+                temperature: float) -> Tuple[str, float, Optional[int]]:
+        """
+        Get the settings for a call
+        
+        Args:
+            call_type: Kind of call
+            model: Model requested by the caller
+            temperature: Temperature requested by the caller
+            
+        Returns:
+            Model, temperature and completion token limit (None for no limit)
+        """
+        route = self.routes.get(call_type, Route())
+        primary = route.model or model
+        if route.temperature is not None:
+            temperature = route.temperature
+        if route.fallback_model and route.latency_slo and self._fall_back(call_type, primary, route):
+            return route.fallback_model, temperature, route.max_tokens
+        return primary, temperature, route.max_tokens
+    
+    def provider_for(self, call_type: str) -> Optional[str]:
+        """
+        Get the provider a call type is routed to
+        
+        Args:
+            call_type: Kind of call
+            
+        Returns:
+            Provider name, or None for the client's default provider
+        """
+        return self.routes.get(call_type, Route()).provider
+    
+    def stats(self) -> Dict[str, int]:
+        """Get how many calls were sent to a fallback model"""
+        with self._lock:
+            return dict(self._stats)
+    
+    def _fall_back(self, call_type: str, primary: str, route: Route) -> bool:
+        """Whether a call should go to the fallback model, letting periodic probes through"""
+        latency = self.latency.percentile((call_type, primary), SLO_PERCENTILE, recent=SLO_WINDOW)
+        with self._lock:
+            if latency is None or latency <= route.latency_slo:
+                self._fallback_calls.pop(call_type, None)
+                return False
+            calls = self._fallback_calls.get(call_type, 0) + 1
+            self._fallback_calls[call_type] = calls
+            if calls % self.probe_interval == 0:
+                return False
+            self._stats['fallbacks'] += 1
+            return True
@@ -0,0 +1,116 @@
+"""Dependency-aware stage scheduling for the generation pipeline"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List
+from .batch import BatchDeferred, in_current_context
+
+
+class StageScheduler:
+    """
+    Runs pipeline stages as a dependency graph
+    
+    A stage starts as soon as every stage it depends on has finished, with at
+    most ``max_workers`` stages running at once. Stages may register further
+    stages while they run, so a stage such as content analysis can fan out
+    into work whose shape is only known once it completes.
+    
+    A stage that raises ``BatchDeferred`` is set aside without stopping the
+    run: the stages depending on it never start, the others still run, and
+    ``run`` then raises ``BatchDeferred`` so that the whole graph can be
+    retried once the batch has answered.
+    """
+    
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+        self._stages = {}
+        self._pending = {}
+        self._running = set()
+        self._results = {}
+        self._error = None
+        self._deferred = None
+        self._cond = threading.Condition()
+    
+    def add_stage(self, name: str, func: Callable[..., Any],
+                  depends_on: Iterable[str] = ()):
+        """
+        Register a stage
+        
+        Args:
+            name: Unique stage name
+            func: Callable invoked with the results of ``depends_on``, in order
+            depends_on: Names of stages that must finish first
+        """
+        with self._cond:
+            if name in self._stages:
+                raise ValueError(f"Stage already registered: {name}")
+            self._stages[name] = (func, tuple(depends_on))
+            self._pending[name] = None
+            self._cond.notify_all()
+    
+    def result(self, name: str) -> Any:
+        """Get the result of a finished stage"""
+        with self._cond:
+            return self._results[name]
+    
+    def run(self) -> Dict[str, Any]:
+        """
+        Run all registered stages
+        
+        Returns:
+            Dictionary mapping stage names to their results
+        """
+        run_stage = in_current_context(self._run_stage)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            with self._cond:
+                while True:
+                    if self._error is None:
+                        for name in self._ready_stages():
+                            del self._pending[name]
+                            self._running.add(name)
+                            executor.submit(run_stage, name)
+                    if not self._running:
+                        break
+                    self._cond.wait()
+        
+        if self._error is not None:
+            raise self._error
+        if self._deferred is not None:
+            raise self._deferred
+        if self._pending:
+            raise ValueError(
+                f"Stages with unresolved dependencies: {', '.join(self._pending)}"
+            )
+        return dict(self._results)
+    
+    def _ready_stages(self) -> List[str]:
+        """Pending stages whose dependencies have all finished, in registration order"""
+        return [
+            name for name in self._pending
+            if all(dep in self._results for dep in self._stages[name][1])
+        ]
+    
+    def _run_stage(self, name: str):
+        """Execute one stage and record its result"""
+        func, depends_on = self._stages[name]
+        try:
+            with self._cond:
+                args = [self._results[dep] for dep in depends_on]
+            result = func(*args)
+        except BatchDeferred as e:
+            with self._cond:
+                self._deferred = self._deferred or e
+                self._running.discard(name)
+                self._cond.notify_all()
+            return
+        except BaseException as e:
+            with self._cond:
+                if self._error is None:
+                    self._error = e
+                self._running.discard(name)
+                self._cond.notify_all()
+            return
+        
+        with self._cond:
+            self._results[name] = result
+            self._running.discard(name)
+            self._cond.notify_all()
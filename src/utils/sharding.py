@@ -0,0 +1,112 @@
+"""Splitting of long-output generation into parallel shards"""
+import re
+from typing import Callable, Dict, List, Tuple
+from .retrieval import tokenize
+
+WHITESPACE_PATTERN = re.compile(r'\s')
+
+
+def shard_counts(total: int, shard_size: int) -> List[int]:
+    """
+    Divide a number of items into near-equal shards
+    
+    Args:
+        total: Number of items to generate
+        shard_size: Maximum items per shard (0 disables sharding)
+        
+    Returns:
+        Items per shard, largest first
+    """
+    if total <= 0:
+        return []
+    if shard_size <= 0 or total <= shard_size:
+        return [total]
+    return _spread(total, -(-total // shard_size))
+
+
+def _spread(total: int, parts: int) -> List[int]:
+    """Divide ``total`` into ``parts`` counts differing by at most one"""
+    base, extra = divmod(total, parts)
+    return [base + 1 if i < extra else base for i in range(parts)]
+
+
+def split_content(text: str, parts: int) -> List[str]:
+    """
+    Cut text into contiguous, disjoint slices of similar length
+    
+    Each cut is moved to the nearest paragraph break, or failing that the
+    next whitespace, so no word is split between slices. Short texts may
+    yield fewer slices than requested.
+    
+    Args:
+        text: Text to split
+        parts: Number of slices wanted
+        
+    Returns:
+        Non-empty slices in document order
+    """
+    if parts <= 1:
+        return [text] if text.strip() else []
+    
+    tolerance = len(text) // (parts * 2)
+    cuts = [0]
+    for i in range(1, parts):
+        target = max(cuts[-1], len(text) * i // parts)
+        breaks = [text.rfind('\n\n', cuts[-1], target + 1), text.find('\n\n', target)]
+        breaks = [b for b in breaks if b != -1 and abs(b - target) <= tolerance]
+        if breaks:
+            cuts.append(min(breaks, key=lambda b: abs(b - target)))
+            continue
+        match = WHITESPACE_PATTERN.search(text, target)
+        cuts.append(match.start() if match else len(text))
+    cuts.append(len(text))
+    
+    slices = (text[start:end].strip() for start, end in zip(cuts, cuts[1:]))
+    return [piece for piece in slices if piece]
+
+
+def allocate(total: int, shard_size: int, text: str) -> List[Tuple[str, int]]:
+    """
+    Pair content slices with the number of items to generate from each
+    
+    Args:
+        total: Number of items to generate
+        shard_size: Maximum items per shard (0 disables sharding)
+        text: Source content
+        
+    Returns:
+        (content slice, item count) per shard
+    """
+    slices = split_content(text, len(shard_counts(total, shard_size)))
+    if len(slices) <= 1:
+        return [(text, total)]
+    return list(zip(slices, _spread(total, len(slices))))
+
+
+def deduplicate(items: List[Dict], text_of: Callable[[Dict], str],
+                threshold: float = 0.8) -> List[Dict]:
+    """
+    Drop items whose text nearly repeats an earlier item
+    
+    Items are compared by the Jaccard similarity of their word sets, so
+    rewordings that differ only in punctuation, case or filler words match.
+    
+    Args:
+        items: Generated items, in merge order
+        text_of: Function giving the text to compare for an item
+        threshold: Similarity at or above which items are duplicates
+        
+    Returns:
+        Items with near-duplicates removed, first occurrence kept
+    """
+    kept = []
+    seen = []
+    for item in items:
+        words = set(tokenize(text_of(item)))
+        if any(words == other or (words and other and
+                                  len(words & other) / len(words | other) >= threshold)
+               for other in seen):
+            continue
+        kept.append(item)
+        seen.append(words)
+    return kept
@@ -0,0 +1,97 @@
+"""Coalescing of identical in-flight calls"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Shares one execution among concurrent callers with the same key
+    
+    The first caller for a key runs the work; callers arriving while it is
+    in flight wait for that result instead of repeating the work, and
+    receive the same exception if it fails. Once the call finishes the key is
+    released, so later callers start a fresh call. Waiting works across
+    threads and event loops, since followers wait on a thread-safe future.
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'shared': 0}
+    
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run ``func`` unless a call for ``key`` is already in flight
+        
+        Args:
+            key: Identity of the call
+            func: Work to run
+            
+        Returns:
+            The result of the shared call
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+    
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await ``func()`` unless a call for ``key`` is already in flight
+        
+        Args:
+            key: Identity of the call
+            func: Coroutine function doing the work
+            
+        Returns:
+            The result of the shared call
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded so that cancelling one follower leaves the shared
+            # future, and so the leader and other followers, untouched
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the number of calls made and of calls saved by sharing"""
+        with self._lock:
+            return dict(self._stats)
+    
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Get the in-flight future for a key and whether the caller leads it"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats['shared'] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self._stats['calls'] += 1
+            return future, True
+    
+    def _finish(self, key: Hashable, future: Future, result: Any = None,
+                error: BaseException = None):
+        """Release the key and hand the outcome to every waiting caller"""
+        with self._lock:
+            self._calls.pop(key, None)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
@@ -0,0 +1,225 @@
+"""Token-aware sizing of prompt content"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+# Context windows of known models, matched by longest name prefix
+CONTEXT_WINDOWS = {
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4-1106': 128000,
+    'gpt-4-0125': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens reserved for a prompt's instructions around the source content
+PROMPT_TEMPLATE_TOKENS = 400
+
+# Characters per token assumed when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Framing tokens added by the chat format per message and per reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+class _ApproximateEncoding:
+    """Stand-in for a tiktoken encoding that counts fixed-width character groups"""
+    
+    name = 'approximate'
+    
+    def encode_ordinary(self, text: str) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+    
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[str]]:
+        return [self.encode_ordinary(text) for text in texts]
+    
+    def decode(self, tokens: List[str]) -> str:
+        return ''.join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    Get the tokenizer for a model, loading it once per process
+    
+    Unknown models use ``cl100k_base``. If the encoding files cannot be
+    loaded (e.g. offline), counts fall back to a characters-per-token estimate.
+    
+    Args:
+        model: Model name
+        
+    Returns:
+        Encoding object
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        print(f"Could not load tokenizer for {model}, estimating token counts: {e}")
+        return _ApproximateEncoding()
+
+
+def context_window(model: str) -> int:
+    """
+    Get the context window of a model
+    
+    Args:
+        model: Model name
+        
+    Returns:
+        Maximum tokens of prompt plus completion
+    """
+    for prefix in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+class TokenBudget:
+    """
+    Sizes prompt content in tokens for a model
+    
+    The room left for source content is the configured input budget, capped
+    so that the prompt plus ``output_reserve_tokens`` fits the model's context
+    window, minus ``PROMPT_TEMPLATE_TOKENS`` for the instructions around it.
+    """
+    
+    def __init__(self, model: str = "gpt-4", max_input_tokens: int = 6000,
+                 output_reserve_tokens: int = 2048,
+                 context_window_tokens: Optional[int] = None):
+        """
+        Initialize the budget
+        
+        Args:
+            model: Model name
+            max_input_tokens: Upper bound on prompt tokens
+            output_reserve_tokens: Tokens kept free for the completion
+            context_window_tokens: Context window override (optional)
+        """
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+        self.output_reserve_tokens = output_reserve_tokens
+        self.context_window_tokens = context_window_tokens or context_window(model)
+        self.encoding = get_encoding(model)
+    
+    @property
+    def input_tokens(self) -> int:
+        """Tokens available for the whole prompt"""
+        return max(0, min(self.max_input_tokens,
+                          self.context_window_tokens - self.output_reserve_tokens))
+    
+    @property
+    def content_tokens(self) -> int:
+        """Tokens available for source content within a prompt"""
+        return max(0, self.input_tokens - PROMPT_TEMPLATE_TOKENS)
+    
+    def count(self, text: str) -> int:
+        """
+        Count the tokens in a text
+        
+        Args:
+            text: Text to count
+            
+        Returns:
+            Number of tokens
+        """
+        return len(self.encoding.encode_ordinary(text))
+    
+    def count_many(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens in several texts in one batch
+        
+        Args:
+            texts: Texts to count
+            
+        Returns:
+            Number of tokens per text
+        """
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(list(texts))]
+    
+    def count_messages(self, messages: List[Dict]) -> int:
+        """
+        Count the prompt tokens of chat messages, including message framing
+        
+        Args:
+            messages: Chat messages
+            
+        Returns:
+            Number of prompt tokens
+        """
+        counts = self.count_many([message.get('content') or '' for message in messages])
+        return sum(counts) + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text to at most ``max_tokens`` tokens
+        
+        Only a prefix of the text is encoded, growing until it holds more
+        tokens than allowed, so long documents cost about as much as the
+        excerpt taken from them.
+        
+        Args:
+            text: Text to cut
+            max_tokens: Token limit
+            
+        Returns:
+            The longest token-aligned prefix within the limit
+        """
+        if max_tokens <= 0:
+            return ''
+        
+        prefix_chars = (max_tokens + 1) * CHARS_PER_TOKEN * 2
+        while True:
+            tokens = self.encoding.encode_ordinary(text[:prefix_chars])
+            if len(tokens) > max_tokens:
+                return self.encoding.decode(tokens[:max_tokens])
+            if prefix_chars >= len(text):
+                return text
+            prefix_chars *= 2
+    
+    def fit(self, text: str, share: float = 1.0) -> str:
+        """
+        Cut source content to the room available for it in a prompt
+        
+        Args:
+            text: Source content
+            share: Fraction of the content budget to use
+            
+        Returns:
+            Content that fits the budget
+        """
+        return self.truncate(text, int(self.content_tokens * share))
+    
+    def split(self, texts: List[str], max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Split texts so that none exceeds a token limit
+        
+        Texts are counted in one batch, and only those over the limit are cut
+        into consecutive token windows.
+        
+        Args:
+            texts: Texts to check
+            max_tokens: Token limit (defaults to the content budget)
+            
+        Returns:
+            Texts in the same order, oversized ones replaced by their pieces
+        """
+        limit = max(1, max_tokens or self.content_tokens)
+        pieces = []
+        for text, count in zip(texts, self.count_many(texts)):
+            if count <= limit:
+                pieces.append(text)
+                continue
+            tokens = self.encoding.encode_ordinary(text)
+            pieces.extend(
+                self.encoding.decode(tokens[start:start + limit])
+                for start in range(0, len(tokens), limit)
+            )
+        return pieces
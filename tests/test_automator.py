@@ -0,0 +1,254 @@
+"""Tests for the main automator pipeline"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.study_material_automator import StudyMaterialAutomator
+from src.utils import Config
+
+
+class TestStudyMaterialAutomator(unittest.TestCase):
+    """Test pipeline orchestration with stubbed generators"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = {
+            'OPENAI_API_KEY': 'test-key',
+            'OUTPUT_DIR': os.path.join(self.tmp.name, 'output'),
+            'TEMP_DIR': os.path.join(self.tmp.name, 'temp'),
+            'CACHE_DIR': os.path.join(self.tmp.name, 'cache'),
+            'MAX_INPUT_TOKENS': '900',
+        }
+        with mock.patch.dict(os.environ, env):
+            self.automator = StudyMaterialAutomator(Config())
+        
+        self.analysis = {
+            'main_topics': ['Cells', 'Energy'],
+            'concepts': {},
+            'difficulty': 'beginner',
+            'module_structure': ['Cells', 'Energy']
+        }
+        self.automator.content_analyzer.analyze_content = mock.Mock(return_value=self.analysis)
+        self.automator.module_generator._create_module = mock.Mock(
+            side_effect=lambda module_name, module_number, content, concepts: {
+                'module_number': module_number, 'module_name': module_name,
+                'title': module_name, 'introduction': f'About {module_name}'
+            }
+        )
+        self.automator.quiz_generator.generate_module_quiz = mock.Mock(
+            side_effect=lambda module: {'questions': [], 'module_name': module['title'], 'total_points': 0}
+        )
+        self.automator.quiz_generator.generate_quiz = mock.Mock(
+            return_value={'questions': [], 'total_points': 0, 'num_questions': 0, 'complete': True}
+        )
+        self.automator.flashcard_generator.generate_flashcard_set = mock.Mock(
+            return_value={'flashcards': [{'front': 'Q', 'back': 'A', 'difficulty': 'easy'}], 'complete': True}
+        )
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    @staticmethod
+    def _pdf_content(pages):
+        """Build a PDFProcessor.extract_text style result"""
+        return {
+            'text': ''.join(page + '\n\n' for page in pages),
+            'pages': [{'page_number': i, 'text': page} for i, page in enumerate(pages, 1)],
+            'metadata': {'num_pages': len(pages)}
+        }
+    
+    def _write_pdf(self, name, data):
+        """Write a placeholder input file"""
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+    
+    def test_generate_study_materials_outputs(self):
+        """Test results and summary keep their order and layout"""
+        output_dir = os.path.join(self.tmp.name, 'run')
+        results = self.automator.generate_study_materials('Some content', self.analysis, output_dir)
+        
+        self.assertEqual(
+            [os.path.basename(p) for p in results['modules']],
+            ['module_1.txt', 'module_2.txt']
+        )
+        self.assertEqual(
+            [os.path.basename(p) for p in results['quizzes']],
+            ['module_1_quiz.txt', 'module_2_quiz.txt', 'comprehensive_quiz.txt']
+        )
+        self.assertEqual(len(results['flashcards']), 1)
+        
+        with open(os.path.join(output_dir, 'summary.json'), encoding='utf-8') as f:
+            summary = json.load(f)
+        self.assertEqual(summary['analysis'], self.analysis)
+        self.assertEqual(summary['modules'], ['module_1.txt', 'module_2.txt'])
+    
+    def test_analysis_runs_as_stage(self):
+        """Test the analysis stage plans modules when no analysis is given"""
+        output_dir = os.path.join(self.tmp.name, 'run')
+        results = self.automator._run_generation('Some content', output_dir)
+        
+        self.automator.content_analyzer.analyze_content.assert_called_once_with('Some content')
+        self.assertEqual(len(results['modules']), 2)
+    
+    
+    def test_process_materials_resumes_from_checkpoints(self):
+        """Test a re-run after a failure reuses completed units"""
+        pdf_path = self._write_pdf('notes.pdf', b'%PDF-1.4 test')
+        output_dir = os.path.join(self.tmp.name, 'run')
+        self.automator.process_pdf = mock.Mock(return_value=self._pdf_content(['Some content']))
+        self.automator.quiz_generator.generate_quiz.side_effect = RuntimeError("worker restarted")
+        
+        with self.assertRaises(RuntimeError):
+            self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        
+        self.automator.quiz_generator.generate_quiz.side_effect = None
+        self.automator.quiz_generator.generate_quiz.return_value = {
+            'questions': [{'question': 'Q'}], 'total_points': 1, 'num_questions': 1, 'complete': True
+        }
+        results = self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        
+        self.assertEqual(self.automator.process_pdf.call_count, 1)
+        self.assertEqual(self.automator.content_analyzer.analyze_content.call_count, 1)
+        self.assertEqual(self.automator.flashcard_generator.generate_flashcard_set.call_count, 1)
+        self.assertEqual(len(results['quizzes']), 3)
+        with open(os.path.join(output_dir, 'run_manifest.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['status'], 'complete')
+    
+    
+    def test_resume_regenerates_after_shard_failure(self):
+        """Test a deck or quiz missing a failed shard is not reused on resume"""
+        pdf_path = self._write_pdf('notes.pdf', b'%PDF-1.4 test')
+        output_dir = os.path.join(self.tmp.name, 'run')
+        self.automator.process_pdf = mock.Mock(return_value=self._pdf_content(['Some content']))
+        flashcard_set = self.automator.flashcard_generator.generate_flashcard_set
+        generate_quiz = self.automator.quiz_generator.generate_quiz
+        flashcard_set.return_value = {
+            'flashcards': [{'front': 'Q', 'back': 'A', 'difficulty': 'easy'}], 'complete': False
+        }
+        generate_quiz.return_value = {
+            'questions': [{'question': 'Q'}], 'total_points': 1, 'num_questions': 1, 'complete': False
+        }
+        
+        results = self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(len(results['flashcards']), 1)
+        
+        flashcard_set.return_value = dict(flashcard_set.return_value, complete=True)
+        generate_quiz.return_value = dict(generate_quiz.return_value, complete=True)
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(flashcard_set.call_count, 2)
+        self.assertEqual(generate_quiz.call_count, 2)
+        
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(flashcard_set.call_count, 2)
+        self.assertEqual(generate_quiz.call_count, 2)
+    
+    
+    def test_resume_reextracts_pdf_after_extraction_settings_change(self):
+        """Test checkpointed pages are not reused once the extraction settings differ"""
+        pdf_path = self._write_pdf('notes.pdf', b'%PDF-1.4 test')
+        output_dir = os.path.join(self.tmp.name, 'run')
+        self.automator.process_pdf = mock.Mock(return_value=self._pdf_content(['Some content']))
+        
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(self.automator.process_pdf.call_count, 1)
+        
+        self.automator.config.pdf_strip_boilerplate = not self.automator.config.pdf_strip_boilerplate
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(self.automator.process_pdf.call_count, 2)
+        
+        self.automator.pdf_processor.extractor = 'layout'
+        self.automator.process_materials(pdf_path=pdf_path, output_dir=output_dir)
+        self.assertEqual(self.automator.process_pdf.call_count, 3)
+    
+    
+    def test_update_materials_regenerates_only_changed_units(self):
+        """Test an added PDF only rebuilds units whose source text changed"""
+        output_dir = os.path.join(self.tmp.name, 'run')
+        first_pdf = self._write_pdf('week1.pdf', b'%PDF-1.4 week1')
+        self.automator.process_pdf = mock.Mock(return_value=self._pdf_content([' '.join(['alpha'] * 2000), 'Page two']))
+        self.automator.process_materials(pdf_path=first_pdf, output_dir=output_dir)
+        
+        # The second PDF lands beyond every prompt excerpt
+        self.automator.process_pdf.return_value = self._pdf_content(['Week two'])
+        self.automator.quiz_generator.generate_quiz.return_value = {
+            'questions': [{'question': 'Q'}], 'total_points': 1, 'num_questions': 1, 'complete': True
+        }
+        second_pdf = self._write_pdf('week2.pdf', b'%PDF-1.4 week2')
+        results = self.automator.update_materials(output_dir, pdf_path=second_pdf)
+        
+        self.assertEqual(self.automator.content_analyzer.analyze_content.call_count, 1)
+        self.assertEqual(self.automator.module_generator._create_module.call_count, 2)
+        self.assertEqual(len(results['modules']), 2)
+        
+        # Revising the first PDF changes the text every excerpt starts with
+        self.automator.process_pdf.return_value = self._pdf_content([' '.join(['bravo'] * 2000), 'Page two'])
+        revised_pdf = self._write_pdf('week1.pdf', b'%PDF-1.4 week1 revised')
+        self.automator.update_materials(output_dir, pdf_path=revised_pdf)
+        
+        self.assertEqual(self.automator.content_analyzer.analyze_content.call_count, 2)
+        with open(os.path.join(output_dir, 'run_manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['last_update']['page_diffs']['week1.pdf']['pages'], [1])
+        self.assertEqual([s['name'] for s in manifest['sources']], ['week1.pdf', 'week2.pdf'])
+
+
+
+class TestBatchMode(unittest.TestCase):
+    """Test batch processing through the offline fake provider"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = {
+            'OPENAI_API_KEY': '',
+            'LLM_PROVIDER': 'fake',
+            'LLM_CACHE_ENABLED': 'false',
+            'OUTPUT_DIR': os.path.join(self.tmp.name, 'output'),
+            'TEMP_DIR': os.path.join(self.tmp.name, 'temp'),
+            'CACHE_DIR': os.path.join(self.tmp.name, 'cache'),
+        }
+        with mock.patch.dict(os.environ, env):
+            self.automator = StudyMaterialAutomator(Config())
+        text = "Mitochondria produce energy. Ribosomes build proteins. Mitochondria and ribosomes are organelles."
+        self.automator.process_pdf = mock.Mock(return_value={
+            'text': text + '\n\n', 'pages': [{'page_number': 1, 'text': text}], 'metadata': {'num_pages': 1}
+        })
+        self.automator.diagram_generator.generate_concept_diagram = mock.Mock()
+        self.pdf_path = os.path.join(self.tmp.name, 'notes.pdf')
+        with open(self.pdf_path, 'wb') as f:
+            f.write(b'%PDF-1.4 test')
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_batch_run_matches_interactive_run(self):
+        """Test batch rounds answer every stage and export the same materials"""
+        interactive_dir = os.path.join(self.tmp.name, 'interactive')
+        batch_dir = os.path.join(self.tmp.name, 'batch')
+        fake = self.automator.llm.provider
+        
+        expected = self.automator.process_materials(pdf_path=self.pdf_path, output_dir=interactive_dir)
+        interactive_calls = len(fake.requests)
+        results = self.automator.process_materials(pdf_path=self.pdf_path, output_dir=batch_dir, batch=True)
+        
+        prompts = {json.dumps(request['messages']) for request in fake.requests[:interactive_calls]}
+        self.assertEqual(len(fake.requests) - interactive_calls, len(prompts))
+        self.assertEqual(sorted(os.listdir(os.path.join(batch_dir, '.batch'))), [
+            'round_1_fake.jsonl', 'round_1_fake.output.jsonl',
+            'round_2_fake.jsonl', 'round_2_fake.output.jsonl',
+            'round_3_fake.jsonl', 'round_3_fake.output.jsonl'
+        ])
+        self.assertGreater(len(results['modules']), 1)
+        for category in ('modules', 'flashcards', 'quizzes'):
+            self.assertEqual(len(results[category]), len(expected[category]))
+            for expected_path, path in zip(expected[category], results[category]):
+                with open(expected_path, encoding='utf-8') as f, open(path, encoding='utf-8') as g:
+                    self.assertEqual(g.read(), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
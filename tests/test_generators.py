@@ -0,0 +1,164 @@
+"""Tests for generator modules"""
+import asyncio
+import copy
+import unittest
+from src.generators import FlashcardGenerator, ModuleGenerator, QuizGenerator
+from src.utils import ContentAnalyzer
+
+
+class StubLLM:
+    """Returns canned JSON responses and records the messages it was sent"""
+    
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+    
+    def complete_json(self, model, messages, temperature=0.7, call_type='default'):
+        self.calls.append(messages)
+        return copy.deepcopy(self.response)
+    
+    async def acomplete_json(self, model, messages, temperature=0.7, call_type='default'):
+        self.calls.append(messages)
+        return copy.deepcopy(self.response)
+
+
+class TestAsyncGenerators(unittest.TestCase):
+    """Test sync and async generator entry points"""
+    
+    def test_quiz_sync_and_async_match(self):
+        """Test both quiz entry points normalize the response the same way"""
+        llm = StubLLM({'quiz': {'questions': [{'question': 'Q1', 'points': 2}]}})
+        generator = QuizGenerator(api_key='test', llm=llm)
+        
+        sync_quiz = generator.generate_quiz('content', num_questions=1)
+        async_quiz = asyncio.run(generator.agenerate_quiz('content', num_questions=1))
+        
+        self.assertEqual(sync_quiz, async_quiz)
+        self.assertEqual(sync_quiz['total_points'], 2)
+        self.assertEqual(llm.calls[0], llm.calls[1])
+    
+    def test_module_quiz_uses_module_content(self):
+        """Test module quizzes are built from the module text"""
+        llm = StubLLM({'questions': []})
+        generator = QuizGenerator(api_key='test', llm=llm)
+        module = {'title': 'Cells', 'introduction': 'Cells are small.', 'sections': ['Mitochondria']}
+        
+        quiz = asyncio.run(generator.agenerate_module_quiz(module))
+        
+        self.assertEqual(quiz['module_name'], 'Cells')
+        self.assertIn('Mitochondria', llm.calls[0][1]['content'])
+    
+    def test_agenerate_modules(self):
+        """Test modules are created for each planned module"""
+        llm = StubLLM({'title': 'Generated'})
+        generator = ModuleGenerator(api_key='test', llm=llm)
+        analysis = {'module_structure': ['One', 'Two', 'Three']}
+        
+        modules = asyncio.run(generator.agenerate_modules('content', analysis))
+        
+        self.assertEqual([m['module_number'] for m in modules], [1, 2, 3])
+        self.assertEqual([m['module_name'] for m in modules], ['One', 'Two', 'Three'])
+    
+    def test_async_errors_fall_back(self):
+        """Test async failures return the same fallbacks as sync calls"""
+        class FailingLLM(StubLLM):
+            async def acomplete_json(self, model, messages, temperature=0.7, call_type='default'):
+                raise RuntimeError("API down")
+        
+        flashcards = asyncio.run(
+            FlashcardGenerator(api_key='test', llm=FailingLLM({})).agenerate_flashcards('content')
+        )
+        analysis = asyncio.run(
+            ContentAnalyzer(api_key='test', llm=FailingLLM({})).aanalyze_content('content')
+        )
+        
+        self.assertEqual(flashcards, [])
+        self.assertEqual(analysis['main_topics'], [])
+
+
+
+class TestPromptLayout(unittest.TestCase):
+    """Test prompts share a stable prefix for provider-side prompt caching"""
+    
+    def test_prompts_share_preamble_and_source_prefix(self):
+        """Test calls over the same source differ only after the source"""
+        llm = StubLLM({})
+        content = 'Cells are the basic unit of life.'
+        
+        ContentAnalyzer(api_key='test', llm=llm).analyze_content(content)
+        ModuleGenerator(api_key='test', llm=llm).generate_modules(content, {'module_structure': ['Cells']})
+        QuizGenerator(api_key='test', llm=llm).generate_quiz(content, num_questions=5)
+        FlashcardGenerator(api_key='test', llm=llm).generate_flashcards(content, num_cards=5)
+        
+        prefix = f"Source material:\n{content}\n\nTask:\n"
+        self.assertEqual(len({messages[0]['content'] for messages in llm.calls}), 1)
+        self.assertTrue(all(messages[1]['content'].startswith(prefix) for messages in llm.calls))
+
+
+class TestShardedGeneration(unittest.TestCase):
+    """Test large decks and quizzes are split into parallel requests"""
+    
+    content = '\n\n'.join(f'Paragraph {i} ' + 'about cells ' * 20 for i in range(8))
+    
+    def test_flashcards_are_sharded_over_disjoint_slices(self):
+        """Test each shard gets its own slice and repeated cards are merged"""
+        llm = StubLLM({'flashcards': [
+            {'front': 'What is a cell?', 'back': 'A unit'},
+            {'front': 'What is a cell', 'back': 'The unit of life'},
+            {'front': 'Define mitosis', 'back': 'Division'}
+        ]})
+        generator = FlashcardGenerator(api_key='test', llm=llm, shard_size=5)
+        
+        flashcards = generator.generate_flashcards(self.content, num_cards=20)
+        
+        prompts = [messages[1]['content'] for messages in llm.calls]
+        self.assertEqual(len(prompts), 4)
+        self.assertTrue(all('Create 5 effective study flashcards' in prompt for prompt in prompts))
+        for i in range(8):
+            self.assertEqual(sum(f'Paragraph {i} ' in prompt for prompt in prompts), 1)
+        self.assertEqual([card['front'] for card in flashcards], ['What is a cell?', 'Define mitosis'])
+    
+    def test_quiz_shards_match_async(self):
+        """Test sharded quizzes merge the same way on both entry points"""
+        llm = StubLLM({'questions': [{'question': 'Q1', 'points': 2}, {'question': 'Q2'}]})
+        generator = QuizGenerator(api_key='test', llm=llm, shard_size=5)
+        
+        sync_quiz = generator.generate_quiz(self.content, num_questions=15)
+        async_quiz = asyncio.run(generator.agenerate_quiz(self.content, num_questions=15))
+        
+        self.assertEqual(len(llm.calls), 6)
+        self.assertEqual(sync_quiz, async_quiz)
+        self.assertEqual(sync_quiz['num_questions'], 2)
+        self.assertEqual(sync_quiz['total_points'], 3)
+        self.assertTrue(sync_quiz['complete'])
+    
+    def test_failed_shard_marks_result_incomplete(self):
+        """Test a failed shard keeps the other shards but reports the result incomplete"""
+        class FlakyLLM(StubLLM):
+            def complete_json(self, model, messages, temperature=0.7, call_type='default'):
+                if 'Paragraph 0 ' in messages[1]['content']:
+                    raise RuntimeError("API down")
+                return super().complete_json(model, messages, temperature, call_type)
+            
+            async def acomplete_json(self, model, messages, temperature=0.7, call_type='default'):
+                return self.complete_json(model, messages, temperature, call_type)
+        
+        cards = FlashcardGenerator(api_key='test', llm=FlakyLLM({'flashcards': [{'front': 'F', 'back': 'B'}]}),
+                                   shard_size=5)
+        quizzes = QuizGenerator(api_key='test', llm=FlakyLLM({'questions': [{'question': 'Q1'}]}), shard_size=5)
+        
+        flashcard_set = cards.generate_flashcard_set(self.content, num_cards=20)
+        async_set = asyncio.run(cards.agenerate_flashcard_set(self.content, num_cards=20))
+        quiz = quizzes.generate_quiz(self.content, num_questions=15)
+        async_quiz = asyncio.run(quizzes.agenerate_quiz(self.content, num_questions=15))
+        
+        self.assertEqual(flashcard_set, async_set)
+        self.assertFalse(flashcard_set['complete'])
+        self.assertEqual([card['front'] for card in flashcard_set['flashcards']], ['F'])
+        self.assertEqual(quiz, async_quiz)
+        self.assertFalse(quiz['complete'])
+        self.assertEqual(quiz['num_questions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
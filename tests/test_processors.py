@@ -1,8 +1,60 @@
 """Tests for processor modules"""
 import unittest
 import os
+import shutil
 import tempfile
-from src.processors import PDFProcessor, VideoProcessor
+import time
+from unittest import mock
+import PyPDF2
+from src.processors import PDFProcessor, VideoProcessor, pdf_processor
+from src.utils import PersistentCache, TokenBudget
+
+
+def write_pdf(path, pages):
+    """
+    Write a minimal PDF with one text line per entry
+    
+    Args:
+        path: Output path
+        pages: Lines per page; a line may be a (text, font size) pair, or
+               None for a horizontal rule
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    }
+    kids = []
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_id} 0 R")
+        ops = []
+        y = 740
+        for line in lines:
+            if line is None:
+                y -= 8
+                ops.append(f"72 {y:.1f} m 540 {y:.1f} l S")
+                continue
+            text, size = line if isinstance(line, tuple) else (line, 11)
+            y -= size * 1.6
+            escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            ops.append(f"BT /F1 {size} Tf 72 {y:.1f} Td ({escaped}) Tj ET")
+        stream = '\n'.join(ops).encode('latin-1')
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+    
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number in sorted(objects):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(bytes(data))
 
 
 class TestPDFProcessor(unittest.TestCase):
@@ -28,6 +80,33 @@ class TestPDFProcessor(unittest.TestCase):
         for chunk in chunks:
             self.assertLessEqual(len(chunk), 150)  # Allow some overflow
     
+    def test_iter_chunks_offsets_overlap_and_sentences(self):
+        """Test chunks are offsets into the text that end at sentences and overlap by whole sentences"""
+        sentences = [f"Sentence number {i} explains one idea." for i in range(40)]
+        text = ' '.join(sentences[:20]) + '\n\n' + ' '.join(sentences[20:])
+        spans = list(self.processor.iter_chunks(text, chunk_size=200, overlap=60))
+        
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        for (start, end), (next_start, _) in zip(spans, spans[1:]):
+            self.assertLessEqual(end - start, 200)
+            self.assertTrue(text[start:end].endswith('.'))
+            self.assertTrue(text[next_start:].startswith('Sentence'))
+            self.assertLess(next_start, end)
+        
+        chunks = self.processor.chunk_content(text, chunk_size=200)
+        self.assertEqual(''.join(''.join(chunk.split()) for chunk in chunks), ''.join(text.split()))
+    
+    def test_chunk_content_token_mode(self):
+        """Test chunk sizes can be measured in tokens"""
+        budget = TokenBudget('gpt-4')
+        text = "Mitochondria produce energy for the cell. " * 200
+        chunks = self.processor.chunk_content(text, chunk_size=60, count=budget.count)
+        
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(budget.count(chunk) <= 60 for chunk in chunks))
+        self.assertEqual(' '.join(chunk.strip() for chunk in chunks), text.strip())
+    
     def test_extract_headings(self):
         """Test heading extraction"""
         text = """Introduction
@@ -45,6 +124,231 @@ Conclusion.
         self.assertIsInstance(headings, list)
         # Should find some potential headings
         self.assertGreater(len(headings), 0)
+    
+    
+    def test_iter_pages_streams_page_records(self):
+        """Test pages are yielded one at a time, including pages without text"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [['First page'], [], ['Third page']])
+            pages = self.processor.iter_pages(path)
+            
+            first = next(pages)
+            rest = list(pages)
+        
+        self.assertEqual(first, {'page_number': 1, 'text': 'First page', 'tables': [], 'extractor': 'pdfplumber'})
+        self.assertEqual([page['text'] for page in rest], ['', 'Third page'])
+    
+    def test_extract_text_page_offsets(self):
+        """Test page records locate their text in the joined document text"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [['Cells divide.', 'Mitosis (overview)'], [], ['Energy flows.']])
+            content = self.processor.extract_text(path)
+            slim = self.processor.extract_text(path, page_text=False)
+        
+        self.assertEqual(content['text'], 'Cells divide.\nMitosis (overview)\n\nEnergy flows.\n\n')
+        self.assertEqual(content['metadata']['num_pages'], 3)
+        self.assertEqual([page['page_number'] for page in content['pages']], [1, 3])
+        for page in content['pages']:
+            self.assertEqual(content['text'][page['start']:page['end']], page['text'])
+        self.assertEqual(slim['text'], content['text'])
+        self.assertNotIn('text', slim['pages'][0])
+    
+    
+    def test_parallel_extraction_matches_serial(self):
+        """Test extraction across a process pool gives the serial result"""
+        pages = [[f"Page {i} heading", f"Body text of page {i}."] if i % 3 else [] for i in range(1, 12)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, pages)
+            serial = self.processor.extract_text(path)
+            with mock.patch.object(pdf_processor, 'ProcessPoolExecutor',
+                                   wraps=pdf_processor.ProcessPoolExecutor) as pool:
+                parallel = PDFProcessor(max_workers=2, parallel_min_pages=2).extract_text(path)
+        
+        pool.assert_called_once_with(max_workers=2)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(serial['metadata']['num_pages'], 11)
+    
+    
+    def test_tiered_extraction_lays_out_only_pages_that_need_it(self):
+        """Test prose pages take the fast pass and ruled or short pages get layout analysis"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [[prose], [prose, None, None, None, None], ['Short']])
+            content = self.processor.extract_text(path)
+            without_tables = PDFProcessor(extract_tables=False).extract_text(path)
+            layout = PDFProcessor(extractor='layout').extract_text(path)
+        
+        self.assertEqual([page['extractor'] for page in content['pages']], ['pypdf2', 'pdfplumber', 'pdfplumber'])
+        self.assertEqual(without_tables['metadata']['extractors'], {'pypdf2': 2, 'pdfplumber': 1})
+        self.assertEqual(layout['metadata']['extractors'], {'pdfplumber': 3})
+        self.assertEqual(content['pages'][0]['text'], layout['pages'][0]['text'])
+    
+    
+    def test_pages_over_object_budget_fall_back_or_are_skipped(self):
+        """Test pages with too many drawing operators are not laid out"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [[prose], [prose] + [None] * 10, [None] * 10])
+            content = PDFProcessor(max_page_objects=8).extract_text(path)
+        
+        self.assertEqual([page['extractor'] for page in content['pages']], ['pypdf2', 'pypdf2'])
+        self.assertEqual(content['metadata']['over_budget_pages'], [
+            {'page_number': 2, 'reason': 'objects', 'extractor': 'pypdf2'},
+            {'page_number': 3, 'reason': 'objects', 'extractor': 'skipped'}
+        ])
+        self.assertEqual(content['metadata']['skipped_pages'], [3])
+    
+    def test_slow_page_is_killed_and_later_pages_continue(self):
+        """Test a page overrunning its time budget degrades and the next page is still laid out"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        lay_out = pdf_processor._lay_out
+        
+        def slow_lay_out(page, tables):
+            if page.page_number == 2:
+                time.sleep(30)
+            return lay_out(page, tables)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [[prose], [prose], [prose]])
+            processor = PDFProcessor(extractor='layout', page_timeout=1)
+            with mock.patch.object(pdf_processor, '_lay_out', slow_lay_out):
+                started = time.monotonic()
+                content = processor.extract_text(path)
+        
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual([page['extractor'] for page in content['pages']], ['pdfplumber', 'pypdf2', 'pdfplumber'])
+        self.assertEqual(content['metadata']['over_budget_pages'], [
+            {'page_number': 2, 'reason': 'time', 'extractor': 'pypdf2'}
+        ])
+        self.assertEqual(content['metadata']['skipped_pages'], [])
+    
+    def test_cached_pages_skip_extraction(self):
+        """Test a second pass over the same PDF, under another name, comes from the page cache"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [[prose], [prose + ' Chlorophyll absorbs light.'], [prose]])
+            copy = os.path.join(tmp, 'handout.pdf')
+            shutil.copyfile(path, copy)
+            cache = PersistentCache(os.path.join(tmp, 'pages.sqlite'))
+            processor = PDFProcessor(extractor='layout', cache=cache)
+            first = processor.extract_text(path)
+            with mock.patch.object(pdf_processor, '_page_records') as page_records:
+                second = processor.extract_text(copy)
+            page_records.assert_not_called()
+            uncached = PDFProcessor(extractor='fast', cache=cache).extract_text(path)
+        
+        self.assertEqual(second['text'], first['text'])
+        self.assertEqual(second['pages'], first['pages'])
+        self.assertEqual([page['extractor'] for page in uncached['pages']], ['pypdf2'] * 3)
+    
+    def test_outline_from_font_sizes(self):
+        """Test headings are found from font sizes and nested into sections with offsets"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [
+                [('Cell Biology', 20), ('Organelles', 15), prose, prose],
+                [prose, ('Energy', 15), prose],
+                [('Genetics', 20), prose]
+            ])
+            content = self.processor.extract_text(path)
+            outline = self.processor.extract_outline(path)
+        
+        text = content['text']
+        self.assertEqual([section['title'] for section in outline], ['Cell Biology', 'Genetics'])
+        self.assertEqual([child['title'] for child in outline[0]['children']], ['Organelles', 'Energy'])
+        energy = outline[0]['children'][1]
+        self.assertEqual(energy['page_number'], 2)
+        self.assertTrue(text[energy['start']:].startswith('Energy'))
+        self.assertEqual(energy['end'], outline[1]['start'])
+        self.assertEqual(outline[1]['end'], len(text))
+        
+        chunks = self.processor.chunk_sections(text, outline, chunk_size=100)
+        self.assertEqual(chunks[0]['title'], 'Cell Biology')
+        self.assertTrue(all(chunk['end'] - chunk['start'] <= 100 for chunk in chunks))
+        self.assertTrue(all(chunk['text'] == text[chunk['start']:chunk['end']] for chunk in chunks))
+        for section in [outline[1]] + outline[0]['children']:
+            inside = [chunk for chunk in chunks if section['start'] <= chunk['start'] < section['end']]
+            self.assertTrue(inside)
+            self.assertTrue(all(chunk['end'] <= section['end'] for chunk in inside))
+            self.assertTrue(all(chunk['title'] == section['title'] for chunk in inside))
+    
+    def test_strip_boilerplate_removes_running_headers_and_footers(self):
+        """Test lines repeated at the same place on every page are stripped and reported"""
+        topics = ['Membranes', 'Mitochondria', 'Ribosomes', 'Chloroplasts', 'Nucleus']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'slides.pdf')
+            write_pdf(path, [
+                ['BIO 101 Cell Biology - Dr. Smith', topic,
+                 f'The {topic.lower()} matter to the cell in {i} ways.',
+                 f'Page {i} of 5', '(c) 2024 University']
+                for i, topic in enumerate(topics, 1)
+            ])
+            content = self.processor.extract_text(path)
+        stripped = self.processor.strip_boilerplate(content, count=len)
+        
+        text = stripped['text']
+        for boilerplate in ('BIO 101', 'Page 3 of 5', '(c) 2024'):
+            self.assertNotIn(boilerplate, text)
+        for topic in topics:
+            self.assertIn(topic, text)
+        self.assertTrue(all(text[page['start']:page['end']] == page['text'] for page in stripped['pages']))
+        report = stripped['metadata']['boilerplate']
+        self.assertEqual(report['lines'], 15)
+        self.assertEqual(report['chars'], len(content['text']) - len(text))
+        self.assertGreater(report['tokens'], 0)
+    
+    def test_outline_skips_pages_over_object_budget(self):
+        """Test the font pass does not lay out pages over the object budget"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        text_lines = pdf_processor._text_lines
+        laid_out = []
+        
+        def recording_text_lines(page):
+            laid_out.append(page.page_number)
+            return text_lines(page)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.pdf')
+            write_pdf(path, [
+                [('Cell Biology', 20), prose, prose],
+                [('Energy', 20), prose] + [None] * 10,
+                [('Genetics', 20), prose, prose]
+            ])
+            processor = PDFProcessor(max_page_objects=8)
+            pages = list(processor.iter_pages(path))
+            with mock.patch.object(pdf_processor, '_text_lines', recording_text_lines):
+                outline = processor.extract_outline(path, pages)
+        
+        self.assertEqual(laid_out, [1, 3])
+        self.assertEqual([section['title'] for section in outline], ['Cell Biology', 'Genetics'])
+    
+    def test_outline_prefers_bookmarks(self):
+        """Test a PDF's bookmarks give its outline"""
+        prose = 'Photosynthesis converts light energy into chemical energy in plants.'
+        with tempfile.TemporaryDirectory() as tmp:
+            plain = os.path.join(tmp, 'plain.pdf')
+            write_pdf(plain, [[('Big Title', 20), prose], [prose], [prose]])
+            writer = PyPDF2.PdfWriter()
+            writer.append(plain)
+            part = writer.add_outline_item('Part One', 0)
+            writer.add_outline_item('Light Reactions', 1, parent=part)
+            writer.add_outline_item('Part Two', 2)
+            path = os.path.join(tmp, 'notes.pdf')
+            with open(path, 'wb') as f:
+                writer.write(f)
+            outline = self.processor.extract_outline(path)
+        
+        self.assertEqual([(section['title'], section['page_number']) for section in outline],
+                         [('Part One', 1), ('Part Two', 3)])
+        self.assertEqual([child['title'] for child in outline[0]['children']], ['Light Reactions'])
 
 
 class TestVideoProcessor(unittest.TestCase):
@@ -0,0 +1,733 @@
+"""Tests for utility modules"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+from src.utils import ChunkIndex, ContentAnalyzer, LLMClient, PersistentCache, StageScheduler, TokenBudget
+from src.utils.batch import in_current_context
+from src.utils.providers import Completion, FakeProvider, OpenAIProvider, Provider
+from src.utils.rate_limiter import RequestGovernor
+from src.utils.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from src.utils.routing import SLO_WINDOW, ModelRouter, Route
+from src.utils.single_flight import SingleFlight
+
+
+class StubProvider(Provider):
+    """Provider that hands each request to a test function"""
+    
+    def __init__(self, send=None, asend=None, governor=None):
+        super().__init__(governor)
+        self.send = send
+        self.asend = asend
+    
+    def complete(self, request, call_type='default'):
+        return self.send(request)
+    
+    async def acomplete(self, request, call_type='default'):
+        return await self.asend(request)
+
+
+class TestStageScheduler(unittest.TestCase):
+    """Test dependency-aware stage scheduling"""
+    
+    def test_dependencies_receive_results(self):
+        """Test stages run after their dependencies and receive their results"""
+        scheduler = StageScheduler(max_workers=2)
+        scheduler.add_stage('a', lambda: 2)
+        scheduler.add_stage('b', lambda a: a * 3, depends_on=['a'])
+        
+        results = scheduler.run()
+        
+        self.assertEqual(results, {'a': 2, 'b': 6})
+    
+    def test_stages_added_while_running(self):
+        """Test a stage can register further stages"""
+        scheduler = StageScheduler(max_workers=2)
+        
+        def plan():
+            for i in range(3):
+                scheduler.add_stage(f'child_{i}', lambda i=i: i)
+            return 'planned'
+        
+        scheduler.add_stage('plan', plan)
+        results = scheduler.run()
+        
+        self.assertEqual(results['plan'], 'planned')
+        self.assertEqual([results[f'child_{i}'] for i in range(3)], [0, 1, 2])
+    
+    def test_respects_parallelism_limit(self):
+        """Test no more than max_workers stages run at once"""
+        scheduler = StageScheduler(max_workers=2)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+        
+        def stage():
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+        
+        for i in range(6):
+            scheduler.add_stage(f'stage_{i}', stage)
+        scheduler.run()
+        
+        self.assertEqual(state['peak'], 2)
+    
+    def test_error_propagates(self):
+        """Test a failing stage raises and skips its dependents"""
+        scheduler = StageScheduler()
+        ran = []
+        
+        def fail():
+            raise RuntimeError("boom")
+        
+        scheduler.add_stage('fail', fail)
+        scheduler.add_stage('after', lambda _: ran.append(True), depends_on=['fail'])
+        
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+        self.assertEqual(ran, [])
+    
+    def test_unresolved_dependency(self):
+        """Test a missing dependency is reported"""
+        scheduler = StageScheduler()
+        scheduler.add_stage('orphan', lambda missing: None, depends_on=['missing'])
+        
+        with self.assertRaises(ValueError):
+            scheduler.run()
+
+
+
+class TestPersistentCache(unittest.TestCase):
+    """Test the two-tier persistent cache"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.sqlite')
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_round_trip_and_counters(self):
+        """Test values persist across instances and hits/misses are counted"""
+        cache = PersistentCache(self.path)
+        self.assertIsNone(cache.get('k'))
+        cache.set('k', 'value')
+        self.assertEqual(cache.get('k'), 'value')
+        
+        reopened = PersistentCache(self.path)
+        self.assertEqual(reopened.get('k'), 'value')
+        
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+        self.assertEqual(reopened.stats()['disk_hits'], 1)
+    
+    def test_ttl_expiry(self):
+        """Test entries older than the TTL are misses"""
+        cache = PersistentCache(self.path, ttl_seconds=60)
+        cache.set('k', 'value')
+        
+        with mock.patch('src.utils.cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(cache.get('k'))
+    
+    def test_size_eviction(self):
+        """Test least recently used entries are evicted past max_bytes"""
+        cache = PersistentCache(self.path, max_bytes=25)
+        cache.set('a', 'x' * 10)
+        time.sleep(0.01)
+        cache.set('b', 'y' * 10)
+        time.sleep(0.01)
+        cache.set('c', 'z' * 10)
+        
+        self.assertIsNone(PersistentCache(self.path).get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class TestLLMClientCache(unittest.TestCase):
+    """Test completion caching in LLMClient"""
+    
+    def test_cached_completion_skips_api(self):
+        """Test a repeated request is served from the cache"""
+        with tempfile.TemporaryDirectory() as tmp:
+            fake = FakeProvider(respond=lambda request: '{"answer": 42}')
+            llm = LLMClient('test-key', cache=PersistentCache(os.path.join(tmp, 'c.sqlite')),
+                            providers={'openai': fake})
+            messages = [{"role": "user", "content": "question"}]
+            
+            first = llm.complete_json('gpt-4', messages)
+            second = llm.complete_json('gpt-4', messages)
+            llm.complete_json('gpt-4', messages, temperature=0.2)
+            
+            self.assertEqual(first, {'answer': 42})
+            self.assertEqual(second, first)
+            self.assertEqual(len(fake.requests), 2)
+    
+    def test_cached_prompt_tokens_are_reported(self):
+        """Test provider prompt-cache hits are tallied per call type"""
+        llm = LLMClient('test-key')
+        client = mock.Mock()
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{}'))],
+            usage=SimpleNamespace(prompt_tokens=1500, total_tokens=1600,
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+        )
+        create = client.chat.completions.with_raw_response.create
+        create.return_value = mock.Mock(headers={}, parse=mock.Mock(return_value=response))
+        
+        with mock.patch.object(OpenAIProvider, 'client', new_callable=mock.PropertyMock,
+                               return_value=client):
+            llm.complete_json('gpt-4', [{"role": "user", "content": "a"}], call_type='quiz')
+            llm.complete_json('gpt-4', [{"role": "user", "content": "b"}], call_type='quiz')
+        
+        self.assertEqual(llm.usage(), {'quiz': {'calls': 2, 'prompt_tokens': 3000, 'cached_tokens': 2048}})
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test coalescing of identical in-flight calls"""
+    
+    def test_concurrent_identical_requests_share_one_call(self):
+        """Test identical in-flight requests from several threads make one API call"""
+        release = threading.Event()
+        calls = []
+        
+        def send(request):
+            calls.append(request['model'])
+            release.wait(5)
+            return Completion('{"answer": 42}'), {}, None
+        
+        llm = LLMClient('test-key', providers={'openai': StubProvider(send)})
+        messages = [{"role": "user", "content": "question"}]
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(llm.complete_json('gpt-4', messages)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        while llm.single_flight.stats()['shared'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'answer': 42}] * 4)
+        self.assertIsNot(results[0], results[1])
+    
+    def test_shared_call_failure_reaches_every_caller(self):
+        """Test an error in a shared call is raised to all waiting callers"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+        
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError("boom")
+        
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+        
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flight.stats()['shared'] < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+    
+    def test_cancelled_follower_leaves_shared_call_intact(self):
+        """Test cancelling one async follower does not cancel the call for the leader and other followers"""
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.1)
+            return 42
+        
+        async def run():
+            leader = asyncio.ensure_future(flight.ado('key', work))
+            await asyncio.sleep(0.01)
+            followers = [asyncio.ensure_future(flight.ado('key', work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            followers[0].cancel()
+            return await asyncio.gather(leader, *followers, return_exceptions=True)
+        
+        leader, cancelled, follower = asyncio.run(run())
+        
+        self.assertEqual(leader, 42)
+        self.assertIsInstance(cancelled, asyncio.CancelledError)
+        self.assertEqual(follower, 42)
+
+
+class Throttled(Exception):
+    """API error stand-in carrying a status code and response headers"""
+    
+    def __init__(self, status_code=429, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class TestRequestGovernor(unittest.TestCase):
+    """Test rate-limit-aware admission and retries"""
+    
+    def test_retries_throttled_requests_and_shrinks_concurrency(self):
+        """Test a 429 is retried after retry-after and halves concurrency"""
+        governor = RequestGovernor(max_concurrency=8)
+        attempts = []
+        
+        def send():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise Throttled(headers={'retry-after-ms': '10'})
+            return 'ok', {}, 10
+        
+        self.assertEqual(governor.call(send, estimated_tokens=100), 'ok')
+        
+        stats = governor.stats()
+        self.assertEqual(len(attempts), 3)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.01)
+        self.assertEqual(stats['throttled'], 2)
+        self.assertLess(stats['concurrency'], 8)
+    
+    def test_final_errors_are_not_retried(self):
+        """Test non-retryable errors and exhausted retries propagate"""
+        governor = RequestGovernor(max_retries=1, base_delay=0.001)
+        bad_request = mock.Mock(side_effect=Throttled(status_code=400))
+        unavailable = mock.Mock(side_effect=Throttled(status_code=503))
+        
+        with self.assertRaises(Throttled):
+            governor.call(bad_request)
+        with self.assertRaises(Throttled):
+            governor.call(unavailable)
+        
+        self.assertEqual(bad_request.call_count, 1)
+        self.assertEqual(unavailable.call_count, 2)
+    
+    def test_learns_quota_from_headers(self):
+        """Test an exhausted quota reported by the server delays the next request"""
+        governor = RequestGovernor()
+        headers = {'x-ratelimit-limit-requests': '60', 'x-ratelimit-remaining-requests': '0'}
+        governor.call(lambda: ('ok', headers, None))
+        
+        self.assertGreater(governor._try_acquire(0), 0)
+    
+    
+    def test_retries_stop_at_deadline(self):
+        """Test a retry that would outlast the deadline is not attempted"""
+        governor = RequestGovernor()
+        send = mock.Mock(side_effect=Throttled(headers={'retry-after-ms': '5000'}))
+        
+        with self.assertRaises(Throttled):
+            governor.call(send, deadline=time.monotonic() + 0.5)
+        
+        self.assertEqual(send.call_count, 1)
+
+
+class TestTailLatency(unittest.TestCase):
+    """Test hedged requests and the circuit breaker"""
+    
+    def test_slow_call_is_hedged(self):
+        """Test a call running past the latency percentile is duplicated and the first answer wins"""
+        attempts = []
+        
+        def send(request):
+            attempts.append(request['model'])
+            if len(attempts) == 1:
+                time.sleep(1)
+                return Completion('{"answer": "slow"}'), {}, None
+            return Completion('{"answer": "fast"}'), {}, None
+        
+        llm = LLMClient('test-key', hedge_percentile=90, providers={'openai': StubProvider(send)})
+        for _ in range(llm.latency.min_samples):
+            llm.latency.record(('module', 'gpt-4'), 0.01)
+        started = time.monotonic()
+        result = llm.complete_json('gpt-4', [{"role": "user", "content": "q"}], call_type='module')
+        
+        self.assertEqual(result, {'answer': 'fast'})
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(llm.stats()['hedge_wins'], 1)
+    
+    def test_cancelled_caller_cancels_primary_during_hedge_delay(self):
+        """Test cancelling an async call before the hedge fires cancels the request"""
+        cancelled = []
+        
+        async def send(request):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(request['model'])
+                raise
+        
+        llm = LLMClient('test-key', hedge_percentile=90, providers={'openai': StubProvider(asend=send)})
+        for _ in range(llm.latency.min_samples):
+            llm.latency.record(('module', 'gpt-4'), 5.0)
+        
+        async def cancel_call():
+            call = asyncio.ensure_future(
+                llm.acomplete_json('gpt-4', [{"role": "user", "content": "q"}], call_type='module')
+            )
+            await asyncio.sleep(0.05)
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+            await asyncio.sleep(0.05)
+            self.assertEqual(cancelled, ['gpt-4'])
+            self.assertEqual(llm.governor._in_flight, 0)
+        
+        asyncio.run(cancel_call())
+    
+    def test_async_hedge_win_releases_the_losing_slot(self):
+        """Test the cancelled losing attempt of an async hedged call frees its concurrency slot"""
+        calls = []
+        
+        async def send(request):
+            calls.append(request)
+            if len(calls) % 2 == 1:
+                await asyncio.sleep(10)
+            return Completion('{"answer": "fast"}'), {}, None
+        
+        llm = LLMClient('test-key', hedge_percentile=90, providers={'openai': StubProvider(asend=send)})
+        for _ in range(llm.latency.min_samples):
+            llm.latency.record(('module', 'gpt-4'), 0.01)
+        
+        async def hedged_calls():
+            for i in range(2):
+                result = await llm.acomplete_json('gpt-4', [{"role": "user", "content": f"q{i}"}],
+                                                  call_type='module')
+                self.assertEqual(result, {'answer': 'fast'})
+            await asyncio.sleep(0.01)
+        
+        asyncio.run(hedged_calls())
+        self.assertEqual(llm.stats()['hedge_wins'], 2)
+        self.assertEqual(llm.governor._in_flight, 0)
+    
+    def test_breaker_opens_after_repeated_failures(self):
+        """Test the circuit fails fast once open and closes after a successful trial"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record_failure()
+        
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        time.sleep(0.06)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        breaker.before_call()
+        self.assertEqual(breaker.state, 'closed')
+
+
+class TestModelRouting(unittest.TestCase):
+    """Test per-call-type model routing"""
+    
+    def test_route_overrides_request_settings(self):
+        """Test a routed call type uses its model, temperature and token limit"""
+        sent = []
+        
+        def respond(request):
+            sent.append((request['model'], request['temperature'], request.get('max_tokens')))
+            return '{}'
+        
+        llm = LLMClient('test-key', routes={'flashcards': Route('gpt-4o-mini', 500, 0.2)},
+                        providers={'openai': FakeProvider(respond)})
+        messages = [{"role": "user", "content": "q"}]
+        llm.complete_json('gpt-4', messages, temperature=0.7, call_type='flashcards')
+        llm.complete_json('gpt-4', messages, temperature=0.7, call_type='module')
+        
+        self.assertEqual(sent, [('gpt-4o-mini', 0.2, 500), ('gpt-4', 0.7, None)])
+    
+    def test_slow_primary_falls_back_with_probes(self):
+        """Test calls move to the fallback over the SLO and still probe the primary"""
+        latency = LatencyTracker(min_samples=1)
+        router = ModelRouter(
+            {'quiz': Route(fallback_model='fast', latency_slo=2.0)}, latency, probe_interval=3
+        )
+        
+        self.assertEqual(router.resolve('quiz', 'big', 0.7)[0], 'big')
+        latency.record(('quiz', 'big'), 5.0)
+        models = [router.resolve('quiz', 'big', 0.7)[0] for _ in range(6)]
+        
+        self.assertEqual(models, ['fast', 'fast', 'big', 'fast', 'fast', 'big'])
+        self.assertEqual(router.stats()['fallbacks'], 4)
+    
+    def test_fallback_ends_after_fast_probes(self):
+        """Test a long slow history does not keep calls on the fallback once probes are fast"""
+        latency = LatencyTracker()
+        router = ModelRouter(
+            {'quiz': Route(fallback_model='fast', latency_slo=2.0)}, latency, probe_interval=10
+        )
+        for _ in range(200):
+            latency.record(('quiz', 'big'), 5.0)
+        
+        calls = 0
+        while router.resolve('quiz', 'big', 0.7)[0] == 'fast':
+            calls += 1
+            self.assertLess(calls, 100)
+        for _ in range(SLO_WINDOW - 1):
+            latency.record(('quiz', 'big'), 0.5)
+            while router.resolve('quiz', 'big', 0.7)[0] == 'fast':
+                calls += 1
+        latency.record(('quiz', 'big'), 0.5)
+        
+        self.assertEqual(router.resolve('quiz', 'big', 0.7)[0], 'big')
+        self.assertLessEqual(calls, SLO_WINDOW * 10)
+
+
+class TestProviders(unittest.TestCase):
+    """Test pluggable completion backends"""
+    
+    def test_fake_provider_runs_offline(self):
+        """Test the fake provider answers deterministically from the source material"""
+        content = "Photosynthesis converts light energy. Chlorophyll absorbs light for photosynthesis."
+        results = []
+        for _ in range(2):
+            fake = FakeProvider()
+            llm = LLMClient('', providers={'fake': fake}, default_provider='fake')
+            results.append(ContentAnalyzer('', llm=llm).analyze_content(content))
+        
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0]['main_topics'][:2], ['Photosynthesis', 'Light'])
+        self.assertEqual(len(fake.requests), 1)
+    
+    def test_route_sends_call_type_to_local_provider(self):
+        """Test a routed call type uses the local endpoint and its own governor"""
+        local = OpenAIProvider('local', base_url='http://localhost:8000/v1',
+                               governor=RequestGovernor(max_concurrency=2), name='local')
+        local.complete = mock.Mock(return_value=(Completion('{"local": true}'), {}, None))
+        fake = FakeProvider(respond=lambda request: '{"local": false}')
+        llm = LLMClient('test-key', routes={'flashcards': Route(provider='local')},
+                        providers={'openai': fake, 'local': local})
+        messages = [{"role": "user", "content": "q"}]
+        
+        self.assertEqual(llm.complete_json('gpt-4', messages, call_type='flashcards'), {'local': True})
+        self.assertEqual(llm.complete_json('gpt-4', messages, call_type='quiz'), {'local': False})
+        self.assertEqual(str(local.client.base_url), 'http://localhost:8000/v1/')
+        self.assertEqual(local.governor.stats()['requests'], 1)
+        self.assertEqual(llm.governor.stats()['requests'], 1)
+    
+    def test_unknown_provider_is_rejected(self):
+        """Test routing to a provider that is not configured raises ValueError"""
+        llm = LLMClient('test-key', routes={'quiz': Route(provider='missing')})
+        
+        with self.assertRaises(ValueError):
+            llm.complete_json('gpt-4', [{"role": "user", "content": "q"}], call_type='quiz')
+    
+    
+    def test_batched_run_answers_in_rounds(self):
+        """Test batch rounds answer deferred calls and failed requests fall back instead of requeuing"""
+        def respond(request):
+            if request['messages'][-1]['content'] == 'bad':
+                raise RuntimeError("model error")
+            return '{"ok": true}'
+        
+        fake = FakeProvider(respond)
+        llm = LLMClient('', providers={'fake': fake}, default_provider='fake')
+        
+        def run():
+            answers = []
+            for prompt in ('good', 'bad'):
+                try:
+                    answers.append(llm.complete_json('gpt-4', [{"role": "user", "content": prompt}]))
+                except Exception as e:
+                    answers.append(str(e))
+            return answers
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            answers = llm.run_batched(run, tmp, poll_interval=0)
+            jobs = sorted(name for name in os.listdir(tmp) if not name.endswith('.output.jsonl'))
+        
+        self.assertEqual(answers, [{'ok': True}, 'model error'])
+        self.assertEqual(jobs, ['round_1_fake.jsonl', 'round_2_fake.jsonl'])
+        self.assertEqual(len(fake.requests), 2)
+        self.assertIsNone(llm.batch)
+    
+    def test_batch_run_only_batches_its_own_call_stack(self):
+        """Test a concurrent interactive call on a shared client is sent, not queued into the batch"""
+        fake = FakeProvider(lambda request: '{"ok": true}')
+        llm = LLMClient('', providers={'fake': fake}, default_provider='fake')
+        interactive = []
+        
+        def ask(prompt):
+            return llm.complete_json('gpt-4', [{"role": "user", "content": prompt}])
+        
+        def run():
+            if not interactive:
+                thread = threading.Thread(target=lambda: interactive.append(ask('interactive')))
+                thread.start()
+                thread.join()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(in_current_context(ask), prompt)
+                           for prompt in ('batched one', 'batched two')]
+            return [future.result() for future in futures]
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            answers = llm.run_batched(run, tmp, poll_interval=0)
+            with open(os.path.join(tmp, 'round_1_fake.jsonl'), encoding='utf-8') as f:
+                queued = [json.loads(line)['body']['messages'][0]['content'] for line in f]
+        
+        self.assertEqual(interactive, [{'ok': True}])
+        self.assertEqual(answers, [{'ok': True}] * 2)
+        self.assertEqual(sorted(queued), ['batched one', 'batched two'])
+
+
+class TestSharedClient(unittest.TestCase):
+    """Test the process-wide OpenAI client"""
+    
+    def test_clients_share_connection_pool(self):
+        """Test LLM clients with the same key and settings share one OpenAI client"""
+        settings = {'timeout': 30.0, 'max_connections': 5}
+        
+        first = LLMClient('shared-key', http_settings=settings)
+        second = LLMClient('shared-key', http_settings=settings)
+        other = LLMClient('other-key', http_settings=settings)
+        
+        self.assertIs(first.provider.client, second.provider.client)
+        self.assertIsNot(first.provider.client, other.provider.client)
+        self.assertIs(first.provider.async_client, first.provider.async_client)
+
+
+
+class TestHierarchicalAnalysis(unittest.TestCase):
+    """Test map-reduce content analysis"""
+    
+    def test_merge_deduplicates_topics_and_concepts(self):
+        """Test partial analyses are merged with deduplication"""
+        partials = [
+            {'main_topics': ['Cell Biology', 'Energy'], 'concepts': {'Cell Biology': ['Mitosis']},
+             'difficulty': 'beginner', 'module_structure': ['Cells']},
+            {'main_topics': ['cell biology', 'Genetics'], 'concepts': {'cell  biology': ['mitosis', 'Meiosis']},
+             'difficulty': 'intermediate', 'module_structure': ['cells', 'Genes']},
+            {'main_topics': ['Genetics'], 'concepts': {}, 'difficulty': 'intermediate',
+             'module_structure': ['Inheritance']},
+        ]
+        
+        merged = ContentAnalyzer.merge_analyses(partials)
+        
+        self.assertEqual(merged['main_topics'], ['Cell Biology', 'Genetics', 'Energy'])
+        self.assertEqual(merged['concepts']['Cell Biology'], ['Mitosis', 'Meiosis'])
+        self.assertEqual(merged['difficulty'], 'intermediate')
+        self.assertEqual(merged['module_structure'], ['Cells', 'Genes', 'Inheritance'])
+    
+    def test_hierarchical_mode_covers_whole_document(self):
+        """Test every chunk of a long document is analyzed"""
+        seen = []
+        
+        class RecordingLLM:
+            def complete_json(self, model, messages, temperature=0.7, call_type='default'):
+                text = messages[1]['content']
+                seen.append(text)
+                return {'main_topics': ['Part %d' % len(seen)], 'concepts': {}, 'module_structure': []}
+        
+        analyzer = ContentAnalyzer('test-key', llm=RecordingLLM(), mode='hierarchical', max_workers=1,
+                                   budget=TokenBudget(max_input_tokens=1000))
+        content = ' '.join(['alpha'] * 1000 + ['omega'] * 1000)
+        
+        analysis = analyzer.analyze_content(content)
+        
+        self.assertGreater(len(seen), 1)
+        self.assertTrue(any('omega' in text for text in seen))
+        self.assertEqual(len(analysis['main_topics']), len(seen))
+
+
+
+class TestChunkIndex(unittest.TestCase):
+    """Test cases for the retrieval index"""
+    
+    def setUp(self):
+        self.index = ChunkIndex([
+            "Photosynthesis converts light energy into chemical energy in chloroplasts.",
+            "Mitochondria release energy through cellular respiration.",
+            "DNA replication copies the genome before cell division.",
+            "Chloroplasts contain chlorophyll which absorbs light."
+        ])
+    
+    def test_search_ranks_relevant_chunks(self):
+        """Test chunks sharing query terms are ranked first"""
+        results = self.index.search("chloroplasts light", k=2)
+        
+        self.assertEqual(sorted(results), [0, 3])
+        self.assertEqual(self.index.search("quantum chromodynamics"), [])
+    
+    def test_context_respects_budget_and_document_order(self):
+        """Test assembled context fits the budget and keeps document order"""
+        context = self.index.context_for("light chlorophyll photosynthesis", max_size=200)
+        
+        self.assertLessEqual(len(context), 200)
+        self.assertTrue(context.startswith("Photosynthesis"))
+        self.assertIn("chlorophyll", context)
+        self.assertNotIn("DNA", context)
+    
+    def test_coverage_spans_document(self):
+        """Test coverage sampling draws from the start and end of the document"""
+        chunks = [f"Section {i} discusses topic{i} in detail." for i in range(40)]
+        index = ChunkIndex(chunks)
+        
+        context = index.coverage(max_size=200)
+        
+        self.assertLessEqual(len(context), 200)
+        sections = [int(line.split()[1]) for line in context.split('\n\n')]
+        self.assertEqual(sections[0], 0)
+        self.assertGreaterEqual(sections[-1], 30)
+
+
+
+class TestTokenBudget(unittest.TestCase):
+    """Test cases for token-aware prompt sizing"""
+    
+    def setUp(self):
+        self.budget = TokenBudget('gpt-4', max_input_tokens=1000, output_reserve_tokens=500)
+    
+    def test_input_capped_by_context_window(self):
+        """Test the output reserve is kept free within the context window"""
+        budget = TokenBudget('gpt-4', max_input_tokens=100000, output_reserve_tokens=2000)
+        
+        self.assertEqual(budget.input_tokens, 8192 - 2000)
+        self.assertLess(budget.content_tokens, budget.input_tokens)
+    
+    def test_fit_truncates_to_content_budget(self):
+        """Test long text is cut to the budget and short text is untouched"""
+        text = ' '.join(f'word{i}' for i in range(5000))
+        
+        excerpt = self.budget.fit(text)
+        
+        self.assertTrue(text.startswith(excerpt))
+        self.assertLessEqual(self.budget.count(excerpt), self.budget.content_tokens)
+        self.assertGreater(self.budget.count(excerpt), self.budget.content_tokens - 5)
+        self.assertEqual(self.budget.fit('short text'), 'short text')
+    
+    def test_split_only_breaks_oversized_texts(self):
+        """Test batch splitting keeps small texts and bounds large ones"""
+        texts = ['small', ' '.join(['long'] * 3000), 'tail']
+        
+        pieces = self.budget.split(texts, max_tokens=100)
+        
+        self.assertEqual(pieces[0], 'small')
+        self.assertEqual(pieces[-1], 'tail')
+        self.assertEqual(''.join(pieces[1:-1]), texts[1])
+        self.assertTrue(all(count <= 100 for count in self.budget.count_many(pieces)))
+
+
+if __name__ == '__main__':
+    unittest.main()
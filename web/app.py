@@ -7,6 +7,7 @@ from flask import Flask, render_template, request, jsonify, send_file, session
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import secrets
+import threading
 
 # Add parent directory to path for imports
 import sys
@@ -66,6 +67,19 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Automator shared by every request, so its pooled OpenAI client and
+# response cache are reused instead of rebuilt per upload
+_automator = None
+_automator_lock = threading.Lock()
+
+def get_automator(config):
+    """Get the shared automator, creating it on first use"""
+    global _automator
+    with _automator_lock:
+        if _automator is None:
+            _automator = StudyMaterialAutomator(config)
+        return _automator
+
 
 # ============================================================================
 # Authentication Routes
@@ -261,7 +275,7 @@ def create_topic():
         if not config.validate():
             return jsonify({'error': 'Server configuration error. Please contact administrator.'}), 500
         
-        automator = StudyMaterialAutomator(config)
+        automator = get_automator(config)
         results = automator.process_materials(
             pdf_path=pdf_path,
             video_source=video_url if video_url else None,
@@ -327,6 +341,86 @@ def get_topic(topic_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/topics/<int:topic_id>/materials', methods=['POST'])
+@jwt_required
+def update_topic_materials(topic_id):
+    """Add or revise source material for a topic, regenerating only what changed"""
+    try:
+        user_id = get_current_user()
+        topic = Topic.query.filter_by(id=topic_id, user_id=user_id).first()
+        if not topic:
+            return jsonify({'error': 'Topic not found'}), 404
+        
+        pdf_file = request.files.get('pdf_file')
+        video_url = request.form.get('video_url', '').strip()
+        
+        if not (pdf_file and pdf_file.filename) and not video_url:
+            return jsonify({'error': 'Please provide either a PDF file or a video URL'}), 400
+        
+        if video_url:
+            from urllib.parse import urlparse
+            try:
+                parsed = urlparse(video_url)
+                if not parsed.scheme in ['http', 'https']:
+                    return jsonify({'error': 'Invalid video URL. Only HTTP/HTTPS URLs are allowed.'}), 400
+            except Exception:
+                return jsonify({'error': 'Invalid video URL format'}), 400
+        
+        pdf_path = None
+        pdf_filename = None
+        if pdf_file and pdf_file.filename:
+            if not allowed_file(pdf_file.filename):
+                return jsonify({'error': 'Only PDF files are allowed'}), 400
+            
+            pdf_filename = secure_filename(pdf_file.filename)
+            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{user_id}_{pdf_filename}")
+            pdf_file.save(pdf_path)
+        
+        config = Config()
+        if not config.validate():
+            return jsonify({'error': 'Server configuration error. Please contact administrator.'}), 500
+        
+        automator = get_automator(config)
+        results = automator.update_materials(
+            topic.output_directory,
+            pdf_path=pdf_path,
+            video_source=video_url if video_url else None
+        )
+        
+        summary_path = os.path.join(topic.output_directory, 'summary.json')
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        
+        # Update the topic record in place
+        if pdf_filename and not topic.pdf_filename:
+            topic.pdf_filename = pdf_filename
+        if video_url:
+            topic.video_url = video_url
+        topic.num_modules = len(results['modules'])
+        topic.num_diagrams = len(results['diagrams'])
+        topic.num_flashcards = len(results['flashcards'])
+        topic.num_quizzes = len(results['quizzes'])
+        topic.topics_covered = summary.get('analysis', {}).get('main_topics', [])
+        db.session.commit()
+        
+        return jsonify({
+            'topic': topic.to_dict(),
+            'summary': summary,
+            'files': {
+                'modules': [os.path.basename(p) for p in results['modules']],
+                'diagrams': [os.path.basename(p) for p in results['diagrams']],
+                'flashcards': [os.path.basename(p) for p in results['flashcards']],
+                'quizzes': [os.path.basename(p) for p in results['quizzes']]
+            }
+        })
+    
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================================================
 # Progress Tracking Routes
 # ============================================================================